@@ -0,0 +1,255 @@
+# ann_index.py
+"""
+Approximate nearest-neighbour index types, chosen by corpus size and memory budget.
+
+    flat      exact scan; any storage format (vector_compression)
+    hnsw      graph index: fast and accurate, but holds full vectors plus links
+    ivf_flat  inverted lists over k-means cells; each query scans `nprobe` cells
+    ivf_pq    IVF with product-quantized codes: a few bytes per vector
+
+HNSW and IVF-Flat can store float16 or int8 vectors too (HNSW..,SQ and
+IVF..,SQ). IVF indexes train their coarse quantizer (and PQ codebooks) on an
+evenly spaced sample.
+
+choose_index_spec picks a type from the vector count and the memory budget.
+Small corpora stay exact. Below a few million vectors, HNSW is used while it
+fits in memory, then IVF-Flat. Past the budget, IVF-PQ is used with as many
+bytes per code as still fit.
+
+build_ann_index also returns a build report with:
+- build, train and add times;
+- index size;
+- recall@10 against exact full-width search, with sampled rows as queries;
+- a sweep of nprobe (IVF) or efSearch (HNSW) showing recall and latency at
+  each setting.
+With `target_recall`, the smallest setting that reaches it is kept on the index.
+IVF-PQ may never reach it; then the smallest setting with the best recall is kept.
+"""
+import math
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from vector_compression import (METRICS, TRAIN_SAMPLE, ADD_BLOCK, add_vectors, bytes_per_vector, index_nbytes,
+                                needs_training, new_index, recall_against_exact, reduce_dimensions, search, unwrap,
+                                with_ids)
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+DEFAULT_MEMORY_BUDGET = 2 << 30   # bytes per index
+EXACT_LIMIT = 50_000              # vectors below which auto keeps exact search
+HNSW_LIMIT = 5_000_000            # vectors above which auto prefers IVF (HNSW builds get slow)
+NPROBE_SWEEP = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+EF_SEARCH_SWEEP = (16, 32, 64, 128, 256, 512)
+PQ_SUBQUANTIZERS = (96, 64, 48, 32, 24, 16, 12, 8, 4)
+
+_SQ_CODES = {"float32": "Flat", "float16": "SQfp16", "int8": "SQ8"}
+
+
+class IndexSpec(NamedTuple):
+    index_type: str = "flat"      # one of INDEX_TYPES, or "auto"
+    storage: str = "float32"      # flat/hnsw/ivf_flat vector format (ivf_pq always stores PQ codes)
+    nlist: int = 0                # IVF cells (0: 4·sqrt(n))
+    pq_m: int = 0                 # PQ sub-quantizers (0: from the memory budget)
+    pq_bits: int = 8              # bits per PQ sub-code
+    hnsw_m: int = 32              # HNSW links per node
+    ef_construction: int = 40
+    nprobe: int = 16              # IVF cells scanned per query
+    ef_search: int = 64           # HNSW candidate list per query
+    memory_budget: int = DEFAULT_MEMORY_BUDGET
+    target_recall: Optional[float] = None
+
+
+def hnsw_bytes(n: int, dimensions: int, storage: str = "float32", m: int = 32) -> float:
+    """Approximate HNSW size: the vectors plus ~2·M int32 links per vector on the base layer."""
+    return n * (bytes_per_vector(dimensions, storage) + 2 * m * 4 * 1.1)
+
+
+def choose_index_spec(n: int, dimensions: int, spec: IndexSpec = IndexSpec(index_type="auto")) -> IndexSpec:
+    """Resolve "auto" (and unset IVF/PQ sizes) for `n` vectors of `dimensions` within spec.memory_budget."""
+    budget = spec.memory_budget
+    index_type = spec.index_type
+    if index_type == "auto":
+        flat = n * bytes_per_vector(dimensions, spec.storage)
+        if n <= EXACT_LIMIT and flat <= budget:
+            index_type = "flat"
+        elif n <= HNSW_LIMIT and hnsw_bytes(n, dimensions, spec.storage, spec.hnsw_m) <= budget:
+            index_type = "hnsw"
+        elif flat <= budget:
+            index_type = "ivf_flat"
+        else:
+            index_type = "ivf_pq"
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected auto or one of {', '.join(INDEX_TYPES)}")
+    if index_type != "flat" and spec.storage == "binary":
+        raise ValueError("Binary storage is only available with the flat index type")
+
+    nlist = spec.nlist
+    if index_type.startswith("ivf"):
+        nlist = nlist or int(4 * math.sqrt(n))
+        nlist = max(1, min(nlist, n // 39))  # k-means wants ~39 training points per cell
+
+    pq_m, pq_bits = spec.pq_m, spec.pq_bits
+    if index_type == "ivf_pq":
+        pq_bits = max(1, min(pq_bits, int(math.log2(max(n // 39, 2)))))  # 2^bits centroids need training data
+        if not pq_m:
+            # Most sub-quantizers whose codes (plus the 8-byte id) still fit the budget
+            fitting = [m for m in PQ_SUBQUANTIZERS
+                       if dimensions % m == 0 and n * (m * pq_bits / 8 + 8) <= budget]
+            divisors = [m for m in PQ_SUBQUANTIZERS if dimensions % m == 0] or [1]
+            pq_m = fitting[0] if fitting else divisors[-1]
+        elif dimensions % pq_m:
+            raise ValueError(f"PQ sub-quantizers ({pq_m}) must divide the dimensions ({dimensions})")
+    return spec._replace(index_type=index_type, nlist=nlist, pq_m=pq_m, pq_bits=pq_bits)
+
+
+def factory_string(spec: IndexSpec) -> str:
+    """faiss.index_factory description of a resolved spec."""
+    if spec.index_type == "hnsw":
+        return f"HNSW{spec.hnsw_m},{_SQ_CODES[spec.storage]}"
+    if spec.index_type == "ivf_flat":
+        return f"IVF{spec.nlist},{_SQ_CODES[spec.storage]}"
+    if spec.index_type == "ivf_pq":
+        return f"IVF{spec.nlist},PQ{spec.pq_m}x{spec.pq_bits}"
+    return _SQ_CODES.get(spec.storage, "binary")
+
+
+def set_search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Apply query-time settings where the index has them (ignored otherwise)."""
+    index = unwrap(index)
+    if nprobe and isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(nprobe, index.nlist)
+    if ef_search and isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+
+
+def search_params(index) -> Dict[str, int]:
+    index = unwrap(index)
+    if isinstance(index, faiss.IndexIVF):
+        return {"nprobe": int(index.nprobe)}
+    if isinstance(index, faiss.IndexHNSW):
+        return {"ef_search": int(index.hnsw.efSearch)}
+    return {}
+
+
+def index_type(index) -> str:
+    index = unwrap(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def build_ann_index(vectors: np.ndarray, spec: IndexSpec = IndexSpec(), metric: str = "l2",
+                    dimensions: Optional[int] = None, report_queries: int = 200,
+                    ids: Optional[np.ndarray] = None) -> Tuple[object, Dict]:
+    """
+    Build the index `spec` describes ("auto" allowed) over `vectors` (optionally reduced to
+    `dimensions`; may be memory-mapped). With `ids` (int64, one per row) the index returns
+    those instead of row numbers. Returns (index, build report).
+    """
+    n = len(vectors)
+    width = dimensions or vectors.shape[1]
+    spec = choose_index_spec(n, width, spec)
+    start = time.perf_counter()
+    train_seconds = 0.0
+    index = new_ann_index(spec, width, metric)
+    if ids is not None:
+        index = with_ids(index)
+    if not index.is_trained:
+        step = time.perf_counter()
+        sample = vectors[::max(1, n // TRAIN_SAMPLE)][:TRAIN_SAMPLE]
+        index.train(np.ascontiguousarray(reduce_dimensions(sample, dimensions)))
+        train_seconds = time.perf_counter() - step
+    for block in range(0, n, ADD_BLOCK):
+        add_vectors(index, reduce_dimensions(vectors[block:block + ADD_BLOCK], dimensions),
+                    None if ids is None else ids[block:block + ADD_BLOCK])
+    report = build_report(index, vectors, spec, metric, dimensions, report_queries, ids,
+                          time.perf_counter() - start, train_seconds)
+    return index, report
+
+
+def new_ann_index(spec: IndexSpec, dimensions: int, metric: str = "l2"):
+    """Empty index for a resolved `spec` (see choose_index_spec); IVF and int8 ones need training."""
+    if spec.index_type == "flat":
+        return new_index(dimensions, spec.storage, metric)
+    index = faiss.index_factory(dimensions, factory_string(spec), METRICS[metric])
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efConstruction = spec.ef_construction
+    return index
+
+
+def adds_incrementally(spec: IndexSpec) -> bool:
+    """True if a resolved spec's index takes vectors as they arrive, with no training pass first."""
+    return spec.index_type in ("flat", "hnsw") and not needs_training(spec.storage)
+
+
+def build_report(index, vectors: np.ndarray, spec: IndexSpec, metric: str = "l2",
+                 dimensions: Optional[int] = None, report_queries: int = 200,
+                 ids: Optional[np.ndarray] = None, build_seconds: float = 0.0,
+                 train_seconds: float = 0.0) -> Dict:
+    """
+    Build report of an index holding `vectors`, with its search-parameter sweep. Applies
+    the spec's search settings (and target_recall) to the index: the last step of a build.
+    """
+    set_search_params(index, spec.nprobe, spec.ef_search)
+    n = len(vectors)
+    width = dimensions or vectors.shape[1]
+    report = {
+        "index_type": spec.index_type,
+        "factory": factory_string(spec),
+        "metric": metric,
+        "vectors": n,
+        "dimensions": width,
+        "build_s": round(build_seconds, 3),
+        "train_s": round(train_seconds, 3),
+        "add_s": round(build_seconds - train_seconds, 3),
+        "size_MB": round(index_nbytes(index) / 1e6, 3),
+        "spec": spec._asdict(),
+    }
+    if n > 1 and report_queries:
+        report["sweep"] = sweep_search_params(index, vectors, dimensions, report_queries, ids)
+        if spec.target_recall and report["sweep"]:
+            # Out of reach (e.g. PQ's own loss): the cheapest setting at the best recall there is
+            target = min(spec.target_recall, max(row["recall@10"] for row in report["sweep"]))
+            chosen = next(row for row in report["sweep"] if row["recall@10"] >= target)
+            set_search_params(index, chosen.get("nprobe"), chosen.get("ef_search"))
+        report["search_params"] = search_params(index)
+        recall, latency = _measure(index, vectors, dimensions, report_queries, ids)
+        report["recall@10"] = round(recall, 4)
+        report["query_ms"] = round(latency, 3)
+    return report
+
+
+def sweep_search_params(index, vectors: np.ndarray, dimensions: Optional[int] = None,
+                        queries: int = 200, ids: Optional[np.ndarray] = None) -> List[Dict]:
+    """Recall@10 and ms/query at each nprobe (IVF) or efSearch (HNSW) setting; [] for flat indexes."""
+    current = search_params(index)
+    inner = unwrap(index)
+    if isinstance(inner, faiss.IndexIVF):
+        settings = [{"nprobe": p} for p in NPROBE_SWEEP if p <= inner.nlist]
+    elif isinstance(inner, faiss.IndexHNSW):
+        settings = [{"ef_search": e} for e in EF_SEARCH_SWEEP]
+    else:
+        return []
+    rows = []
+    for setting in settings:
+        set_search_params(index, **setting)
+        recall, latency = _measure(index, vectors, dimensions, queries, ids)
+        rows.append(dict(setting, **{"recall@10": round(recall, 4), "query_ms": round(latency, 3)}))
+    set_search_params(index, **current)
+    return rows
+
+
+def _measure(index, vectors, dimensions, queries, ids=None) -> Tuple[float, float]:
+    """(recall@10 against exact full-width search, mean ms per single-query search)."""
+    recall, sample = recall_against_exact(index, vectors, dimensions, k=10, queries=queries, ids=ids)
+    probe = reduce_dimensions(vectors[np.sort(sample[:50])], dimensions)
+    start = time.perf_counter()
+    for row in probe:
+        search(index, row, 10)
+    return recall, (time.perf_counter() - start) * 1000 / max(len(probe), 1)
@@ -0,0 +1,84 @@
+# bench_chunking.py
+"""
+Scaling benchmark for HierarchicalChunker.
+
+Generates synthetic markdown documents from 1 KB up to 100 MB and times
+`chunk_document` for each strategy. With linear-time chunking the
+"us/chunk" and "s/MB" columns should stay roughly flat as size grows.
+
+Usage:
+    python bench_chunking.py                      # 1 KB .. 100 MB
+    python bench_chunking.py --max-mb 10          # smaller sweep
+    python bench_chunking.py --strategy hierarchical
+"""
+import argparse
+import random
+import time
+
+from chunking import HierarchicalChunker
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000]
+STRATEGIES = ["hierarchical", "hierarchical_overlap"]
+
+WORDS = ("policy employee benefits leave schedule manager review process request "
+         "approval security access training payroll holiday remote office").split()
+
+
+def make_document(target_bytes: int, seed: int = 0) -> str:
+    """Build a markdown document of roughly `target_bytes` characters."""
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    section = 0
+    while size < target_bytes:
+        header = f"{'#' * rng.randint(1, 3)} Section {section}\n"
+        parts.append(header)
+        size += len(header)
+        for _ in range(rng.randint(1, 4)):
+            sentences = []
+            for _ in range(rng.randint(2, 6)):
+                words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 16)))
+                sentences.append(words.capitalize() + rng.choice(".!?"))
+            para = " ".join(sentences) + "\n\n"
+            parts.append(para)
+            size += len(para)
+        section += 1
+    return "".join(parts)
+
+
+def run(strategy: str, content: str):
+    chunker = HierarchicalChunker(doc_id="bench", title="Benchmark", strategy=strategy)
+    start = time.perf_counter()
+    chunks = chunker.chunk_document(content)
+    return time.perf_counter() - start, len(chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunking scaling benchmark")
+    parser.add_argument("--max-mb", type=float, default=100.0, help="Largest input size in MB")
+    parser.add_argument("--strategy", choices=STRATEGIES, default=None, help="Benchmark a single strategy")
+    args = parser.parse_args()
+
+    strategies = [args.strategy] if args.strategy else STRATEGIES
+    sizes = [s for s in SIZES if s <= args.max_mb * 1_000_000]
+
+    print(f"{'strategy':<22}{'size':>10}{'chunks':>12}{'seconds':>10}{'s/MB':>8}{'us/chunk':>10}")
+    for strategy in strategies:
+        for size in sizes:
+            content = make_document(size)
+            seconds, n_chunks = run(strategy, content)
+            mb = len(content) / 1_000_000
+            print(f"{strategy:<22}{_fmt_size(len(content)):>10}{n_chunks:>12}{seconds:>10.3f}"
+                  f"{seconds / mb:>8.2f}{seconds / n_chunks * 1e6:>10.1f}")
+
+
+def _fmt_size(n: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n < 1000:
+            return f"{n:.0f}{unit}"
+        n /= 1000
+    return f"{n:.0f}GB"
+
+
+if __name__ == "__main__":
+    main()
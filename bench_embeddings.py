@@ -0,0 +1,58 @@
+# bench_embeddings.py
+"""
+Throughput benchmark for local embedding backends, in chunks/s.
+
+Chunks a synthetic document (see bench_chunking.make_document) and encodes
+every retrievable chunk with each batch size, with and without length-sorted
+bucketing. Runs fully offline with the hashing embedder; the
+sentence-transformers backend needs the model available locally.
+
+Usage:
+    python bench_embeddings.py                                   # hashing embedder
+    python bench_embeddings.py --backend sentence-transformers --threads 4
+    python bench_embeddings.py --backend sentence-transformers --model all-mpnet-base-v2 --float16
+"""
+import argparse
+import time
+
+from bench_chunking import make_document
+from chunking import HierarchicalChunker
+from embedding_backends import HashingEmbedder, SentenceTransformerBackend
+
+BATCH_SIZES = [16, 64, 256]
+
+
+def make_backend(args):
+    if args.backend == "hashing":
+        return HashingEmbedder(float16=args.float16)
+    return SentenceTransformerBackend(args.model, threads=args.threads, float16=args.float16)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local embedding throughput benchmark")
+    parser.add_argument("--backend", choices=["hashing", "sentence-transformers"], default="hashing")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="sentence-transformers model name")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--float16", action="store_true", help="float16 output")
+    parser.add_argument("--kb", type=int, default=200, help="Size of the synthetic document in KB")
+    args = parser.parse_args()
+
+    chunks = HierarchicalChunker(doc_id="bench", strategy="hierarchical_overlap").chunk_document(
+        make_document(args.kb * 1000))
+    texts = [c.content for c in chunks if c.metadata.get("retrievable", True)]
+
+    backend = make_backend(args)
+    print(f"{len(texts)} chunks, backend={backend.name}")
+    print(f"{'batch':>6}{'sorted':>8}{'seconds':>10}{'chunks/s':>12}")
+    for batch_size in BATCH_SIZES:
+        for sort_by_length in (False, True):
+            backend.batch_size = batch_size
+            backend.sort_by_length = sort_by_length
+            start = time.perf_counter()
+            backend.encode(texts)
+            seconds = time.perf_counter() - start
+            print(f"{batch_size:>6}{str(sort_by_length):>8}{seconds:>10.3f}{len(texts) / seconds:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# bench_shards.py
+"""
+Query throughput and tail latency of the sharded store, by shard count.
+
+Writes synthetic per-document indexes (random unit vectors) to a scratch
+directory. For each shard count it builds a sharded store, starts its shard
+processes, and times top-k searches from `--clients` concurrent
+coordinators. The 0-shard row is the single in-process corpus index, for
+reference. Shards only pay off with the cores (or machines) to run them on:
+on one core the round trip makes them slower.
+
+Usage:
+    python bench_shards.py                                    # 200 docs x 1000 chunks x 256 dims
+    python bench_shards.py --docs 1000 --rows 2000 --shards 1 2 4 8 16 --clients 4
+    python bench_shards.py --index-type hnsw --dims 384
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from ann_index import INDEX_TYPES, IndexSpec
+from corpus_index import CorpusIndex, build_corpus
+from sharded_index import ShardedIndex, build_shards
+from vector_store import save_index
+
+
+def make_store(index_dir: str, docs: int, rows: int, dims: int, seed: int = 0) -> np.ndarray:
+    """Per-document flat indexes of random unit vectors; returns query vectors near stored rows."""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for d in range(docs):
+        vectors = rng.standard_normal((rows, dims)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        chunks = [{"id": f"doc{d}_chunk{i}", "content": f"chunk {i} of doc {d}", "level": "paragraph"}
+                  for i in range(rows)]
+        save_index({"doc_id": f"doc{d}", "doc_name": f"doc{d}.md"}, chunks, vectors, "bench", index_dir)
+        queries.append(vectors[0])
+    queries = np.array(queries)
+    return queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+
+
+def run(search, queries: np.ndarray, clients: int, k: int):
+    """(queries/s, p50 ms, p99 ms) of `search` calls, `clients` at a time; search(client, vector, k)."""
+    latencies = [[] for _ in range(clients)]
+
+    def worker(client: int):
+        for vector in queries[client::clients]:
+            start = time.perf_counter()
+            search(client, vector, k)
+            latencies[client].append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    flat = np.concatenate([np.array(l) for l in latencies])
+    p50, p99 = np.percentile(flat, [50, 99])
+    return len(flat) / seconds, p50, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded store QPS and p99 latency by shard count")
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=1000, help="Chunks per document")
+    parser.add_argument("--dims", type=int, default=256)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=1, help="Concurrent coordinators")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench_shards_")
+    try:
+        index_dir = os.path.join(scratch, "vector_store")
+        start = time.perf_counter()
+        queries = make_store(index_dir, args.docs, args.rows, args.dims)
+        queries = np.resize(queries, (args.queries, args.dims))
+        print(f"{args.docs} docs x {args.rows} chunks x {args.dims} dims ({args.docs * args.rows:,} vectors) "
+              f"written in {time.perf_counter() - start:.1f}s; {args.index_type}, k={args.k}, "
+              f"{args.clients} client(s), {os.cpu_count()} CPU(s)")
+        print(f"{'shards':>6}{'build_s':>10}{'QPS':>10}{'p50_ms':>10}{'p99_ms':>10}")
+        spec = IndexSpec(index_type=args.index_type)
+
+        start = time.perf_counter()
+        build_corpus(index_dir, spec)
+        build_seconds = time.perf_counter() - start
+        corpus = CorpusIndex(os.path.join(index_dir, "corpus"))
+
+        def corpus_search(client, vector, k):
+            distances, slots = corpus.search(vector, k)
+            corpus.lookup(slots.tolist())
+
+        run(corpus_search, queries[:20], 1, args.k)  # warm-up
+        qps, p50, p99 = run(corpus_search, queries, args.clients, args.k)
+        print(f"{0:>6}{build_seconds:>10.2f}{qps:>10.0f}{p50:>10.2f}{p99:>10.2f}")
+
+        for shards in args.shards:
+            start = time.perf_counter()
+            build_shards(index_dir, shards, spec)
+            build_seconds = time.perf_counter() - start
+            store = ShardedIndex(os.path.join(index_dir, "shards"))
+            # Further coordinators connect to the same shard processes, as remote ones would
+            addresses = [client.address for client in store.clients.values()]
+            coordinators = [store] + [ShardedIndex(os.path.join(index_dir, "shards"), addresses, store.authkey)
+                                      for _ in range(args.clients - 1)]
+            try:
+                run(lambda client, vector, k: coordinators[client].search(vector, k), queries[:20], 1, args.k)
+                qps, p50, p99 = run(lambda client, vector, k: coordinators[client].search(vector, k),
+                                    queries, args.clients, args.k)
+            finally:
+                for coordinator in reversed(coordinators):
+                    coordinator.close()
+            print(f"{shards:>6}{build_seconds:>10.2f}{qps:>10.0f}{p50:>10.2f}{p99:>10.2f}")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# bulk_chunking.py
+"""
+Chunk many documents and save them to processed_docs/, optionally across a process pool.
+
+Workers open, stream-chunk and write each file themselves, so only a small
+summary per document travels back to the caller. Results are yielded as
+workers finish, which lets the UI show live progress and throughput.
+"""
+import json
+import os
+import textwrap
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, Optional
+
+from chunking import HierarchicalChunker
+from chunk_storage import COMPACT_VERSION, compact_chunks
+from context_index import AncestorIndexBuilder
+from incremental_chunking import chunker_config, rechunk_incremental
+
+PROCESSED_DIR = "processed_docs"
+_READ_BLOCK = 1 << 20  # characters of the source file copied into the document chunk at a time
+_DOCUMENT_TEXT = "\0document text\0"  # stands in for the document chunk's text until it is written
+
+
+def chunk_to_dict(chunk):
+    """Convert Chunk object to JSON serializable dict."""
+    return {
+        "id": chunk.id,
+        "content": chunk.content,
+        "level": chunk.level,
+        "parent_id": chunk.parent_id,
+        "children_ids": chunk.children_ids,
+        "metadata": chunk.metadata,
+    }
+
+
+def save_chunks(doc_id, doc_name, strategy, chunks, out_dir: str = PROCESSED_DIR,
+                extra: Optional[Dict] = None, storage: str = "full", source_path: Optional[str] = None) -> int:
+    """
+    Save chunks and metadata to JSON for later embedding.
+    `chunks` may be a generator (e.g. HierarchicalChunker.chunk_stream); each chunk is
+    written as soon as it is produced, in the same layout as json.dump(..., indent=2).
+    `extra` adds document-level fields next to doc_id/doc_name/strategy.
+    `storage="compact"` stores core text and references instead of contextual content
+    (see chunk_storage); read such files back with chunk_storage.load_chunks.
+    An `ancestor_index` for context lookups is written after the chunks (see context_index).
+    A streamed document chunk has no text; with `source_path` (the file that was chunked)
+    its text is copied from there, block by block, as chunk_document would have stored it.
+    Returns the number of chunks written.
+    """
+    header = {
+        "doc_id": doc_id,
+        "doc_name": doc_name,
+        "strategy": strategy,
+        **(extra or {}),
+    }
+    ancestors = AncestorIndexBuilder()
+    records = ancestors.track(chunk_to_dict(c) for c in chunks)
+    if source_path is not None:
+        records = (_with_document_placeholder(record) for record in records)
+    dump_options = {"indent": 2}
+    if storage == "compact":
+        # One record per line; whitespace would otherwise outweigh the deduplicated text
+        header["storage"] = "compact"
+        header["compact_version"] = COMPACT_VERSION
+        records = compact_chunks(records)
+        dump_options = {"separators": (",", ":")}
+    out_path = os.path.join(out_dir, f"{doc_id}.json")
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write("{\n")
+        for key, value in header.items():
+            f.write(f'  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)},\n')
+        f.write('  "chunks": [')
+        count = 0
+        placeholder = json.dumps(_DOCUMENT_TEXT)[1:-1]
+        for record in records:
+            body = textwrap.indent(json.dumps(record, ensure_ascii=False, **dump_options), "    ")
+            f.write(",\n" if count else "\n")
+            if record["level"] == "document" and placeholder in body:
+                before, after = body.split(placeholder)
+                f.write(before)
+                _copy_as_json_string(source_path, f)
+                f.write(after)
+            else:
+                f.write(body)
+            count += 1
+        f.write("\n  ],\n" if count else "],\n")
+        f.write(f'  "ancestor_index": {json.dumps(ancestors.to_dict(), separators=(",", ":"))}\n}}')
+    return count
+
+
+def _with_document_placeholder(record: Dict) -> Dict:
+    if record["level"] == "document" and not record["content"]:
+        record["content"] = _DOCUMENT_TEXT
+    return record
+
+
+def _copy_as_json_string(source_path: str, out):
+    """Write the text of `source_path` JSON-escaped (without quotes), as open() reads it."""
+    with open(source_path, "r", encoding="utf-8") as f:
+        while block := f.read(_READ_BLOCK):
+            out.write(json.dumps(block, ensure_ascii=False)[1:-1])
+
+
+def chunk_file(fpath: str, strategy: str, chunker_options: Optional[Dict] = None,
+               out_dir: str = PROCESSED_DIR, incremental: bool = False,
+               storage: str = "full") -> Dict:
+    """
+    Stream-chunk one file into `out_dir`. Runs inside pool workers, so it only
+    returns a small summary dict; errors are reported in it rather than raised.
+
+    With `incremental`, hierarchical strategies use content-derived IDs and reuse the
+    chunks of unchanged sections from the previous output; the summary then also has
+    `added`, `removed`, `updated` and `unchanged` chunk counts.
+    """
+    fname = os.path.basename(fpath)
+    doc_id = os.path.splitext(fname)[0]
+    result = {"doc_name": fname, "doc_id": doc_id, "bytes": 0, "chunks": 0, "error": None}
+    try:
+        result["bytes"] = os.path.getsize(fpath)
+        if incremental and strategy != "fixed_size":
+            # The whole document's chunks are held at once here: keep them as spans of the text
+            options = {"use_spans": True, **(chunker_options or {})}
+            chunker = HierarchicalChunker(doc_id=doc_id, title=fname, strategy=strategy,
+                                          id_scheme="content", **options)
+            out_path = os.path.join(out_dir, f"{doc_id}.json")
+            previous = load_processed(out_path)
+            with open(fpath, "r", encoding="utf-8") as f:
+                chunks, diff = rechunk_incremental(chunker, f.read(), previous)
+            result["chunks"] = save_chunks(doc_id, fname, strategy, chunks, out_dir,
+                                           extra={"chunker_config": chunker_config(chunker)},
+                                           storage=storage)
+            result.update({key: len(diff[key]) for key in ("added", "removed", "updated", "unchanged")})
+            return result
+
+        chunker = HierarchicalChunker(doc_id=doc_id, title=fname, strategy=strategy,
+                                      **(chunker_options or {}))
+        with open(fpath, "r", encoding="utf-8") as f:
+            result["chunks"] = save_chunks(doc_id, fname, strategy, chunker.chunk_stream(f), out_dir,
+                                           storage=storage, source_path=fpath)
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def load_processed(out_path: str) -> Optional[Dict]:
+    """Previously saved processed_docs JSON, or None if missing or unreadable."""
+    try:
+        with open(out_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def chunk_files(paths: Iterable[str], strategy: str, chunker_options: Optional[Dict] = None,
+                out_dir: str = PROCESSED_DIR, workers: int = 1,
+                incremental: bool = False, storage: str = "full") -> Iterator[Dict]:
+    """
+    Chunk every file in `paths`, yielding each file's summary as soon as it is done.
+    With workers > 1 files are spread over a process pool; completion order is then
+    not input order. Each summary also carries running `docs_per_s` and `mb_per_s`.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = list(paths)
+    start = time.perf_counter()
+    done_docs = 0
+    done_bytes = 0
+
+    def with_throughput(result):
+        nonlocal done_docs, done_bytes
+        done_docs += 1
+        done_bytes += result["bytes"]
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        result["docs_per_s"] = done_docs / elapsed
+        result["mb_per_s"] = done_bytes / 1e6 / elapsed
+        return result
+
+    if workers <= 1:
+        for fpath in paths:
+            yield with_throughput(chunk_file(fpath, strategy, chunker_options, out_dir, incremental, storage))
+        return
+
+    # Largest files first, so a big file picked up last does not leave the pool idle
+    paths.sort(key=_file_size, reverse=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(chunk_file, fpath, strategy, chunker_options, out_dir, incremental, storage)
+                   for fpath in paths]
+        for future in as_completed(futures):
+            yield with_throughput(future.result())
+
+
+def _file_size(fpath: str) -> int:
+    try:
+        return os.path.getsize(fpath)
+    except OSError:
+        return 0
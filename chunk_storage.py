@@ -0,0 +1,356 @@
+# chunk_storage.py
+"""
+Compact storage for processed_docs JSON.
+
+In the full format every chunk carries its finished `content`, so an overlapping
+sentence stores its whole paragraph again and the paragraph is repeated once per
+sentence. In the compact format each chunk keeps only its own core text, and
+usually not even that: the core is stored as a [start, end] span into the parent's
+core (sentence -> paragraph -> section -> document). The contextual `content`
+("Section: ... Paragraph context: ... Specific info: ...") is rebuilt on demand
+from the same templates the chunker uses, via ContextResolver.
+
+Compact records also drop `children_ids` where they follow from the parent_id
+order. Records that would not rebuild to exactly the original content keep their
+`content` inline, so expanding a compact file always gives back the full chunks.
+
+Since COMPACT_VERSION 2 records also leave out what follows from the records
+before them: `parent_id` when it is the latest chunk of the parent level, and
+metadata values that match the previous chunk of the same level once counts,
+sibling indices and overlap labels are recomputed for this chunk. Files without a
+`compact_version` are version 1 and store those in full.
+"""
+from typing import Dict, Iterable, Iterator, List, Optional
+
+PARAGRAPH_TEMPLATE = "Section: {section_title}\n\n{text}"
+SENTENCE_TEMPLATE = "Section: {section_title}\n\nParagraph context: {paragraph}\n\nSpecific info: {text}"
+SECTION_TEMPLATE = "{hashes} {title}\n\n{text}"
+
+# Levels whose core text other chunks point into
+CONTAINER_LEVELS = ("document", "section", "paragraph")
+PARENT_LEVELS = {"section": "document", "paragraph": "section", "sentence": "paragraph"}
+COMPACT_VERSION = 2
+
+
+def core_text(chunk: Dict) -> str:
+    """The chunk's own text, without any added context."""
+    metadata = chunk.get("metadata", {})
+    if chunk["level"] == "section":
+        prefix = SECTION_TEMPLATE.format(hashes="#" * metadata.get("header_level", 1),
+                                         title=metadata.get("title", ""), text="")
+        if chunk["content"].startswith(prefix):
+            return chunk["content"][len(prefix):]
+    if "core_content" in metadata:
+        return metadata["core_content"]
+    return chunk["content"]
+
+
+class ContextResolver:
+    """
+    Rebuilds core text, contextual content and full chunk dicts from compact records.
+    Records of `version` 2 get their left-out parent IDs and metadata back in place.
+    """
+
+    def __init__(self, records: Iterable[Dict], version: int = 1):
+        self.records: Dict[str, Dict] = {}
+        self._children: Dict[str, List[str]] = {}  # parent id -> child ids, in record order
+        self._cores: Dict[str, str] = {}
+        self._positions: Dict[str, Dict[str, int]] = {}  # parent id -> child id -> sibling index
+        self._derived = _Derivation() if version >= 2 else None
+        for record in records:
+            self.add(record)
+        if self._derived is not None:
+            for record in self.records.values():
+                self._derived.restore(record, self)
+
+    def add(self, record: Dict):
+        if self._derived is not None:
+            self._derived.restore_parent(record)
+        self.records[record["id"]] = record
+        if record.get("parent_id") is not None:
+            self._children.setdefault(record["parent_id"], []).append(record["id"])
+
+    def children(self, chunk_id: str) -> List[str]:
+        """Child IDs; compact records omit children_ids when they follow from parent_id order."""
+        record = self.records[chunk_id]
+        if "children_ids" in record:
+            return record["children_ids"]
+        return self._children.get(chunk_id, [])
+
+    def core(self, chunk_id: str) -> str:
+        if chunk_id in self._cores:
+            return self._cores[chunk_id]
+        record = self.records[chunk_id]
+        if "core_span" in record:
+            start, end = record["core_span"]
+            text = self.core(record["parent_id"])[start:end]
+        else:
+            text = record["core_text"]
+        if record["level"] in CONTAINER_LEVELS:
+            self._cores[chunk_id] = text
+        return text
+
+    def content(self, chunk_id: str) -> str:
+        """The contextual content of a chunk, exactly as the chunker produced it."""
+        record = self.records[chunk_id]
+        if "content" in record:
+            return record["content"]
+        return self._render(record)
+
+    def expand(self, chunk_id: str) -> Dict:
+        """Full-format chunk dict (content plus metadata.core_content where it was stored)."""
+        record = self.records[chunk_id]
+        metadata = dict(record.get("metadata", {}))
+        if record.get("meta_core"):
+            metadata = {"core_content": self.core(chunk_id), **metadata}
+        return {
+            "id": record["id"],
+            "content": self.content(chunk_id),
+            "level": record["level"],
+            "parent_id": record.get("parent_id"),
+            "children_ids": list(self.children(chunk_id)),
+            "metadata": metadata,
+        }
+
+    def position(self, chunk_id: str):
+        """(index among its siblings, index of the last sibling); (0, 0) without a known parent."""
+        parent_id = self.records[chunk_id].get("parent_id")
+        if parent_id not in self.records:
+            return 0, 0
+        if parent_id not in self._positions:
+            self._positions[parent_id] = {c: i for i, c in enumerate(self.children(parent_id))}
+        positions = self._positions[parent_id]
+        return positions.get(chunk_id, 0), len(positions) - 1
+
+    def _render(self, record: Dict) -> str:
+        level = record["level"]
+        metadata = record.get("metadata", {})
+        text = self.core(record["id"])
+        if level == "section":
+            return SECTION_TEMPLATE.format(hashes="#" * metadata.get("header_level", 1),
+                                           title=metadata.get("title", ""), text=text)
+        if level not in ("paragraph", "sentence") or not metadata.get("has_context"):
+            return text
+
+        sources = metadata.get("overlap_info", {}).get("overlap_source", [])
+        siblings = self.children(record["parent_id"])
+        position, _ = self.position(record["id"])
+        prev_id = siblings[position - 1] if position > 0 else None
+        next_id = siblings[position + 1] if position + 1 < len(siblings) else None
+
+        if level == "paragraph":
+            for source in sources:
+                count = int(source.split("_")[2])
+                if source.startswith("prev_para_"):
+                    sentences = self.children(prev_id)[-count:]
+                    text = f"[Previous context: {self._join(sentences)}] {text}"
+                elif source.startswith("next_para_"):
+                    sentences = self.children(next_id)[:count]
+                    text = f"{text} [Following context: {self._join(sentences)}]"
+            section = self.records[record["parent_id"]]
+            return PARAGRAPH_TEMPLATE.format(section_title=section.get("metadata", {}).get("title", ""),
+                                             text=text)
+
+        for source in sources:
+            count = int(source.split("_")[2])
+            if source.startswith("prev_sent_"):
+                prev = self.core(prev_id)
+                text = f"...{prev[-min(count, len(prev)):]} {text}"
+            elif source.startswith("next_sent_"):
+                nxt = self.core(next_id)
+                text = f"{text} {nxt[:min(count, len(nxt))]}..."
+        paragraph = self.records[record["parent_id"]]
+        section = self.records[paragraph["parent_id"]]
+        return SENTENCE_TEMPLATE.format(section_title=section.get("metadata", {}).get("title", ""),
+                                        paragraph=self.core(paragraph["id"]), text=text)
+
+    def _join(self, chunk_ids: List[str]) -> str:
+        return " ".join(self.core(i) for i in chunk_ids)
+
+
+class _Derivation:
+    """
+    What version 2 records leave out, replayed in record order: the latest chunk ID of
+    each level, and the previous metadata, overlap labels and meta_core flag of each level.
+    """
+
+    def __init__(self):
+        self.latest: Dict[str, str] = {}
+        self.templates: Dict[str, Dict] = {}
+        self.labels: Dict[str, Dict[str, str]] = {}  # level -> "prev"/"next" -> overlap label
+        self.meta_core: Dict[str, bool] = {}
+
+    def parent(self, level: str) -> Optional[str]:
+        return self.latest.get(PARENT_LEVELS.get(level))
+
+    def seen(self, record: Dict):
+        self.latest[record["level"]] = record["id"]
+
+    def restore_parent(self, record: Dict):
+        if "parent_id" not in record:
+            record["parent_id"] = self.parent(record["level"])
+        self.seen(record)
+
+    def metadata(self, record: Dict, resolver: "ContextResolver") -> Dict:
+        """The metadata `record` gets if it stores none."""
+        template = self.templates.get(record["level"])
+        if template is None:
+            return {}
+        metadata = dict(template)
+        if "char_count" in metadata or "word_count" in metadata:
+            core = resolver.core(record["id"])
+            if "char_count" in metadata:
+                metadata["char_count"] = len(core)
+            if "word_count" in metadata:
+                metadata["word_count"] = len(core.split())
+        if "start_index" in metadata:
+            metadata["start_index"] = template.get("end_index", 0)
+            if "end_index" in metadata:
+                metadata["end_index"] = metadata["start_index"] + metadata.get("word_count", 0)
+        if {"paragraph_index", "sentence_index", "overlap_info"} & metadata.keys():
+            position, last = resolver.position(record["id"])
+            for key in ("paragraph_index", "sentence_index"):
+                if key in metadata:
+                    metadata[key] = position
+            if "overlap_info" in metadata:
+                labels = self.labels.get(record["level"], {})
+                sources = [labels[d] for d, has in (("prev", position > 0), ("next", position < last))
+                           if has and d in labels]
+                metadata["overlap_info"] = {"has_overlap": bool(sources), "overlap_source": sources}
+        return metadata
+
+    def learn(self, record: Dict, metadata: Dict, meta_core: bool):
+        level = record["level"]
+        self.templates[level] = metadata
+        self.meta_core[level] = meta_core
+        for source in metadata.get("overlap_info", {}).get("overlap_source", []):
+            self.labels.setdefault(level, {})[source.split("_")[0]] = source
+
+    def strip(self, record: Dict, resolver: "ContextResolver"):
+        """Drop from a full record what restore() gives back; records are stripped in order."""
+        derived = self.metadata(record, resolver)
+        metadata = record.pop("metadata", {})
+        meta_core = record.pop("meta_core", False)
+        if meta_core != self.meta_core.get(record["level"], False):
+            record["meta_core"] = meta_core
+        if derived.keys() <= metadata.keys():
+            delta = {k: v for k, v in metadata.items() if k not in derived or derived[k] != v}
+        else:
+            delta, record["full_metadata"] = metadata, True
+        if delta:
+            record["metadata"] = delta
+        self.learn(record, metadata, meta_core)
+        return metadata, meta_core
+
+    def restore(self, record: Dict, resolver: "ContextResolver"):
+        """Put back, in place, the metadata and meta_core flag strip() left out."""
+        delta = record.get("metadata", {})
+        if record.pop("full_metadata", False):
+            metadata = delta
+        else:
+            metadata = {**self.metadata(record, resolver), **delta}
+        meta_core = record.get("meta_core", self.meta_core.get(record["level"], False))
+        record["metadata"] = metadata
+        if meta_core:
+            record["meta_core"] = True
+        else:
+            record.pop("meta_core", None)
+        self.learn(record, metadata, meta_core)
+
+
+def compact_chunks(chunks: Iterable[Dict]) -> Iterator[Dict]:
+    """
+    Turn full chunk dicts into compact records (COMPACT_VERSION), one section at a time
+    so that generators (e.g. from chunk_stream) are written out without buffering the document.
+    """
+    resolver = ContextResolver([])
+    derivation = _Derivation()
+    derived_parents: Dict[str, Optional[str]] = {}
+    cursors: Dict[str, int] = {}
+    group: List[Dict] = []
+
+    def flush():
+        for record, original in group:
+            try:
+                rebuilt = resolver.content(record["id"])
+            except KeyError:
+                # Context from chunks that are not among `chunks`
+                rebuilt = None
+            if rebuilt != original:
+                record["content"] = original
+        for record, _ in group:
+            derivation.strip(record, resolver)
+        for record, _ in group:
+            # Children of everything but the document are all inside this group
+            if record["level"] != "document" and record["children_ids"] == resolver._children.get(record["id"], []):
+                del record["children_ids"]
+            if record["parent_id"] == derived_parents.pop(record["id"]):
+                del record["parent_id"]
+            yield record
+        for record, _ in group:
+            if record["level"] != "document":
+                resolver.records.pop(record["id"], None)
+                resolver._children.pop(record["id"], None)
+                resolver._cores.pop(record["id"], None)
+                resolver._positions.pop(record["id"], None)
+                cursors.pop(record["id"], None)
+        group.clear()
+
+    for chunk in chunks:
+        if chunk["level"] in ("document", "section", "fixed"):
+            yield from flush()
+
+        core = core_text(chunk)
+        metadata = {k: v for k, v in chunk.get("metadata", {}).items() if k != "core_content"}
+        record = {
+            "id": chunk["id"],
+            "level": chunk["level"],
+            "parent_id": chunk.get("parent_id"),
+            "children_ids": chunk.get("children_ids", []),
+            "metadata": metadata,
+        }
+        if "core_content" in chunk.get("metadata", {}):
+            record["meta_core"] = True
+
+        # Store the core as a span into the parent's core when it can be found there
+        parent_id = chunk.get("parent_id")
+        parent_core = resolver._cores.get(parent_id) if parent_id else None
+        start = parent_core.find(core, cursors.get(parent_id, 0)) if parent_core is not None else -1
+        if start >= 0 and core:
+            record["core_span"] = [start, start + len(core)]
+            cursors[parent_id] = start + len(core)
+        else:
+            record["core_text"] = core
+
+        derived_parents[record["id"]] = derivation.parent(record["level"])
+        derivation.seen(record)
+        resolver.add(record)
+        if chunk["level"] in CONTAINER_LEVELS:
+            resolver._cores[record["id"]] = core
+        group.append((record, chunk["content"]))
+
+    yield from flush()
+
+
+def expand_chunks(records: List[Dict], version: int = COMPACT_VERSION) -> List[Dict]:
+    """Full chunk dicts for every compact record, in order."""
+    resolver = ContextResolver(records, version)
+    return [resolver.expand(r["id"]) for r in records]
+
+
+def load_chunks(doc_data: Dict) -> List[Dict]:
+    """Chunks of a processed_docs JSON dict in the full format, whichever format it was saved in."""
+    chunks = doc_data.get("chunks", [])
+    if doc_data.get("storage") == "compact":
+        return expand_chunks(chunks, doc_data.get("compact_version", 1))
+    return chunks
+
+
+def resolver_for(doc_data: Dict) -> Optional[ContextResolver]:
+    """
+    A ContextResolver for a compact processed_docs dict, or None for the full format.
+    Version 2 records get their parent IDs and metadata back in place.
+    """
+    if doc_data.get("storage") == "compact":
+        return ContextResolver(doc_data.get("chunks", []), doc_data.get("compact_version", 1))
+    return None
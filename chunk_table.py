@@ -0,0 +1,302 @@
+# chunk_table.py
+"""
+Columnar storage for large numbers of chunks.
+
+A ChunkTable keeps one row per chunk in flat numpy columns instead of one
+Python object per chunk: integer row indices, uint8 level codes, int32 parent
+rows, CSR offsets for children, and UTF-8 buffers for IDs and text. Metadata
+keys are stored once per table, with one column per key; nested dicts (such as
+`overlap_info`) become one column per nested key and lists become offsets into
+one column of their items, so repeated labels are stored once.
+
+    table = ChunkTable.from_chunks(chunker.chunk_document(text))
+    rows = table.select(level="sentence", doc_id="handbook", retrievable=True)
+    chunks = [table.to_chunk(i) for i in rows]
+"""
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from chunking import Chunk
+
+LEVELS = ("document", "section", "paragraph", "sentence", "fixed")
+LEVEL_CODES = {name: code for code, name in enumerate(LEVELS)}
+
+
+class StringColumn:
+    """Strings packed into one UTF-8 buffer with int64 offsets."""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[str]) -> "StringColumn":
+        builder = StringColumnBuilder()
+        for s in strings:
+            builder.append(s)
+        return builder.build()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + self.offsets.nbytes
+
+
+class StringColumnBuilder:
+    """Append-only buffer that becomes a StringColumn without keeping per-row str objects."""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.offsets = array("q", [0])
+
+    def append(self, s: str):
+        self.buf += s.encode("utf-8")
+        self.offsets.append(len(self.buf))
+
+    def build(self) -> StringColumn:
+        return StringColumn(np.frombuffer(bytes(self.buf), dtype=np.uint8),
+                            np.frombuffer(self.offsets, dtype=np.int64))
+
+
+class MetadataColumn:
+    """
+    Values of one metadata key for every row. Bool and int values become numpy arrays;
+    strings a StringColumn, or codes into the distinct strings when values repeat; dicts
+    one column per nested key; lists offsets into a column of their items. Anything else
+    is an object array, whose `nbytes` only counts the references.
+    `present` marks the rows that actually have the key.
+    """
+
+    def __init__(self, values: List, present: np.ndarray):
+        self.present = present
+        kinds = {type(v) for v, p in zip(values, present) if p}
+        if kinds == {bool}:
+            self.kind = "bool"
+            self.values = np.array([bool(v) if p else False for v, p in zip(values, present)], dtype=np.bool_)
+        elif kinds == {int}:
+            self.kind = "int"
+            self.values = np.array([v if p else 0 for v, p in zip(values, present)], dtype=np.int64)
+        elif kinds == {str}:
+            strings = [v if p else "" for v, p in zip(values, present)]
+            labels = dict.fromkeys(strings)
+            if len(labels) <= min(len(strings) // 2, 1 << 16):
+                self.kind = "category"
+                codes = {label: code for code, label in enumerate(labels)}
+                self.codes = np.array([codes[v] for v in strings], dtype=np.uint16)
+                self.values = StringColumn.from_strings(labels)
+            else:
+                self.kind = "str"
+                self.values = StringColumn.from_strings(strings)
+        elif kinds == {dict}:
+            self.kind = "dict"
+            keys = dict.fromkeys(key for v, p in zip(values, present) if p for key in v)
+            self.values = {}
+            for key in keys:
+                has_key = np.array([p and key in v for v, p in zip(values, present)], dtype=np.bool_)
+                self.values[key] = MetadataColumn([v[key] if h else None for v, h in zip(values, has_key)], has_key)
+        elif kinds == {list}:
+            self.kind = "list"
+            self.offsets = np.zeros(len(values) + 1, dtype=np.int64)
+            np.cumsum([len(v) if p else 0 for v, p in zip(values, present)], out=self.offsets[1:])
+            items = [item for v, p in zip(values, present) if p for item in v]
+            self.values = MetadataColumn(items, np.ones(len(items), dtype=np.bool_))
+        else:
+            self.kind = "object"
+            self.values = np.empty(len(values), dtype=object)
+            self.values[:] = values
+
+    def __getitem__(self, i: int):
+        if self.kind == "category":
+            return self.values[self.codes[i]]
+        if self.kind == "dict":
+            return {key: column[i] for key, column in self.values.items() if column.present[i]}
+        if self.kind == "list":
+            return [self.values[j] for j in range(self.offsets[i], self.offsets[i + 1])]
+        value = self.values[i]
+        if self.kind == "bool":
+            return bool(value)
+        if self.kind == "int":
+            return int(value)
+        return value
+
+    @property
+    def nbytes(self) -> int:
+        if self.kind == "category":
+            return self.present.nbytes + self.codes.nbytes + self.values.nbytes
+        if self.kind == "dict":
+            return self.present.nbytes + sum(column.nbytes for column in self.values.values())
+        if self.kind == "list":
+            return self.present.nbytes + self.offsets.nbytes + self.values.nbytes
+        return self.present.nbytes + self.values.nbytes
+
+
+class ChunkTable:
+    """Compact, columnar container for chunks from one or many documents."""
+
+    def __init__(self, ids: StringColumn, contents: StringColumn, levels: np.ndarray,
+                 parents: np.ndarray, doc_codes: np.ndarray, doc_ids: List[str],
+                 metadata: Dict[str, MetadataColumn]):
+        self.ids = ids
+        self.contents = contents
+        self.levels = levels          # uint8 codes into LEVELS
+        self.parents = parents        # int32 row of the parent, -1 for roots
+        self.doc_codes = doc_codes    # int32 codes into doc_ids
+        self.doc_ids = doc_ids
+        self.metadata = metadata      # interned key -> column
+        self._row_lookup = None
+
+        # Children as CSR offsets, derived from parents so rows keep document order
+        order = np.argsort(parents, kind="stable")
+        order = order[parents[order] >= 0]
+        counts = np.bincount(parents[order], minlength=len(parents))
+        self.child_offsets = np.zeros(len(parents) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.child_offsets[1:])
+        self.child_rows = order.astype(np.int32)
+
+        retrievable = metadata.get("retrievable")
+        if retrievable is not None and retrievable.kind == "bool":
+            # Chunks without the key count as retrievable, as in get_chunking_analysis
+            self.retrievable = retrievable.values | ~retrievable.present
+        else:
+            self.retrievable = np.ones(len(parents), dtype=np.bool_)
+
+    # ------------------ Construction -------------------
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[Chunk], doc_id: Optional[str] = None) -> "ChunkTable":
+        """
+        Build a table from Chunk objects (a list or a generator such as chunk_stream).
+        `doc_id` tags every row; by default each row takes the doc_id of the document
+        chunk it descends from. Chunks with no document chunk above them (fixed-size
+        chunks) need `doc_id`.
+        """
+        ids, parent_ids = [], []
+        contents = StringColumnBuilder()
+        levels = array("B")
+        meta_values: Dict[str, List] = {}
+        meta_rows: Dict[str, List[int]] = {}
+
+        for row, chunk in enumerate(chunks):
+            ids.append(chunk.id)
+            contents.append(chunk.content)
+            levels.append(LEVEL_CODES[chunk.level])
+            parent_ids.append(chunk.parent_id)
+            for key, value in chunk.metadata.items():
+                meta_values.setdefault(key, []).append(value)
+                meta_rows.setdefault(key, []).append(row)
+
+        n = len(ids)
+        row_of = {chunk_id: row for row, chunk_id in enumerate(ids)}
+        parents = np.array([row_of.get(p, -1) if p is not None else -1 for p in parent_ids], dtype=np.int32)
+
+        if doc_id is not None:
+            doc_ids, doc_codes = [doc_id], np.zeros(n, dtype=np.int32)
+        else:
+            doc_ids, doc_codes = _documents_of(ids, levels, parents)
+
+        metadata = {}
+        for key, values in meta_values.items():
+            rows = meta_rows[key]
+            present = np.zeros(n, dtype=np.bool_)
+            present[rows] = True
+            full = [None] * n
+            for row, value in zip(rows, values):
+                full[row] = value
+            metadata[key] = MetadataColumn(full, present)
+
+        return cls(StringColumn.from_strings(ids), contents.build(),
+                   np.frombuffer(levels, dtype=np.uint8), parents, doc_codes, doc_ids, metadata)
+
+    # ------------------ Access -------------------
+    def __len__(self):
+        return len(self.levels)
+
+    def __iter__(self) -> Iterator[Chunk]:
+        return (self.to_chunk(i) for i in range(len(self)))
+
+    def row_of(self, chunk_id: str) -> int:
+        """Row index of a string chunk ID (the lookup dict is built on first use)."""
+        if self._row_lookup is None:
+            self._row_lookup = {self.ids[i]: i for i in range(len(self))}
+        return self._row_lookup[chunk_id]
+
+    def children(self, row: int) -> np.ndarray:
+        return self.child_rows[self.child_offsets[row]:self.child_offsets[row + 1]]
+
+    def to_chunk(self, row: int) -> Chunk:
+        """Materialise one row as a Chunk for existing callers."""
+        row = int(row)
+        parent = self.parents[row]
+        metadata = {key: column[row] for key, column in self.metadata.items() if column.present[row]}
+        return Chunk(
+            id=self.ids[row],
+            content=self.contents[row],
+            level=LEVELS[self.levels[row]],
+            parent_id=self.ids[parent] if parent >= 0 else None,
+            children_ids=[self.ids[c] for c in self.children(row)],
+            metadata=metadata,
+        )
+
+    def to_chunks(self, rows: Optional[Iterable[int]] = None) -> Iterator[Chunk]:
+        """Lazily convert the given rows (default: all) to Chunk objects."""
+        if rows is None:
+            rows = range(len(self))
+        return (self.to_chunk(i) for i in rows)
+
+    # ------------------ Vectorized filters -------------------
+    def mask(self, level: Optional[str] = None, doc_id: Optional[str] = None,
+             retrievable: Optional[bool] = None) -> np.ndarray:
+        """Boolean row mask for the given level / document / retrievable filters."""
+        mask = np.ones(len(self), dtype=np.bool_)
+        if level is not None:
+            mask &= self.levels == LEVEL_CODES[level]
+        if doc_id is not None:
+            if doc_id not in self.doc_ids:
+                return np.zeros(len(self), dtype=np.bool_)
+            mask &= self.doc_codes == self.doc_ids.index(doc_id)
+        if retrievable is not None:
+            mask &= self.retrievable == retrievable
+        return mask
+
+    def select(self, level: Optional[str] = None, doc_id: Optional[str] = None,
+               retrievable: Optional[bool] = None) -> np.ndarray:
+        """Row indices matching all filters, e.g. select(level="sentence", doc_id="X", retrievable=True)."""
+        return np.flatnonzero(self.mask(level=level, doc_id=doc_id, retrievable=retrievable))
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the columns."""
+        total = (self.ids.nbytes + self.contents.nbytes + self.levels.nbytes + self.parents.nbytes
+                 + self.doc_codes.nbytes + self.child_offsets.nbytes + self.child_rows.nbytes
+                 + self.retrievable.nbytes)
+        return total + sum(column.nbytes for column in self.metadata.values())
+
+
+def _documents_of(ids: List[str], levels: array, parents: np.ndarray):
+    """(doc_ids, per-row codes into them), from the document chunk at the root of each row."""
+    roots = np.arange(len(parents), dtype=np.int32)
+    while True:
+        up = parents[roots]
+        step = up >= 0
+        if not step.any():
+            break
+        roots[step] = up[step]
+
+    doc_ids: List[str] = []
+    doc_index: Dict[int, int] = {}
+    doc_codes = np.empty(len(parents), dtype=np.int32)
+    for row, root in enumerate(roots.tolist()):
+        if root not in doc_index:
+            if levels[root] != LEVEL_CODES["document"]:
+                raise ValueError(f"Chunk {ids[row]} has no document chunk to take its doc_id from; pass doc_id")
+            # HierarchicalChunker names the document chunk f"{doc_id}_doc"
+            doc_index[root] = len(doc_ids)
+            doc_ids.append(ids[root][:-len("_doc")])
+        doc_codes[row] = doc_index[root]
+    return doc_ids, doc_codes
@@ -1,12 +1,20 @@
 # chunker.py
 import re
 import uuid
-from typing import List, Dict, Optional
+import hashlib
+import itertools
+from array import array
+from typing import List, Dict, Optional, Tuple, Iterable, Iterator
 from dataclasses import dataclass
 from datetime import datetime
 
+from markdown_scanner import scan_markdown, heading_level, fence_marker, closes_fence
 
-@dataclass
+MAX_SECTION_LEVEL = 3  # '#', '##' and '###' headings open sections; deeper ones stay in the body
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+
+@dataclass(slots=True)
 class Chunk:
     id: str
     content: str
@@ -32,23 +40,131 @@ class Chunk:
         }
 
 
+class SpanText:
+    """
+    Text assembled on demand from a shared source buffer. `template` holds literal
+    pieces and None for each span, and is shared by chunks of the same shape; the
+    spans' (start, end) pairs are read from `offsets` (shared by all chunks of the
+    same source) from position `first` on.
+    """
+    __slots__ = ("source", "template", "offsets", "first")
+
+    def __init__(self, source: str, template: Tuple, offsets: array, first: int = 0):
+        self.source = source
+        self.template = template
+        self.offsets = offsets
+        self.first = first
+
+    def spans(self) -> List[Tuple[int, int]]:
+        count = sum(piece is None for piece in self.template)
+        pairs = self.offsets[self.first:self.first + 2 * count]
+        return list(zip(pairs[0::2], pairs[1::2]))
+
+    def __str__(self):
+        spans = iter(self.spans())
+        return "".join(piece if piece is not None else self.source[slice(*next(spans))]
+                       for piece in self.template)
+
+    def __len__(self):
+        literal = sum(len(piece) for piece in self.template if piece is not None)
+        return literal + sum(end - start for start, end in self.spans())
+
+
+class SpanChunk(Chunk):
+    """
+    Chunk that stores its text as spans into the source document instead of a copy.
+    `content` and `metadata` (with `core_content` and `overlap_info`) are built when read,
+    so each read returns a new dict: change metadata through to_dict, not in place.
+    Metadata keys, literal text and overlap labels are shared between chunks.
+    """
+    __slots__ = ("_source", "_template", "_offsets", "_first", "_keys", "_values", "_core", "_overlap",
+                 "_children")
+
+    def __init__(self, id: str, text: SpanText, level: str, parent_id: Optional[str] = None,
+                 keys: Tuple = (), values: Tuple = (), core: int = -1, overlap: Tuple = ()):
+        self.id = id
+        self.level = level
+        self.parent_id = parent_id
+        self._source = text.source
+        self._template = text.template
+        self._offsets = text.offsets
+        self._first = text.first
+        self._keys = keys        # metadata keys, in order
+        self._values = values    # metadata values; None where the key is built on read
+        self._core = core        # index of the chunk's own span among its spans, -1 for none
+        self._overlap = overlap  # overlap_source labels
+        self._children = None    # created on first use; most chunks (sentences) never have any
+
+    @property
+    def text(self) -> SpanText:
+        return SpanText(self._source, self._template, self._offsets, self._first)
+
+    @property
+    def content(self) -> str:
+        return str(self.text)
+
+    @property
+    def children_ids(self) -> List[str]:
+        if self._children is None:
+            self._children = []
+        return self._children
+
+    @property
+    def metadata(self) -> Dict:
+        metadata = {}
+        for key, value in zip(self._keys, self._values):
+            if key == "core_content":
+                start = self._first + 2 * self._core
+                value = self._source[self._offsets[start]:self._offsets[start + 1]]
+            elif key == "overlap_info":
+                value = {"has_overlap": bool(self._overlap), "overlap_source": list(self._overlap)}
+            metadata[key] = value
+        return metadata
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "content": self.content,
+            "level": self.level,
+            "parent_id": self.parent_id,
+            "children_ids": self.children_ids,
+            "metadata": self.metadata,
+        }
+
+
 class HierarchicalChunker:
     def __init__(self, doc_id: str, title: str = "",
                  paragraph_overlap_sentences: int = 2,
                  sentence_overlap_chars: int = 100,
                  strategy: str = "hierarchical_overlap",  # default
-                 fixed_chunk_size: int = 200):
+                 fixed_chunk_size: int = 200,
+                 use_spans: bool = False,
+                 id_scheme: str = "positional"):
         """
         strategy: 'hierarchical', 'hierarchical_overlap', 'fixed_size'
+        use_spans: hierarchical strategies return SpanChunk objects that reference the
+                   source text by offsets instead of holding their own copies (about 7x the
+                   source in RAM with overlap, against about 26x). Opt-in: bulk chunking turns
+                   it on for incremental runs, which hold a whole document's chunks at once
+        id_scheme: 'positional' (doc_sent_12) or 'content', where section IDs come from a hash
+                   of the section text and paragraph/sentence IDs are numbered within their
+                   parent, so IDs of unchanged sections survive edits elsewhere
         """
         self.doc_id = doc_id
         self.title = title
         self.chunks = []
         self.chunk_lookup = {}
+        self._level_counts = {}  # running per-level counters used for positional IDs
+        self._source = ""
         self.paragraph_overlap_sentences = paragraph_overlap_sentences
         self.sentence_overlap_chars = sentence_overlap_chars
         self.strategy = strategy
         self.fixed_chunk_size = fixed_chunk_size
+        self.use_spans = use_spans
+        self.id_scheme = id_scheme
+        self._hash_counts = {}  # section hash -> occurrences, to keep duplicate sections distinct
+        self._interned = {}  # span mode: tuples shared between chunks (see _shared)
+        self._offsets = array("q")  # span mode: span offsets of every chunk of self._source
 
     def chunk_document(self, content: str) -> List[Chunk]:
         """Create chunks depending on strategy"""
@@ -57,18 +173,68 @@ class HierarchicalChunker:
 
         return self._hierarchical_chunking(content, overlap=(self.strategy == "hierarchical_overlap"))
 
-    # ------------------ Hierarchical Chunking -------------------
-    def _hierarchical_chunking(self, content: str, overlap: bool = True) -> List[Chunk]:
+    def chunk_stream(self, lines: Iterable[str]) -> Iterator[Chunk]:
+        """
+        Streaming variant of chunk_document for large files.
+
+        `lines` is a text file handle or any iterator of lines (with their line endings).
+        Section, paragraph and sentence chunks are yielded as soon as each section closes,
+        so only the current section is held in memory. Chunk IDs and contents match
+        chunk_document for documents whose headers fit on one line. The document chunk
+        is yielded last, with its word count and children but without the full text
+        (bulk_chunking.save_chunks copies it from the source file when given its path).
+        Streamed chunks are not accumulated in `self.chunks`.
+        """
+        if self.strategy == "fixed_size":
+            yield from self._fixed_size_stream(lines)
+            return
+
+        overlap = self.strategy == "hierarchical_overlap"
         doc_chunk = Chunk(
             id=f"{self.doc_id}_doc",
-            content=content,
+            content="",
             level="document",
             metadata={
                 "title": self.title,
-                "word_count": len(content.split()),
+                "word_count": 0,
                 "created_at": datetime.now().isoformat()
             }
         )
+
+        buffer = []
+        fence = ""
+        for line in itertools.chain(lines, [None]):
+            opens_section = False
+            if line is not None:
+                # Track code fences so headings inside them do not open sections
+                if fence:
+                    if closes_fence(line, fence):
+                        fence = ""
+                else:
+                    fence = fence_marker(line)
+                    opens_section = not fence and 0 < heading_level(line) <= MAX_SECTION_LEVEL
+
+            if line is not None and not (buffer and opens_section):
+                buffer.append(line)
+                doc_chunk.metadata["word_count"] += len(line.split())
+                continue
+
+            # A section heading (or end of input) closes the buffered section
+            section_text = "".join(buffer)
+            buffer = [line]
+            if line is not None:
+                doc_chunk.metadata["word_count"] += len(line.split())
+
+            for section_data in self._detect_sections(section_text):
+                yield from self._chunk_section(section_data, doc_chunk, overlap)
+            # Parents of the next section's chunks are all new; drop this section's
+            self.chunk_lookup = {}
+
+        yield doc_chunk
+
+    # ------------------ Hierarchical Chunking -------------------
+    def _hierarchical_chunking(self, content: str, overlap: bool = True) -> List[Chunk]:
+        doc_chunk = self._create_document_chunk(content)
         self.chunks.append(doc_chunk)
         self.chunk_lookup[doc_chunk.id] = doc_chunk
 
@@ -76,53 +242,80 @@ class HierarchicalChunker:
         sections = self._detect_sections(content)
 
         for section_data in sections:
-            section_chunk = self._create_section_chunk(section_data, doc_chunk.id)
-            self.chunks.append(section_chunk)
-            self.chunk_lookup[section_chunk.id] = section_chunk
-            doc_chunk.children_ids.append(section_chunk.id)
+            self.chunks.extend(self._chunk_section(section_data, doc_chunk, overlap))
 
-            # Paragraphs
-            paragraphs = self._detect_paragraphs(section_data['content'])
+        return self.chunks
 
-            if overlap:
-                para_chunks = self._create_overlapping_paragraphs(paragraphs, section_chunk.id)
-            else:
-                para_chunks = self._create_plain_paragraphs(paragraphs, section_chunk.id)
+    def _create_document_chunk(self, content: str) -> Chunk:
+        self._set_source(content)
+        return self._make_chunk(
+            f"{self.doc_id}_doc",
+            [(0, len(content))],
+            level="document",
+            metadata={
+                "title": self.title,
+                "word_count": len(content.split()),
+                "created_at": datetime.now().isoformat()
+            }
+        )
 
-            for para_chunk in para_chunks:
-                self.chunks.append(para_chunk)
-                self.chunk_lookup[para_chunk.id] = para_chunk
-                section_chunk.children_ids.append(para_chunk.id)
+    def _chunk_section(self, section_data: Dict, doc_chunk: Chunk, overlap: bool,
+                       section_id: Optional[str] = None) -> List[Chunk]:
+        """Build the section chunk and its paragraph/sentence descendants, in document order."""
+        chunks = []
+        section_chunk = self._create_section_chunk(section_data, doc_chunk.id, section_id)
+        chunks.append(section_chunk)
+        self.chunk_lookup[section_chunk.id] = section_chunk
+        doc_chunk.children_ids.append(section_chunk.id)
 
-                # Sentences
-                sentences = self._detect_sentences(para_chunk.metadata['core_content'])
+        # Paragraphs
+        paragraphs = self._detect_paragraphs(section_data['start'], section_data['end'])
 
-                if overlap:
-                    sent_chunks = self._create_overlapping_sentences(sentences, para_chunk.id)
-                else:
-                    sent_chunks = self._create_plain_sentences(sentences, para_chunk.id)
+        # Sentence index: each paragraph is split exactly once, and both the paragraph
+        # overlap and the sentence level read from it
+        for para_data in paragraphs:
+            para_data['sentences'] = self._detect_sentences(para_data['start'], para_data['end'])
 
-                for sent_chunk in sent_chunks:
-                    self.chunks.append(sent_chunk)
-                    self.chunk_lookup[sent_chunk.id] = sent_chunk
-                    para_chunk.children_ids.append(sent_chunk.id)
+        if overlap:
+            para_chunks = self._create_overlapping_paragraphs(paragraphs, section_chunk.id)
+        else:
+            para_chunks = self._create_plain_paragraphs(paragraphs, section_chunk.id)
 
-        return self.chunks
+        for para_data, para_chunk in zip(paragraphs, para_chunks):
+            chunks.append(para_chunk)
+            self.chunk_lookup[para_chunk.id] = para_chunk
+            section_chunk.children_ids.append(para_chunk.id)
+
+            # Sentences
+            sentences = para_data['sentences']
+
+            if overlap:
+                sent_chunks = self._create_overlapping_sentences(sentences, para_chunk.id, para_data)
+            else:
+                sent_chunks = self._create_plain_sentences(sentences, para_chunk.id)
+
+            for sent_chunk in sent_chunks:
+                chunks.append(sent_chunk)
+                self.chunk_lookup[sent_chunk.id] = sent_chunk
+                para_chunk.children_ids.append(sent_chunk.id)
+
+        return chunks
 
     def _create_plain_paragraphs(self, paragraphs: List[Dict], parent_id: str) -> List[Chunk]:
         """No overlap paragraphs"""
         chunks = []
         for para_data in paragraphs:
-            para_id = f"{self.doc_id}_para_{len([c for c in self.chunks if c.level == 'paragraph'])}"
-            chunk = Chunk(
-                id=para_id,
-                content=para_data['content'],
+            para_id = self._next_chunk_id("paragraph", "para", parent_id)
+            span = (para_data['start'], para_data['end'])
+            chunk = self._make_chunk(
+                para_id,
+                [span],
                 level="paragraph",
                 parent_id=parent_id,
                 metadata={
-                    "core_content": para_data['content'],
+                    "core_content": span,
                     "paragraph_index": para_data['paragraph_index'],
-                    "word_count": len(para_data['content'].split()),
+                    "word_count": self._word_count(span),
                     "retrievable": True
                 }
             )
@@ -133,16 +326,17 @@ class HierarchicalChunker:
         """No overlap sentences"""
         chunks = []
         for sent_data in sentences:
-            sent_id = f"{self.doc_id}_sent_{len([c for c in self.chunks if c.level == 'sentence'])}"
-            chunk = Chunk(
-                id=sent_id,
-                content=sent_data['content'],
+            sent_id = self._next_chunk_id("sentence", "sent", parent_id)
+            span = (sent_data['start'], sent_data['end'])
+            chunk = self._make_chunk(
+                sent_id,
+                [span],
                 level="sentence",
                 parent_id=parent_id,
                 metadata={
-                    "core_content": sent_data['content'],
+                    "core_content": span,
                     "sentence_index": sent_data['sentence_index'],
-                    "char_count": len(sent_data['content']),
+                    "char_count": span[1] - span[0],
                     "retrievable": True
                 }
             )
@@ -172,62 +366,81 @@ class HierarchicalChunker:
             chunks.append(chunk)
         self.chunks.extend(chunks)
         return chunks
+
+    def _fixed_size_stream(self, lines: Iterable[str]) -> Iterator[Chunk]:
+        """Streaming fixed-size chunking; holds at most one chunk's worth of words."""
+        words = []
+        start = 0
+        for line in itertools.chain(lines, [None]):
+            if line is not None:
+                words.extend(line.split())
+            while len(words) >= self.fixed_chunk_size or (line is None and words):
+                chunk_words = words[:self.fixed_chunk_size]
+                del words[:self.fixed_chunk_size]
+                yield Chunk(
+                    id=f"{self.doc_id}_fixed_{start//self.fixed_chunk_size}",
+                    content=" ".join(chunk_words),
+                    level="fixed",
+                    parent_id=None,
+                    metadata={
+                        "start_index": start,
+                        "end_index": start+len(chunk_words),
+                        "word_count": len(chunk_words),
+                        "retrievable": True
+                    }
+                )
+                start += len(chunk_words)
     def _create_overlapping_paragraphs(self, paragraphs: List[Dict], parent_id: str) -> List[Chunk]:
         """Create paragraph chunks with sentence-level overlapping"""
         overlapping_chunks = []
         
+        # Get parent section for context (shared by every paragraph in the section)
+        parent_section = self.chunk_lookup[parent_id]
+        section_title = parent_section.metadata.get('title', '')
+        context_prefix = f"Section: {section_title}\n\n"
+        
         for i, para_data in enumerate(paragraphs):
-            para_id = f"{self.doc_id}_para_{len([c for c in self.chunks if c.level == 'paragraph']) + len(overlapping_chunks)}"
-            
-            # Get sentences for this paragraph
-            para_sentences = self._detect_sentences(para_data['content'])
+            para_id = self._next_chunk_id("paragraph", "para", parent_id)
+            span = (para_data['start'], para_data['end'])
             
             # Build overlapping content
-            overlap_content = para_data['content']
+            overlap_parts = [span]
             overlap_info = {"has_overlap": False, "overlap_source": []}
             
             # Add overlap from previous paragraph
             if i > 0 and self.paragraph_overlap_sentences > 0:
                 prev_para = paragraphs[i-1]
-                prev_sentences = self._detect_sentences(prev_para['content'])
+                prev_sentences = prev_para['sentences']
                 
                 # Take last N sentences from previous paragraph
                 if len(prev_sentences) >= self.paragraph_overlap_sentences:
                     overlap_sentences = prev_sentences[-self.paragraph_overlap_sentences:]
-                    overlap_text = ' '.join([s['content'] for s in overlap_sentences])
-                    overlap_content = f"[Previous context: {overlap_text}] {para_data['content']}"
+                    overlap_parts = ["[Previous context: ", *self._join_sentences(overlap_sentences), "] ", *overlap_parts]
                     overlap_info["has_overlap"] = True
                     overlap_info["overlap_source"].append(f"prev_para_{self.paragraph_overlap_sentences}_sentences")
             
             # Add overlap from next paragraph  
             if i < len(paragraphs) - 1 and self.paragraph_overlap_sentences > 0:
                 next_para = paragraphs[i+1]
-                next_sentences = self._detect_sentences(next_para['content'])
+                next_sentences = next_para['sentences']
                 
                 # Take first N sentences from next paragraph
                 if len(next_sentences) >= self.paragraph_overlap_sentences:
                     overlap_sentences = next_sentences[:self.paragraph_overlap_sentences]
-                    overlap_text = ' '.join([s['content'] for s in overlap_sentences])
-                    overlap_content = f"{overlap_content} [Following context: {overlap_text}]"
+                    overlap_parts = [*overlap_parts, " [Following context: ", *self._join_sentences(overlap_sentences), "]"]
                     overlap_info["has_overlap"] = True
                     overlap_info["overlap_source"].append(f"next_para_{self.paragraph_overlap_sentences}_sentences")
             
-            # Get parent section for context
-            parent_section = self.chunk_lookup[parent_id]
-            section_title = parent_section.metadata.get('title', '')
-            
             # Final contextual content
-            contextual_content = f"Section: {section_title}\n\n{overlap_content}"
-            
-            chunk = Chunk(
-                id=para_id,
-                content=contextual_content,
+            chunk = self._make_chunk(
+                para_id,
+                [context_prefix, *overlap_parts],
                 level="paragraph",
                 parent_id=parent_id,
                 metadata={
-                    "core_content": para_data['content'],
+                    "core_content": span,
                     "paragraph_index": para_data['paragraph_index'],
-                    "word_count": len(para_data['content'].split()), # Use core_content for word count
+                    "word_count": self._word_count(span), # Use core_content for word count
                     "has_context": True,
                     "retrievable": True,
                     "overlap_info": overlap_info
@@ -238,53 +451,54 @@ class HierarchicalChunker:
         
         return overlapping_chunks
     
-    def _create_overlapping_sentences(self, sentences: List[Dict], parent_id: str) -> List[Chunk]:
+    def _create_overlapping_sentences(self, sentences: List[Dict], parent_id: str, para_data: Dict) -> List[Chunk]:
         """Create sentence chunks with character-level overlapping"""
         overlapping_chunks = []
         
+        # Get parent context (shared by every sentence in the paragraph)
+        parent_para = self.chunk_lookup[parent_id]
+        parent_section = self.chunk_lookup[parent_para.parent_id]
+        
+        section_title = parent_section.metadata.get('title', '')
+        context_prefix = f"Section: {section_title}\n\nParagraph context: "
+        para_span = (para_data['start'], para_data['end'])
+        
         for i, sent_data in enumerate(sentences):
-            sent_id = f"{self.doc_id}_sent_{len([c for c in self.chunks if c.level == 'sentence']) + len(overlapping_chunks)}"
+            sent_id = self._next_chunk_id("sentence", "sent", parent_id)
+            span = (sent_data['start'], sent_data['end'])
             
             # Build overlapping content
-            overlap_content = sent_data['content']
+            overlap_parts = [span]
             overlap_info = {"has_overlap": False, "overlap_source": []}
             
             # Add overlap from previous sentence
             if i > 0 and self.sentence_overlap_chars > 0:
-                prev_sent = sentences[i-1]['content']
+                prev_start, prev_end = sentences[i-1]['start'], sentences[i-1]['end']
                 # Ensure we don't try to take more chars than available
-                overlap_text = prev_sent[-min(self.sentence_overlap_chars, len(prev_sent)):]
-                overlap_content = f"...{overlap_text} {sent_data['content']}"
+                overlap_span = (prev_end - min(self.sentence_overlap_chars, prev_end - prev_start), prev_end)
+                overlap_parts = ["...", overlap_span, " ", *overlap_parts]
                 overlap_info["has_overlap"] = True
                 overlap_info["overlap_source"].append(f"prev_sent_{self.sentence_overlap_chars}_chars")
             
             # Add overlap from next sentence
             if i < len(sentences) - 1 and self.sentence_overlap_chars > 0:
-                next_sent = sentences[i+1]['content']
+                next_start, next_end = sentences[i+1]['start'], sentences[i+1]['end']
                 # Ensure we don't try to take more chars than available
-                overlap_text = next_sent[:min(self.sentence_overlap_chars, len(next_sent))]
-                overlap_content = f"{overlap_content} {overlap_text}..."
+                overlap_span = (next_start, next_start + min(self.sentence_overlap_chars, next_end - next_start))
+                overlap_parts = [*overlap_parts, " ", overlap_span, "..."]
                 overlap_info["has_overlap"] = True
                 overlap_info["overlap_source"].append(f"next_sent_{self.sentence_overlap_chars}_chars")
             
-            # Get parent context
-            parent_para = self.chunk_lookup[parent_id]
-            parent_section = self.chunk_lookup[parent_para.parent_id]
-            
-            section_title = parent_section.metadata.get('title', '')
-            para_content = parent_para.metadata['core_content']
-            
-            contextual_content = f"Section: {section_title}\n\nParagraph context: {para_content}\n\nSpecific info: {overlap_content}"
-            
-            chunk = Chunk(
-                id=sent_id,
-                content=contextual_content,
+            chunk = self._make_chunk(
+                sent_id,
+                [context_prefix, para_span,
+                 "\n\nSpecific info: ", *overlap_parts],
                 level="sentence",
                 parent_id=parent_id,
                 metadata={
-                    "core_content": sent_data['content'],
+                    "core_content": span,
                     "sentence_index": sent_data['sentence_index'], 
-                    "char_count": len(sent_data['content']), # Use core_content for char count
+                    "char_count": span[1] - span[0], # Use core_content for char count
                     "has_context": True,
                     "retrievable": True,
                     "overlap_info": overlap_info
@@ -295,75 +509,192 @@ class HierarchicalChunker:
         
         return overlapping_chunks
     # ------------------ Reuse existing helpers -------------------
+    def _next_chunk_id(self, level: str, tag: str, parent_id: Optional[str] = None) -> str:
+        """
+        Return the next ID for `level` in O(1) using a running counter: document-wide
+        for positional IDs, per parent for content IDs.
+        """
+        if self.id_scheme == "content" and parent_id is not None:
+            key, prefix = (parent_id, level), parent_id
+        else:
+            key, prefix = level, self.doc_id
+        index = self._level_counts.get(key, 0)
+        self._level_counts[key] = index + 1
+        return f"{prefix}_{tag}_{index}"
+
+    def section_hash(self, section_data: Dict) -> str:
+        """Stable hash of a detected section's level, title and body text."""
+        body = self._source[section_data['start']:section_data['end']]
+        key = f"{section_data['level']}\x00{section_data['title']}\x00{body}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+    def _section_id(self, section_data: Dict) -> str:
+        """ID for the next section chunk; content IDs repeat for identical sections, so number repeats."""
+        if self.id_scheme != "content":
+            return self._next_chunk_id("section", "section")
+        digest = self.section_hash(section_data)
+        seen = self._hash_counts.get(digest, 0)
+        self._hash_counts[digest] = seen + 1
+        return f"{self.doc_id}_section_{digest}" + (f"_{seen}" if seen else "")
+
+    def _text(self, parts: List) -> str:
+        """Resolve literal strings and (start, end) source spans into a str."""
+        return "".join(p if isinstance(p, str) else self._source[p[0]:p[1]] for p in parts)
+
+    def _make_chunk(self, chunk_id: str, parts: List, level: str,
+                    parent_id: Optional[str] = None, metadata: Dict = None) -> Chunk:
+        """
+        Chunk whose content is `parts` (literal strings and (start, end) source spans).
+        `core_content` in `metadata` is given as a span too.
+        """
+        metadata = metadata or {}
+        if not self.use_spans:
+            if "core_content" in metadata:
+                metadata["core_content"] = self._text([metadata["core_content"]])
+            return Chunk(id=chunk_id, content=self._text(parts), level=level,
+                         parent_id=parent_id, metadata=metadata)
+
+        spans = [p for p in parts if not isinstance(p, str)]
+        template = self._shared(tuple(None if not isinstance(p, str) else p for p in parts))
+        first = len(self._offsets)
+        for span in spans:
+            self._offsets.extend(span)
+        overlap = metadata.get("overlap_info", {}).get("overlap_source", ())
+        return SpanChunk(
+            id=chunk_id,
+            text=SpanText(self._source, template, self._offsets, first),
+            level=level,
+            parent_id=parent_id,
+            keys=self._shared(tuple(metadata)),
+            values=self._shared(tuple(None if key in ("core_content", "overlap_info") else value
+                                      for key, value in metadata.items())),
+            core=spans.index(metadata["core_content"]) if "core_content" in metadata else -1,
+            overlap=self._shared(tuple(overlap)),
+        )
+
+    def _set_source(self, content: str):
+        """Make `content` the buffer new chunks' spans refer to (each streamed section has its own)."""
+        if content is not self._source:
+            self._source = content
+            self._offsets = array("q")
+
+    def _shared(self, value: Tuple) -> Tuple:
+        """One instance of each equal template, key, value and label tuple, for all span chunks."""
+        return self._interned.setdefault(value, value)
+
+    def _word_count(self, span: Tuple[int, int]) -> int:
+        return len(self._source[span[0]:span[1]].split())
+
+    def _join_sentences(self, sentences: List[Dict]) -> List:
+        """Space-joined sentence spans, as parts for `_text`."""
+        parts = []
+        for s in sentences:
+            if parts:
+                parts.append(" ")
+            parts.append((s['start'], s['end']))
+        return parts
+
+    def _strip_span(self, start: int, end: int) -> Tuple[int, int]:
+        """Offsets of `self._source[start:end].strip()` without copying the text."""
+        source = self._source
+        while start < end and source[start].isspace():
+            start += 1
+        while end > start and source[end - 1].isspace():
+            end -= 1
+        return start, end
+
     def _detect_sections(self, content: str) -> List[Dict]:
-        section_pattern = r'(?m)^(#{1,3})\s*(.+?)\n(.*?)(?=\n#{1,3}\s*|\Z)'
-        matches = list(re.finditer(section_pattern, content, re.DOTALL))
+        """Sections as title/level plus (start, end) offsets of their stripped body in `content`."""
+        self._set_source(content)
+        headings = [event for event in scan_markdown(content)
+                    if event.kind == "heading" and event.level <= MAX_SECTION_LEVEL]
         sections = []
 
-        first_header_start = matches[0].start() if matches else len(content)
-        initial_content = content[:first_header_start].strip()
-        if initial_content:
+        first_header_start = headings[0].start if headings else len(content)
+        intro_start, intro_end = self._strip_span(0, first_header_start)
+        if intro_end > intro_start:
             sections.append({
                 "title": "Introduction",
-                "content": initial_content,
+                "start": intro_start,
+                "end": intro_end,
                 "level": 1
             })
 
-        for match in matches:
-            header_level_str = match.group(1)
-            title = match.group(2).strip()
-            section_content = match.group(3).strip()
+        for i, heading in enumerate(headings):
+            next_start = headings[i + 1].start if i + 1 < len(headings) else len(content)
+            body_start, body_end = self._strip_span(heading.end, next_start)
             sections.append({
-                "title": title,
-                "content": section_content,
-                "level": len(header_level_str)
+                "title": heading.title,
+                "start": body_start,
+                "end": body_end,
+                "level": heading.level
             })
 
         if not sections and content.strip():
             sections.append({
                 "title": self.title if self.title else "Main Content",
-                "content": content,
+                "start": 0,
+                "end": len(content),
                 "level": 1
             })
         return sections
 
-    def _detect_paragraphs(self, content: str) -> List[Dict]:
-        raw_paragraphs = content.split('\n\n')
+    def _detect_paragraphs(self, start: int, end: int) -> List[Dict]:
+        """Paragraphs of `self._source[start:end]`, split on blank lines, as stripped offsets."""
         paragraphs = []
-        for i, para in enumerate(raw_paragraphs):
-            para = para.strip()
-            if para:
+        i = 0
+        pos = start
+        while True:
+            sep = self._source.find('\n\n', pos, end)
+            para_end = end if sep == -1 else sep
+            para_start, para_end = self._strip_span(pos, para_end)
+            if para_end > para_start:
                 paragraphs.append({
-                    "content": para,
-                    "paragraph_index": i,
-                    "word_count": len(para.split())
+                    "start": para_start,
+                    "end": para_end,
+                    "paragraph_index": i
                 })
+            if sep == -1:
+                break
+            pos = sep + 2
+            i += 1
         return paragraphs
 
-    def _detect_sentences(self, content: str) -> List[Dict]:
-        sentences = re.split(r'(?<=[.!?])\s+', content)
+    def _detect_sentences(self, start: int, end: int) -> List[Dict]:
+        """Sentences of `self._source[start:end]`, split after . ! or ?, as stripped offsets."""
         sentence_data = []
-        for i, sentence in enumerate(sentences):
-            sentence = sentence.strip()
-            if sentence:
-                sentence_data.append({
-                    "content": sentence,
-                    "sentence_index": i,
-                    "char_count": len(sentence)
-                })
+        pos = start
+        i = 0
+        for match in SENTENCE_BOUNDARY.finditer(self._source, start, end):
+            self._append_sentence(sentence_data, pos, match.start(), i)
+            pos = match.end()
+            i += 1
+        self._append_sentence(sentence_data, pos, end, i)
         return sentence_data
 
-    def _create_section_chunk(self, section_data: Dict, parent_id: str) -> Chunk:
-        section_id = f"{self.doc_id}_section_{len([c for c in self.chunks if c.level == 'section'])}"
-        return Chunk(
-            id=section_id,
-            content=f"{'#' * section_data['level']} {section_data['title']}\n\n{section_data['content']}",
+    def _append_sentence(self, sentence_data: List[Dict], start: int, end: int, index: int):
+        start, end = self._strip_span(start, end)
+        if end > start:
+            sentence_data.append({
+                "start": start,
+                "end": end,
+                "sentence_index": index
+            })
+
+    def _create_section_chunk(self, section_data: Dict, parent_id: str,
+                              section_id: Optional[str] = None) -> Chunk:
+        if section_id is None:
+            section_id = self._section_id(section_data)
+        span = (section_data['start'], section_data['end'])
+        return self._make_chunk(
+            section_id,
+            [f"{'#' * section_data['level']} {section_data['title']}\n\n", span],
             level="section",
             parent_id=parent_id,
             metadata={
                 "title": section_data['title'],
                 "header_level": section_data['level'],
-                "word_count": len(section_data['content'].split()),
+                "word_count": self._word_count(span),
                 "retrievable": False
             }
         )
@@ -0,0 +1,179 @@
+# context_index.py
+"""
+Ancestor index for chunk context lookups, live or from processed_docs JSON.
+
+For every chunk the index stores the row of its document, section and paragraph
+ancestor (-1 where there is none), as one int32 column per level. save_chunks
+writes these columns next to the chunks as `ancestor_index`, so a saved document
+answers "give me the paragraph/section of this hit" without a chunker instance
+and without following parent_id links one at a time.
+
+    index = ContextIndex.from_processed(doc_data)
+    contexts = index.get_contexts(hit_ids, context_level="section")
+"""
+from array import array
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from chunk_storage import resolver_for
+
+ANCESTOR_LEVELS = ("document", "section", "paragraph")
+
+
+class AncestorIndexBuilder:
+    """
+    Fills the ancestor columns one chunk at a time. In document (pre-)order each row is
+    final when added; a chunk whose parent comes later (chunk_stream yields the document
+    chunk last) is back-filled when `columns` is next read.
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self._columns = {level: array("i") for level in ANCESTOR_LEVELS}
+        self._row_of: Dict[str, int] = {}
+        self._levels: List[str] = []
+        self._parents = array("i")  # parent row, -1 for none (or not seen yet)
+        self._waiting: Dict[str, List[int]] = {}  # parent ID not seen yet -> rows of its children
+        self._stale = False
+
+    def add(self, chunk_id: str, level: str, parent_id: Optional[str]):
+        row = len(self.ids)
+        parent = self._row_of.get(parent_id, -1) if parent_id is not None else -1
+        if parent < 0 and parent_id is not None:
+            self._waiting.setdefault(parent_id, []).append(row)
+        for name, column in self._columns.items():
+            if parent < 0:
+                column.append(-1)
+            elif self._levels[parent] == name:
+                column.append(parent)
+            else:
+                column.append(column[parent])
+        self.ids.append(chunk_id)
+        self._levels.append(level)
+        self._parents.append(parent)
+        self._row_of[chunk_id] = row
+        for child in self._waiting.pop(chunk_id, ()):
+            self._parents[child] = row
+            self._stale = True
+
+    @property
+    def columns(self) -> Dict[str, array]:
+        """level -> int32 row of that ancestor per chunk, -1 for none."""
+        if self._stale:
+            self._resolve()
+        return self._columns
+
+    def _resolve(self):
+        """Recompute every row from its parent's, parents first."""
+        done = bytearray(len(self.ids))
+        for start in range(len(self.ids)):
+            chain = []
+            row = start
+            while row >= 0 and not done[row]:
+                done[row] = 1  # also stops on (malformed) parent cycles
+                chain.append(row)
+                row = self._parents[row]
+            for row in reversed(chain):
+                parent = self._parents[row]
+                for name, column in self._columns.items():
+                    if parent < 0:
+                        column[row] = -1
+                    elif self._levels[parent] == name:
+                        column[row] = parent
+                    else:
+                        column[row] = column[parent]
+        self._stale = False
+
+    def track(self, records: Iterable[Dict]) -> Iterator[Dict]:
+        """Pass chunk dicts through unchanged, indexing each one on the way."""
+        for record in records:
+            self.add(record["id"], record["level"], record.get("parent_id"))
+            yield record
+
+    def to_dict(self) -> Dict[str, List[int]]:
+        """The `ancestor_index` field stored in processed_docs JSON."""
+        return {level: column.tolist() for level, column in self.columns.items()}
+
+
+class ContextIndex:
+    """Constant-time chunk -> ancestor lookups, with a batch API for retrieval hits."""
+
+    def __init__(self, ids: List[str], levels: List[str], ancestors: Dict[str, np.ndarray],
+                 content_of: Callable[[int], str]):
+        self.ids = ids
+        self.levels = levels
+        self.ancestors = ancestors      # level -> int32 row of that ancestor, -1 for none
+        self._content_of = content_of
+        self._row_of = {chunk_id: row for row, chunk_id in enumerate(ids)}
+
+    @classmethod
+    def from_processed(cls, doc_data: Dict) -> "ContextIndex":
+        """Index a processed_docs dict (full or compact); older files without an index are indexed on load."""
+        records = doc_data.get("chunks", [])
+        # Compact records get their left-out parent IDs back here, before they are indexed
+        resolver = resolver_for(doc_data)
+        stored = doc_data.get("ancestor_index")
+        if stored is None or any(len(stored.get(level, ())) != len(records) for level in ANCESTOR_LEVELS):
+            builder = AncestorIndexBuilder()
+            for record in records:
+                builder.add(record["id"], record["level"], record.get("parent_id"))
+            stored = builder.to_dict()
+        ancestors = {level: np.asarray(stored[level], dtype=np.int32) for level in ANCESTOR_LEVELS}
+
+        if resolver is not None:
+            content_of = lambda row: resolver.content(records[row]["id"])
+        else:
+            content_of = lambda row: records[row]["content"]
+        return cls([r["id"] for r in records], [r["level"] for r in records], ancestors, content_of)
+
+    @classmethod
+    def from_chunks(cls, chunks: List) -> "ContextIndex":
+        """Index Chunk objects from a live chunker (e.g. chunker.chunks)."""
+        builder = AncestorIndexBuilder()
+        for chunk in chunks:
+            builder.add(chunk.id, chunk.level, chunk.parent_id)
+        ancestors = {level: np.frombuffer(column, dtype=np.int32) for level, column in builder.columns.items()}
+        return cls(builder.ids, [c.level for c in chunks], ancestors, lambda row: chunks[row].content)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._row_of
+
+    def ancestor(self, chunk_id: str, level: str) -> Optional[str]:
+        """ID of the chunk's ancestor at `level`, or None if it has none."""
+        row = self.ancestors[level][self._row_of[chunk_id]]
+        return self.ids[row] if row >= 0 else None
+
+    def context_rows(self, rows: np.ndarray, context_level: str = "paragraph") -> np.ndarray:
+        """
+        Row whose content is each row's context at `context_level`: the ancestor at that
+        level, or the row itself when it is at or above that level (or has no such ancestor).
+        """
+        rows = np.asarray(rows, dtype=np.int32)
+        if context_level not in self.ancestors:
+            return rows
+        found = self.ancestors[context_level][rows]
+        return np.where(found >= 0, found, rows)
+
+    def get_chunk_with_context(self, chunk_id: str, context_level: str = "paragraph") -> str:
+        """Same contract as HierarchicalChunker.get_chunk_with_context; '' for unknown IDs."""
+        row = self._row_of.get(chunk_id)
+        if row is None:
+            return ""
+        return self._content_of(int(self.context_rows([row], context_level)[0]))
+
+    def get_contexts(self, chunk_ids: Iterable[str], context_level: str = "paragraph") -> Dict[str, str]:
+        """
+        Contexts for many chunk IDs in one call. Hits sharing a paragraph or section
+        resolve its content once; unknown IDs are left out of the result.
+        """
+        known = [i for i in chunk_ids if i in self._row_of]
+        if not known:
+            return {}
+        rows = np.fromiter((self._row_of[i] for i in known), dtype=np.int32, count=len(known))
+        context_rows = self.context_rows(rows, context_level)
+        contents = {int(row): self._content_of(int(row)) for row in np.unique(context_rows)}
+        return {chunk_id: contents[int(row)] for chunk_id, row in zip(known, context_rows)}
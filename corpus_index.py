@@ -0,0 +1,667 @@
+# corpus_index.py
+"""
+One index for the whole corpus, updated in place as documents change.
+
+Per-document indexes stay the unit of embedding and the source of truth.
+build_corpus merges their vectors sidecars into a single index, so a query
+over any number of documents is one FAISS search:
+
+    vector_store/corpus/
+        corpus.faiss        vectors as of the last full build, under their slot numbers (ID map)
+        vectors.npy         the same vectors, row = slot, for compaction
+        chunks.sqlite       chunks:     slot -> chunk key, doc_id, chunk_id, level, content, metadata
+                            documents:  doc_id -> rows and version held
+                            delta:      vectors added since the build, by slot
+                            tombstones: slots deleted since the build
+        corpus.json         model, dimensions, index settings, spec and shard of the last build
+        build_report.json   as for per-document indexes (ann_index)
+
+A chunk's key is a hash of (doc_id, chunk_id). It does not depend on row
+order, so it stays the same across rebuilds, index types and re-embedding.
+FAISS ids are slots: append-only numbers for one version of a chunk's vector.
+Hits resolve through one indexed SQLite lookup; no _meta.json is parsed.
+
+Updates are keyed by chunk ID. CorpusIndex.update_document compares a
+re-embedded document with what the corpus holds:
+- new chunks, and chunks whose vector changed, get new slots;
+- removed and replaced slots are tombstoned;
+- unchanged chunks are not touched.
+One SQLite transaction records all of it. Tombstones are a bitmap over slots,
+applied inside the FAISS search as an ID selector, so deleted vectors never
+take a place in the top k. Other processes holding the corpus open apply the
+new delta rows and tombstones on their next search (refresh), without
+reloading the index.
+
+Filtered searches slow down as dead vectors accumulate (HNSW most), so past
+COMPACT_RATIO tombstones compaction rebuilds the corpus from its own live
+chunks: vectors.npy and the delta rows, less the tombstoned slots. Chunks
+deleted or upserted directly stay as they are; the sidecars are not read.
+It can run in a background thread; searches continue on the old index until
+the swap, and writes wait for it. An error in the background is logged and
+raised again by wait().
+
+A corpus can be one shard of a sharded store (sharded_index): it then holds
+only the documents that shard_of assigns to it, through builds, syncs and
+compactions alike.
+
+A document's recorded version is its manifest's modification time. Until the
+corpus is updated, CorpusIndex.covers() is False for a re-embedded document,
+and the search engine serves it from its own index. There is one writer at a
+time (ingest or the Embeddings page); any number of readers.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from ann_index import IndexSpec, build_ann_index, search_params, set_search_params
+from vector_compression import add_vectors, search as search_index, unwrap
+from vector_store import (INDEX_DIR, _write_faiss, _write_json, export_vectors, index_paths, load_index,
+                          load_manifest, load_metadata, load_vectors)
+
+logger = logging.getLogger("corpus_index")
+
+CORPUS_DIR = os.path.join(INDEX_DIR, "corpus")
+COMPACT_RATIO = 0.2  # tombstoned share of the index's vectors that triggers compaction
+_QUERY_BATCH = 500   # keys per SELECT, below SQLite's bound-parameter limit
+_SELECTOR_CACHE = 8
+
+_SCHEMA = """
+    CREATE TABLE chunks (
+        id INTEGER PRIMARY KEY,
+        key INTEGER NOT NULL UNIQUE,
+        doc_id TEXT NOT NULL,
+        chunk_id TEXT NOT NULL,
+        level TEXT,
+        content TEXT,
+        metadata TEXT,
+        digest BLOB
+    );
+    CREATE INDEX chunks_doc_id ON chunks (doc_id);
+    CREATE TABLE documents (doc_id TEXT PRIMARY KEY, doc_name TEXT, strategy TEXT, rows INTEGER, version REAL);
+    CREATE TABLE delta (id INTEGER PRIMARY KEY, vector BLOB NOT NULL);
+    CREATE TABLE tombstones (seq INTEGER PRIMARY KEY AUTOINCREMENT, id INTEGER NOT NULL UNIQUE);
+"""
+
+
+def chunk_key(doc_id: str, chunk_id: str) -> int:
+    """Stable non-negative 64-bit key of a chunk."""
+    digest = hashlib.blake2b(f"{doc_id}\0{chunk_id}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") & ((1 << 63) - 1)
+
+
+def shard_of(doc_id: str, shards: int) -> int:
+    """The shard (0..shards-1) that holds a document's chunks."""
+    digest = hashlib.blake2b(doc_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % shards
+
+
+def vector_digest(vector: np.ndarray) -> bytes:
+    """Fingerprint of a float32 vector, to tell re-embedded chunks that did not change."""
+    return hashlib.blake2b(np.ascontiguousarray(vector, dtype=np.float32).tobytes(), digest_size=8).digest()
+
+
+def corpus_paths(corpus_dir: str = CORPUS_DIR) -> Dict[str, str]:
+    return {
+        "index": os.path.join(corpus_dir, "corpus.faiss"),
+        "vectors": os.path.join(corpus_dir, "vectors.npy"),
+        "chunks": os.path.join(corpus_dir, "chunks.sqlite"),
+        "manifest": os.path.join(corpus_dir, "corpus.json"),
+        "report": os.path.join(corpus_dir, "build_report.json"),
+    }
+
+
+def build_corpus(index_dir: str = INDEX_DIR, spec: IndexSpec = IndexSpec(index_type="auto"),
+                 doc_ids: Optional[Iterable[str]] = None, corpus_dir: Optional[str] = None,
+                 embedding_model: Optional[str] = None, metric: str = "l2",
+                 shard: Optional[Tuple[int, int]] = None) -> Dict:
+    """
+    Merge the per-document indexes in `index_dir` (default: all) into one corpus index.
+    Only documents embedded with `embedding_model` (default: the model of most rows)
+    and the same width can share it; the others are listed under "skipped" in the
+    returned manifest. With `shard` = (i, n), only documents in shard i of n are taken.
+    The new corpus replaces the old one when complete.
+    """
+    corpus_dir = corpus_dir or os.path.join(index_dir, "corpus")
+    if doc_ids is None:
+        doc_ids = _indexed_documents(index_dir)
+    if shard is not None:
+        doc_ids = [doc_id for doc_id in doc_ids if shard_of(doc_id, shard[1]) == shard[0]]
+
+    manifests, skipped = load_document_manifests(index_dir, doc_ids)
+    embedding_model = embedding_model or majority_model(manifests)
+    for doc_id, manifest in list(manifests.items()):
+        if manifest["embedding_model"] != embedding_model:
+            skipped[doc_id] = f"embedded with {manifest['embedding_model']}, not {embedding_model}"
+            del manifests[doc_id]
+        elif manifest["rows"] == 0:
+            del manifests[doc_id]
+    if not manifests:
+        raise ValueError("No embedded documents to build a corpus index from")
+    dims = {m["vectors"]["dimensions"] for m in manifests.values()}
+    if len(dims) > 1:
+        raise ValueError(f"Documents embedded with {embedding_model} have different widths: {sorted(dims)}")
+
+    def source(doc_id, manifest):
+        doc_paths = index_paths(doc_id, index_dir)
+        version = os.path.getmtime(doc_paths["manifest"])
+
+        def load():
+            metadata = load_metadata(doc_paths["meta"])
+            vectors = load_vectors(doc_paths["manifest"])
+            chunks = [(chunk_key(doc_id, entry["chunk_id"]), *_entry_columns(entry), vector_digest(vector))
+                      for entry, vector in zip(metadata, vectors)]
+            first = metadata[0] if metadata else {}
+            return chunks, vectors, (first.get("doc_name", ""), first.get("strategy", ""), version)
+        return doc_id, manifest["rows"], load
+
+    sources = [source(doc_id, manifest) for doc_id, manifest in manifests.items()]
+    return _write_corpus(corpus_dir, sources, dims.pop(), spec, embedding_model, metric, shard, skipped)
+
+
+def _write_corpus(corpus_dir: str, sources: Sequence[Tuple], dimensions: int, spec: IndexSpec,
+                  embedding_model: str, metric: str, shard: Optional[Tuple[int, int]],
+                  skipped: Dict[str, str]) -> Dict:
+    """
+    Write a corpus from `sources`: (doc_id, rows, load) per document, where load() returns
+    (chunk rows as (key, chunk_id, level, content, metadata JSON, digest), row-aligned vectors,
+    (doc_name, strategy, version)). Built in a temporary directory that then replaces corpus_dir.
+    """
+    tmp_dir = corpus_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    paths = corpus_paths(tmp_dir)
+    total = sum(rows for _, rows, _ in sources)
+    # Base vectors by slot, memory-mapped: the build holds no more than the index in RAM,
+    # and compaction reads live vectors back from here
+    vectors = np.lib.format.open_memmap(paths["vectors"], mode="w+", dtype=np.float32, shape=(total, dimensions))
+    keys = np.empty(total, dtype=np.int64)
+
+    conn = sqlite3.connect(paths["chunks"])
+    conn.executescript(_SCHEMA)
+    row = 0
+    for doc_id, rows, load in sources:
+        chunks, doc_vectors, (doc_name, strategy, version) = load()
+        slots = range(row, row + rows)
+        vectors[slots.start:slots.stop] = doc_vectors
+        keys[slots.start:slots.stop] = [chunk[0] for chunk in chunks]
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         [(slot, chunk[0], doc_id, *chunk[1:]) for slot, chunk in zip(slots, chunks)])
+        conn.execute("INSERT INTO documents VALUES (?, ?, ?, ?, ?)", (doc_id, doc_name, strategy, rows, version))
+        row = slots.stop
+    conn.commit()
+    conn.close()
+    if len(np.unique(keys)) != total:
+        del vectors
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise ValueError("Duplicate chunk keys in the corpus (repeated chunk IDs within a document?)")
+    vectors.flush()
+
+    index, report = build_ann_index(vectors, spec, metric, ids=np.arange(total, dtype=np.int64))
+    _write_faiss(index, paths["index"])
+    _write_json(paths["report"], report)
+    manifest = {
+        "embedding_model": embedding_model,
+        "rows": total,
+        "documents": len(sources),
+        "dimensions": dimensions,
+        "index": {"file": os.path.basename(paths["index"]), "factory": report["factory"], "metric": metric,
+                  "search_params": search_params(index)},
+        "spec": spec._asdict(),
+        "shard": list(shard) if shard is not None else None,
+        "skipped": skipped,
+    }
+    _write_json(paths["manifest"], manifest)
+    del vectors
+
+    _swap_in(tmp_dir, corpus_dir)
+    return manifest
+
+
+def _swap_in(new_dir: str, corpus_dir: str):
+    """Replace corpus_dir with new_dir: the current one is moved aside first, then deleted."""
+    retired = corpus_dir + ".old"
+    shutil.rmtree(retired, ignore_errors=True)
+    if os.path.exists(corpus_dir):
+        os.replace(corpus_dir, retired)
+    os.replace(new_dir, corpus_dir)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def load_document_manifests(index_dir: str, doc_ids: Iterable[str]) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+    """({doc_id: manifest}, {doc_id: reason skipped}); legacy indexes get their sidecar first."""
+    manifests, skipped = {}, {}
+    for doc_id in doc_ids:
+        path = index_paths(doc_id, index_dir)["manifest"]
+        if not os.path.exists(path) and export_vectors(doc_id, index_dir) is None:
+            skipped[doc_id] = "no vectors sidecar; embed it again"
+            continue
+        manifests[doc_id] = load_manifest(path)
+    return manifests, skipped
+
+
+def majority_model(manifests: Dict[str, Dict]) -> Optional[str]:
+    """The embedding model of most rows across the manifests."""
+    rows_by_model: Dict[str, int] = {}
+    for manifest in manifests.values():
+        rows_by_model[manifest["embedding_model"]] = rows_by_model.get(manifest["embedding_model"], 0) + \
+            manifest["rows"]
+    return max(rows_by_model, key=rows_by_model.get) if rows_by_model else None
+
+
+def current_corpus(corpus_dir: str, loaded: Optional["CorpusIndex"] = None) -> Optional["CorpusIndex"]:
+    """
+    `loaded` brought up to date with `corpus_dir`: reloaded after a build or compaction,
+    refreshed after in-place updates. None if there is no corpus there.
+    """
+    path = corpus_paths(corpus_dir)["manifest"]
+    if not os.path.exists(path):
+        return None
+    if loaded is None or loaded.version != os.path.getmtime(path):
+        return CorpusIndex(corpus_dir)
+    loaded.refresh()
+    return loaded
+
+
+def sync_corpus(index_dir: str = INDEX_DIR, corpus_dir: Optional[str] = None,
+                compact: bool = True) -> Optional[Dict[str, int]]:
+    """
+    Bring an existing corpus index up to date with the per-document indexes, then compact
+    it if needed (waiting for the rebuild). Returns update counts, or None without a corpus.
+    """
+    corpus_dir = corpus_dir or os.path.join(index_dir, "corpus")
+    if not os.path.exists(corpus_paths(corpus_dir)["manifest"]):
+        return None
+    corpus = CorpusIndex(corpus_dir, writable=True)
+    try:
+        counts = corpus.sync(index_dir)
+        counts["compacted"] = int(compact and corpus.tombstone_ratio > COMPACT_RATIO)
+        if counts["compacted"]:
+            corpus.compact()
+    finally:
+        corpus.close()
+    return counts
+
+
+class CorpusIndex:
+    """
+    A loaded corpus index with its chunk table. Opened `writable`, it also updates the
+    corpus; readers pick those updates up with refresh().
+    """
+
+    def __init__(self, corpus_dir: str = CORPUS_DIR, writable: bool = False):
+        self.corpus_dir = corpus_dir
+        self.writable = writable
+        self.lock = threading.RLock()  # FAISS indexes are not safe to search while vectors are added
+        self._writer = threading.RLock()  # held by writes, and by compaction from snapshot to swap
+        self._compaction: Optional[threading.Thread] = None
+        self._compaction_error: Optional[BaseException] = None
+        self._load()
+
+    def _load(self):
+        paths = corpus_paths(self.corpus_dir)
+        self.manifest = load_manifest(paths["manifest"])
+        self.version = os.path.getmtime(paths["manifest"])
+        self.index = load_index(paths["index"])
+        set_search_params(self.index, **self.manifest["index"].get("search_params", {}))
+        self.metric = self.manifest["index"]["metric"]
+        self.embedding_model = self.manifest["embedding_model"]
+        self.shard = tuple(self.manifest["shard"]) if self.manifest.get("shard") else None
+        # Streamlit runs reruns on different threads; access goes through self.lock
+        mode = "rw" if self.writable else "ro"
+        self.conn = sqlite3.connect(f"file:{paths['chunks']}?mode={mode}", uri=True, check_same_thread=False)
+        self.tombstones = np.zeros(0, dtype=np.uint8)  # one bit per slot, little-endian as FAISS reads it
+        self.dead = 0
+        self.next_slot = self.manifest["rows"]
+        self.documents: Dict[str, float] = {}  # doc_id -> version held
+        self._last_tombstone = 0
+        self._data_version = None
+        self._selectors: Dict[Tuple[str, ...], faiss.IDSelector] = {}
+        self._live = None
+        self.refresh()
+
+    def close(self):
+        try:
+            self.wait()
+        finally:
+            self.conn.close()
+
+    @property
+    def doc_ids(self) -> List[str]:
+        return list(self.documents)
+
+    @property
+    def tombstone_ratio(self) -> float:
+        return self.dead / max(self.index.ntotal, 1)
+
+    def covers(self, doc_id: str, index_dir: str = INDEX_DIR) -> bool:
+        """True if the corpus holds the current embedding of `doc_id`."""
+        version = self.documents.get(doc_id)
+        path = index_paths(doc_id, index_dir)["manifest"]
+        return version is not None and os.path.exists(path) and os.path.getmtime(path) == version
+
+    def refresh(self) -> bool:
+        """Apply vectors added and deleted (by any writer) since the last refresh; True if any were."""
+        with self.lock:
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return False
+            self._data_version = data_version
+            self._apply()
+            return True
+
+    def _apply(self):
+        # Delta rows are kept after a tombstone, so slots are never handed out twice
+        rows = self.conn.execute("SELECT id, vector FROM delta WHERE id >= ? ORDER BY id",
+                                 (self.next_slot,)).fetchall()
+        if rows:
+            vectors = np.frombuffer(b"".join(vector for _, vector in rows), dtype=np.float32)
+            add_vectors(self.index, vectors.reshape(len(rows), -1), np.array([s for s, _ in rows], dtype=np.int64))
+            self.next_slot = rows[-1][0] + 1
+        dead = self.conn.execute("SELECT seq, id FROM tombstones WHERE seq > ? ORDER BY seq",
+                                 (self._last_tombstone,)).fetchall()
+        if dead:
+            slots = np.array([slot for _, slot in dead], dtype=np.int64)
+            if len(self.tombstones) * 8 < self.next_slot:
+                grown = np.zeros((self.next_slot + 7) // 8, dtype=np.uint8)
+                grown[:len(self.tombstones)] = self.tombstones
+                self.tombstones = grown
+            np.bitwise_or.at(self.tombstones, slots >> 3, (1 << (slots & 7)).astype(np.uint8))
+            self.dead += len(dead)
+            self._last_tombstone = dead[-1][0]
+        self.documents = dict(self.conn.execute("SELECT doc_id, version FROM documents"))
+        self._selectors.clear()
+        self._live = None
+
+    def search(self, query_vector: np.ndarray, k: int, doc_ids: Optional[Sequence[str]] = None,
+               nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(distances, slots) of the `k` nearest live chunks, within `doc_ids` if given; -1 slots dropped."""
+        with self.lock:
+            default = search_params(self.index)
+            set_search_params(self.index, nprobe, ef_search)
+            try:
+                if doc_ids is None:
+                    distances, slots = self._search(query_vector, k, self._live_selector() if self.dead else None)
+                else:
+                    distances, slots = self._search(query_vector, k, self._selector(tuple(sorted(doc_ids))))
+            finally:
+                set_search_params(self.index, **default)
+        keep = slots >= 0
+        return distances[keep], slots[keep]
+
+    def _search(self, query_vector, k, selector):
+        if selector is None:
+            distances, slots = search_index(self.index, query_vector, k)
+            return distances[0], slots[0]
+        if isinstance(self.index, faiss.IndexBinary):
+            # Binary indexes take no search parameters: over-fetch, then keep the selected slots
+            distances, slots = search_index(self.index, query_vector, min(self.index.ntotal, k * 10 + self.dead))
+            distances, slots = distances[0], slots[0]
+            if hasattr(selector, "slots"):
+                mask = np.isin(slots, selector.slots)
+            else:
+                mask = (slots >= 0) & ~self._is_dead(slots)
+            return distances[mask][:k], slots[mask][:k]
+        inner = unwrap(self.index)
+        if isinstance(inner, faiss.IndexIVF):
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=inner.nprobe)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        query_vector = np.ascontiguousarray(np.atleast_2d(query_vector), dtype=np.float32)
+        distances, slots = self.index.search(query_vector, k, params=params)
+        return distances[0], slots[0]
+
+    def _is_dead(self, slots: np.ndarray) -> np.ndarray:
+        byte = np.clip(slots >> 3, 0, max(len(self.tombstones) - 1, 0))
+        inside = (slots >= 0) & (slots >> 3 < len(self.tombstones))
+        return inside & (self.tombstones[byte] >> (slots & 7) & 1).astype(bool)
+
+    def _live_selector(self):
+        """Every slot whose tombstone bit is clear (slots past the bitmap are live)."""
+        if self._live is None:
+            bitmap = faiss.IDSelectorBitmap(len(self.tombstones), faiss.swig_ptr(self.tombstones))
+            self._live = faiss.IDSelectorNot(bitmap)
+            self._live.bitmap, self._live.bits = bitmap, self.tombstones  # keep both alive with the selector
+        return self._live
+
+    def _slots(self, doc_ids: Tuple[str, ...]) -> np.ndarray:
+        slots = []
+        for i in range(0, len(doc_ids), _QUERY_BATCH):
+            batch = doc_ids[i:i + _QUERY_BATCH]
+            slots += [slot for slot, in self.conn.execute(
+                f"SELECT id FROM chunks WHERE doc_id IN ({','.join('?' * len(batch))})", batch)]
+        return np.asarray(slots, dtype=np.int64)
+
+    def _selector(self, doc_ids: Tuple[str, ...]):
+        """ID selector over the documents' live slots; the last few are kept for repeated filters."""
+        if doc_ids not in self._selectors:
+            if len(self._selectors) >= _SELECTOR_CACHE:
+                self._selectors.pop(next(iter(self._selectors)))
+            slots = self._slots(doc_ids)
+            self._selectors[doc_ids] = faiss.IDSelectorBatch(len(slots), faiss.swig_ptr(slots))
+            self._selectors[doc_ids].slots = slots  # keep the array alive with the selector
+        return self._selectors[doc_ids]
+
+    def lookup(self, slots: Iterable[int]) -> Dict[int, Dict]:
+        """Chunk entries (doc_id, chunk_id, level, content, metadata) by slot, in one query per 500 slots."""
+        slots = [int(s) for s in slots]
+        found = {}
+        with self.lock:
+            for i in range(0, len(slots), _QUERY_BATCH):
+                batch = slots[i:i + _QUERY_BATCH]
+                for slot, doc_id, chunk_id, level, content, metadata in self.conn.execute(
+                        f"SELECT id, doc_id, chunk_id, level, content, metadata FROM chunks "
+                        f"WHERE id IN ({','.join('?' * len(batch))})", batch):
+                    found[slot] = {"doc_id": doc_id, "chunk_id": chunk_id, "level": level, "content": content,
+                                   "metadata": json.loads(metadata)}
+        return found
+
+    def update_document(self, doc_id: str, index_dir: str = INDEX_DIR) -> Dict[str, int]:
+        """
+        Make the corpus hold the document's current per-document index. Only its new,
+        changed and removed chunks are written. Returns counts of each.
+        """
+        paths = index_paths(doc_id, index_dir)
+        manifest = load_manifest(paths["manifest"])
+        if manifest["embedding_model"] != self.embedding_model:
+            raise ValueError(f"{doc_id} is embedded with {manifest['embedding_model']}, "
+                             f"the corpus with {self.embedding_model}")
+        if manifest["vectors"]["dimensions"] != self.manifest["dimensions"]:
+            raise ValueError(f"{doc_id} has {manifest['vectors']['dimensions']} dimensions, "
+                             f"the corpus {self.manifest['dimensions']}")
+        metadata = load_metadata(paths["meta"])
+        return self.upsert_document(doc_id, metadata, load_vectors(paths["manifest"]),
+                                    os.path.getmtime(paths["manifest"]))
+
+    def upsert_document(self, doc_id: str, metadata: Sequence[Dict], vectors: np.ndarray,
+                        version: float) -> Dict[str, int]:
+        """Replace the document's chunks with `metadata` (entries as in _meta.json) and row-aligned `vectors`."""
+        self._check_writable()
+        with self._writer, self.lock:
+            held = {chunk_id: (slot, digest) for slot, chunk_id, digest in self.conn.execute(
+                "SELECT id, chunk_id, digest FROM chunks WHERE doc_id = ?", (doc_id,))}
+            keep = {entry["chunk_id"] for entry in metadata}
+            stale = [slot for chunk_id, (slot, _) in held.items() if chunk_id not in keep]
+            counts = {"added": 0, "updated": 0, "deleted": len(stale), "unchanged": 0}
+            inserts, unchanged = [], []
+            for entry, vector in zip(metadata, vectors):
+                digest = vector_digest(vector)
+                slot, held_digest = held.get(entry["chunk_id"], (None, None))
+                if digest == held_digest:
+                    counts["unchanged"] += 1
+                    unchanged.append((*_entry_columns(entry)[1:], slot))
+                    continue
+                if slot is not None:
+                    stale.append(slot)
+                    counts["updated"] += 1
+                else:
+                    counts["added"] += 1
+                inserts.append((entry, vector, digest))
+
+            with self.conn:
+                self._tombstone(stale)
+                # Text and metadata may change without the vector (e.g. a heading fix)
+                self.conn.executemany("UPDATE chunks SET level = ?, content = ?, metadata = ? WHERE id = ?",
+                                      unchanged)
+                slots = range(self.next_slot, self.next_slot + len(inserts))
+                self.conn.executemany("INSERT INTO delta VALUES (?, ?)", [
+                    (slot, np.ascontiguousarray(vector, dtype=np.float32).tobytes())
+                    for slot, (_, vector, _) in zip(slots, inserts)])
+                self.conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+                    (slot, chunk_key(doc_id, entry["chunk_id"]), doc_id, *_entry_columns(entry), digest)
+                    for slot, (entry, _, digest) in zip(slots, inserts)])
+                _record_document(self.conn, doc_id, metadata, version)
+            self._apply()
+        return counts
+
+    def delete_document(self, doc_id: str) -> int:
+        """Tombstone every chunk of the document; returns how many."""
+        self._check_writable()
+        with self._writer, self.lock:
+            stale = [slot for slot, in self.conn.execute("SELECT id FROM chunks WHERE doc_id = ?", (doc_id,))]
+            with self.conn:
+                self._tombstone(stale)
+                self.conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self._apply()
+        return len(stale)
+
+    def delete_chunks(self, doc_id: str, chunk_ids: Iterable[str]) -> int:
+        """Tombstone the given chunks of a document; returns how many were held."""
+        self._check_writable()
+        keys = [chunk_key(doc_id, chunk_id) for chunk_id in chunk_ids]
+        with self._writer, self.lock:
+            stale = []
+            for i in range(0, len(keys), _QUERY_BATCH):
+                batch = keys[i:i + _QUERY_BATCH]
+                stale += [slot for slot, in self.conn.execute(
+                    f"SELECT id FROM chunks WHERE key IN ({','.join('?' * len(batch))})", batch)]
+            with self.conn:
+                self._tombstone(stale)
+                self.conn.execute("UPDATE documents SET rows = rows - ? WHERE doc_id = ?", (len(stale), doc_id))
+            self._apply()
+        return len(stale)
+
+    def _tombstone(self, slots: List[int]):
+        """Within the caller's transaction: mark the slots dead and drop their chunk rows."""
+        self.conn.executemany("INSERT INTO tombstones (id) VALUES (?)", [(slot,) for slot in slots])
+        self.conn.executemany("DELETE FROM chunks WHERE id = ?", [(slot,) for slot in slots])
+
+    def sync(self, index_dir: str = INDEX_DIR) -> Dict[str, int]:
+        """
+        Update every document whose per-document index changed since the corpus took it,
+        add new ones embedded with the corpus model, and delete those whose index is gone
+        (or now holds another model: the search engine then uses the document's own index).
+        """
+        counts = {"documents": 0, "added": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+        current = _indexed_documents(index_dir)
+        if self.shard is not None:
+            current = [doc_id for doc_id in current if shard_of(doc_id, self.shard[1]) == self.shard[0]]
+        for doc_id in set(self.documents) - set(current):
+            counts["deleted"] += self.delete_document(doc_id)
+            counts["documents"] += 1
+        for doc_id in current:
+            path = index_paths(doc_id, index_dir)["manifest"]
+            if self.covers(doc_id, index_dir) or not os.path.exists(path):
+                continue
+            manifest = load_manifest(path)
+            if manifest["embedding_model"] != self.embedding_model or \
+                    manifest["vectors"]["dimensions"] != self.manifest["dimensions"]:
+                if doc_id in self.documents:
+                    counts["deleted"] += self.delete_document(doc_id)
+                    counts["documents"] += 1
+                continue
+            for name, count in self.update_document(doc_id, index_dir).items():
+                counts[name] += count
+            counts["documents"] += 1
+        return counts
+
+    def compact(self, background: bool = False):
+        """
+        Rebuild the corpus from its live chunks, without the tombstoned vectors; slots are
+        renumbered, keys, digests and document versions kept. In the `background`, searches
+        keep using the current index until the new one is swapped in; wait() joins.
+        """
+        self._check_writable()
+        if background:
+            if self._compaction is None or not self._compaction.is_alive():
+                self._compaction = threading.Thread(target=self._compact_in_background, daemon=True)
+                self._compaction.start()
+            return
+        paths = corpus_paths(self.corpus_dir)
+        if not os.path.exists(paths["vectors"]):
+            raise ValueError(f"{self.corpus_dir} has no vectors.npy to compact from; rebuild it with build_corpus")
+        with self._writer:
+            spec = IndexSpec(**self.manifest.get("spec", {}))
+            base = np.load(paths["vectors"], mmap_mode="r")
+            built = self.manifest["rows"]
+            # A connection of its own, so searches can keep using self.conn meanwhile
+            conn = sqlite3.connect(f"file:{paths['chunks']}?mode=ro", uri=True, check_same_thread=False)
+
+            def source(doc_id, doc_name, strategy, version, rows):
+                def load():
+                    chunks, vectors = [], np.empty((rows, self.manifest["dimensions"]), dtype=np.float32)
+                    for row, (slot, *chunk, vector) in enumerate(conn.execute(
+                            "SELECT c.id, c.key, c.chunk_id, c.level, c.content, c.metadata, c.digest, d.vector "
+                            "FROM chunks c LEFT JOIN delta d ON d.id = c.id WHERE c.doc_id = ? ORDER BY c.id",
+                            (doc_id,))):
+                        chunks.append(tuple(chunk))
+                        vectors[row] = base[slot] if slot < built else np.frombuffer(vector, dtype=np.float32)
+                    return chunks, vectors, (doc_name, strategy, version)
+                return doc_id, rows, load
+
+            try:
+                sources = [source(*document) for document in conn.execute(
+                    "SELECT d.doc_id, d.doc_name, d.strategy, d.version, COUNT(c.id) FROM documents d "
+                    "LEFT JOIN chunks c ON c.doc_id = d.doc_id GROUP BY d.doc_id ORDER BY d.doc_id")]
+                staging = self.corpus_dir + ".next"
+                _write_corpus(staging, sources, self.manifest["dimensions"], spec, self.embedding_model,
+                              self.metric, self.shard, self.manifest.get("skipped", {}))
+            finally:
+                conn.close()
+                del base
+            with self.lock:
+                self.conn.close()
+                _swap_in(staging, self.corpus_dir)
+                self._load()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except BaseException as e:
+            logger.exception("Background compaction of %s failed", self.corpus_dir)
+            self._compaction_error = e
+
+    def wait(self):
+        """Wait for a background compaction to finish; raises the error it failed with, if any."""
+        if self._compaction is not None and self._compaction is not threading.current_thread():
+            self._compaction.join()
+        error, self._compaction_error = self._compaction_error, None
+        if error is not None:
+            raise error
+
+    def _check_writable(self):
+        if not self.writable:
+            raise ValueError("The corpus index was opened read-only")
+
+
+def _indexed_documents(index_dir: str) -> List[str]:
+    return sorted(f[:-len("_index.faiss")] for f in os.listdir(index_dir) if f.endswith("_index.faiss"))
+
+
+def _entry_columns(entry: Dict) -> Tuple:
+    """(chunk_id, level, content, metadata JSON) of a _meta.json entry."""
+    return (entry["chunk_id"], entry.get("level", ""), entry["content"],
+            json.dumps(entry.get("metadata", {}), ensure_ascii=False))
+
+
+def _record_document(conn: sqlite3.Connection, doc_id: str, metadata: Sequence[Dict], version: float):
+    first = metadata[0] if metadata else {}
+    conn.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?)",
+                 (doc_id, first.get("doc_name", ""), first.get("strategy", ""), len(metadata), version))
@@ -0,0 +1,222 @@
+# embedding_backends.py
+"""
+Pluggable embedding backends.
+
+Every backend has a `name` (the embedding model recorded with the index and
+used as the embedding cache key) and an async `embed(texts, progress)` that
+returns an EmbeddingResult in input order:
+
+    OpenAIBackend               OpenAI-compatible API, via embed_texts_async
+    SentenceTransformerBackend  local sentence-transformers model, no service needed
+    HashingEmbedder             deterministic feature hashing, for hermetic tests
+
+Local backends encode in length-sorted buckets: texts are ordered by length
+and encoded `batch_size` at a time, so each batch pads to a similar length.
+Vectors are written back to their original rows.
+
+A backend can produce shortened vectors. OpenAI models pass `dimensions` to the
+API; local models truncate and re-normalise (vector_compression.reduce_dimensions).
+The backend name then carries the width, e.g. "text-embedding-3-small@512". The
+name is recorded with the index and keys the embedding cache, and create_backend
+accepts it back.
+"""
+import asyncio
+import hashlib
+import os
+import re
+from functools import lru_cache
+from typing import Callable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from embeddings import (DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE, MODEL_DIMENSIONS,
+                        AsyncStubEmbeddingsClient, EmbeddingResult, RateLimiter, embed_texts_async)
+from vector_compression import reduce_dimensions
+
+TOKEN_PATTERN = re.compile(r"\w+")
+OPENAI_MODELS = ("text-embedding-3-small", "text-embedding-3-large")
+
+
+class EmbeddingBackend:
+    name = ""
+
+    async def embed(self, texts: Sequence[str],
+                    progress: Optional[Callable[[int, int], None]] = None) -> EmbeddingResult:
+        raise NotImplementedError
+
+
+class OpenAIBackend(EmbeddingBackend):
+    """Remote embeddings through an async OpenAI-compatible client."""
+
+    def __init__(self, client, model: str, concurrency: int = 8, limiter: Optional[RateLimiter] = None,
+                 dimensions: Optional[int] = None):
+        if dimensions and not 0 < dimensions <= MODEL_DIMENSIONS.get(model, dimensions):
+            raise ValueError(f"{model} supports at most {MODEL_DIMENSIONS[model]} dimensions")
+        self.client = client
+        self.model = model
+        self.dimensions = dimensions
+        self.name = backend_name(model, dimensions)
+        self.concurrency = concurrency
+        self.limiter = limiter
+
+    async def embed(self, texts, progress=None) -> EmbeddingResult:
+        return await embed_texts_async(self.client, texts, self.model, concurrency=self.concurrency,
+                                       limiter=self.limiter, progress=progress, dimensions=self.dimensions)
+
+
+class LocalBackend(EmbeddingBackend):
+    """
+    In-process backends; subclasses implement `_encode_batch`.
+    `output_dimensions` truncates and re-normalises what `embed` returns.
+    """
+
+    def __init__(self, batch_size: int = 64, float16: bool = False, sort_by_length: bool = True,
+                 output_dimensions: Optional[int] = None):
+        self.batch_size = batch_size
+        self.dtype = np.float16 if float16 else np.float32
+        self.sort_by_length = sort_by_length
+        self.output_dimensions = output_dimensions
+
+    def encode(self, texts: Sequence[str],
+               progress: Optional[Callable[[int, int], None]] = None) -> np.ndarray:
+        """(len(texts), dim) matrix in input order, float16 if the backend was built with float16=True."""
+        if self.sort_by_length:
+            order = np.argsort(np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts)),
+                               kind="stable")
+        else:
+            order = np.arange(len(texts))
+        matrix = np.empty((len(texts), self.dimensions), dtype=self.dtype)
+        for start in range(0, len(texts), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            matrix[rows] = self._encode_batch([texts[i] for i in rows])
+            if progress:
+                progress(min(start + self.batch_size, len(texts)), len(texts))
+        return matrix
+
+    async def embed(self, texts, progress=None) -> EmbeddingResult:
+        # Encoding runs in a thread so other coroutines (e.g. pipeline stages) keep going;
+        # each batch's progress is handed back to the event loop, where callbacks run
+        on_batch = None
+        if progress:
+            loop = asyncio.get_running_loop()
+            on_batch = lambda done, total: loop.call_soon_threadsafe(progress, done, total)
+        matrix = await asyncio.to_thread(self.encode, texts, on_batch)
+        matrix = reduce_dimensions(matrix, self.output_dimensions)
+        return EmbeddingResult(matrix, np.ones(len(texts), dtype=np.bool_), [], 0)
+
+    @property
+    def dimensions(self) -> int:
+        raise NotImplementedError
+
+    def _encode_batch(self, texts: Sequence[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class SentenceTransformerBackend(LocalBackend):
+    """
+    A sentence-transformers model on the local machine (CPU by default).
+    `threads` caps torch's intra-op threads; vectors are L2-normalised unless normalize=False.
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", batch_size: int = 64,
+                 threads: Optional[int] = None, float16: bool = False, device: str = "cpu",
+                 normalize: bool = True, sort_by_length: bool = True, output_dimensions: Optional[int] = None):
+        super().__init__(batch_size, float16, sort_by_length, output_dimensions)
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("SentenceTransformerBackend needs sentence-transformers "
+                              "(pip install sentence-transformers)") from e
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.name = backend_name(model_name, output_dimensions)
+        self.normalize = normalize
+        self.model = SentenceTransformer(model_name, device=device)
+
+    @property
+    def dimensions(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def _encode_batch(self, texts):
+        return self.model.encode(list(texts), batch_size=len(texts), convert_to_numpy=True,
+                                 normalize_embeddings=self.normalize, show_progress_bar=False)
+
+
+class HashingEmbedder(LocalBackend):
+    """
+    Deterministic bag-of-words vectors: each lowercased word is hashed to a signed
+    bucket and the counts are L2-normalised. Texts sharing words score as similar,
+    so retrieval behaves sensibly in tests, with no model download or service.
+    """
+
+    def __init__(self, dimensions: int = 384, batch_size: int = 256, float16: bool = False,
+                 output_dimensions: Optional[int] = None):
+        super().__init__(batch_size, float16, output_dimensions=output_dimensions)
+        self._dimensions = dimensions
+        self.name = backend_name(f"hashing-{dimensions}", output_dimensions)
+
+    @property
+    def dimensions(self) -> int:
+        return self._dimensions
+
+    def _encode_batch(self, texts):
+        out = np.zeros((len(texts), self._dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in TOKEN_PATTERN.findall(text.lower()):
+                bucket, sign = _token_bucket(token, self._dimensions)
+                out[row, bucket] += sign
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+def backend_name(model: str, dimensions: Optional[int] = None) -> str:
+    """Backend name for `model` producing `dimensions`-wide vectors (None: the model's own width)."""
+    return f"{model}@{dimensions}" if dimensions else model
+
+
+def split_backend_name(name: str) -> Tuple[str, Optional[int]]:
+    """Inverse of backend_name: "text-embedding-3-small@512" -> ("text-embedding-3-small", 512)."""
+    model, _, dimensions = name.partition("@")
+    return model, int(dimensions) if dimensions else None
+
+
+@lru_cache(maxsize=1 << 16)
+def _token_bucket(token: str, dimensions: int):
+    h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+    return h % dimensions, 1.0 if (h >> 63) & 1 else -1.0
+
+
+def create_backend(model: str, batch_size: Optional[int] = None, concurrency: int = 8,
+                   requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                   tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+                   threads: Optional[int] = None, float16: bool = False,
+                   dimensions: Optional[int] = None) -> EmbeddingBackend:
+    """
+    Backend for a model name: an OpenAI model, "hashing" / "hashing-<dim>", or else a
+    sentence-transformers model, optionally with "@<dimensions>" (or `dimensions`) for
+    shortened vectors. OpenAI models read OPENAI_API_KEY, or use the offline stub when
+    EMBEDDINGS_STUB is set; a missing key raises ValueError.
+    """
+    model, named_dimensions = split_backend_name(model)
+    dimensions = dimensions or named_dimensions
+    if model in OPENAI_MODELS:
+        if os.getenv("EMBEDDINGS_STUB"):
+            client = AsyncStubEmbeddingsClient(latency=0.0)
+        elif os.getenv("OPENAI_API_KEY"):
+            from openai import AsyncOpenAI
+            # Retries and backoff are handled by embed_texts_async, in step with the rate limiter
+            client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        else:
+            raise ValueError("OPENAI_API_KEY not found in .env. Please set it.")
+        return OpenAIBackend(client, model, concurrency=concurrency,
+                             limiter=RateLimiter(requests_per_minute, tokens_per_minute), dimensions=dimensions)
+
+    options = {"float16": float16, "output_dimensions": dimensions}
+    if batch_size:
+        options["batch_size"] = batch_size
+    if model == "hashing" or model.startswith("hashing-"):
+        dimensions = int(model.split("-", 1)[1]) if "-" in model else 384
+        return HashingEmbedder(dimensions, **options)
+    return SentenceTransformerBackend(model, threads=threads, **options)
@@ -0,0 +1,196 @@
+# embedding_cache.py
+"""
+On-disk embedding cache keyed by (embedding model, sha256 of the text).
+
+Vectors live in a SQLite table as raw float32 bytes. Every hit refreshes the
+entry's last-used stamp, and once the stored vectors exceed `max_bytes` the
+least recently used entries are evicted. Identical text gets the same key
+wherever it appears, so repeated sentences across documents and strategies,
+and re-runs over an unchanged corpus, are served without API calls.
+
+    cache = EmbeddingCache("vector_store/embedding_cache.sqlite")
+    result = asyncio.run(embed_with_cache(cache, backend, texts))
+"""
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from embedding_backends import EmbeddingBackend
+from embeddings import MODEL_DIMENSIONS, EmbeddingResult
+
+DEFAULT_MAX_BYTES = 1 << 30  # 1 GiB of vectors
+_QUERY_BATCH = 500           # keys per SELECT, below SQLite's bound-parameter limit
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """Size-bounded LRU cache of embedding vectors in a SQLite file."""
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # embed_with_cache calls in from worker threads, one at a time through self.lock
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                content_hash BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, content_hash)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.conn.commit()
+        self._bytes = self.conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, texts: Sequence[str]) -> Tuple[Dict[int, np.ndarray], np.ndarray]:
+        """
+        Look up every text. Returns ({row: vector} for the hits, bool mask of hits);
+        hits count as recently used.
+        """
+        with self.lock:
+            hashes = [content_hash(t) for t in texts]
+            found: Dict[bytes, np.ndarray] = {}
+            unique = list(dict.fromkeys(hashes))
+            for i in range(0, len(unique), _QUERY_BATCH):
+                batch = unique[i:i + _QUERY_BATCH]
+                rows = self.conn.execute(
+                    f"SELECT content_hash, vector FROM embeddings WHERE model = ? "
+                    f"AND content_hash IN ({','.join('?' * len(batch))})", [model, *batch])
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+
+            if found:
+                now = time.time()
+                self.conn.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND content_hash = ?",
+                                      [(now, model, key) for key in found])
+                self.conn.commit()
+
+            vectors = {row: found[key] for row, key in enumerate(hashes) if key in found}
+            mask = np.zeros(len(texts), dtype=np.bool_)
+            mask[list(vectors)] = True
+            self.hits += len(vectors)
+            self.misses += len(texts) - len(vectors)
+            return vectors, mask
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: np.ndarray):
+        """Store one vector per text, then evict least recently used entries if over budget."""
+        with self.lock:
+            now = time.time()
+            rows = [(model, content_hash(t), np.asarray(v, dtype=np.float32).tobytes(), now)
+                    for t, v in zip(texts, vectors)]
+            if not rows:
+                return
+            replaced = self._stored_bytes(model, [r[1] for r in rows])
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self.conn.commit()
+            self._bytes += sum(len(r[2]) for r in dict((r[1], r) for r in rows).values()) - replaced
+            if self._bytes > self.max_bytes:
+                self.evict(self.max_bytes)
+
+    def evict(self, target_bytes: int):
+        """Drop least recently used entries until the vectors fit in `target_bytes`."""
+        with self.lock:
+            while self._bytes > target_bytes:
+                oldest = self.conn.execute(
+                    "SELECT model, content_hash, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT ?",
+                    (_QUERY_BATCH,)).fetchall()
+                if not oldest:
+                    break
+                doomed = []
+                for model, key, size in oldest:
+                    if self._bytes <= target_bytes:
+                        break
+                    doomed.append((model, key))
+                    self._bytes -= size
+                self.conn.executemany("DELETE FROM embeddings WHERE model = ? AND content_hash = ?", doomed)
+                self.evictions += len(doomed)
+            self.conn.commit()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": self._bytes,
+            }
+
+    def close(self):
+        self.conn.close()
+
+    def _stored_bytes(self, model: str, hashes: List[bytes]) -> int:
+        total = 0
+        unique = list(dict.fromkeys(hashes))
+        for i in range(0, len(unique), _QUERY_BATCH):
+            batch = unique[i:i + _QUERY_BATCH]
+            total += self.conn.execute(
+                f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE model = ? "
+                f"AND content_hash IN ({','.join('?' * len(batch))})", [model, *batch]).fetchone()[0]
+        return total
+
+
+async def embed_with_cache(cache: EmbeddingCache, backend: EmbeddingBackend, texts: Sequence[str],
+                           progress: Optional[Callable[[int, int], None]] = None) -> EmbeddingResult:
+    """
+    Embed, with `backend`, only the texts the cache does not have under `backend.name`,
+    each distinct text once. New vectors are added to the cache; the result covers all
+    `texts`, in order. `failed` then lists runs of consecutive rows that could not be embedded.
+    """
+    model = backend.name
+    # SQLite calls run in a thread, off the event loop that drives the other requests
+    cached, hit = await asyncio.to_thread(cache.get_many, model, texts)
+
+    # Distinct missing texts, each embedded once however often it repeats
+    missing = list(dict.fromkeys(texts[row] for row in np.flatnonzero(~hit)))
+    if missing:
+        result = await backend.embed(missing, progress)
+        new_rows = np.flatnonzero(result.embedded)
+        await asyncio.to_thread(cache.put_many, model, [missing[i] for i in new_rows], result.matrix[new_rows])
+        errors = {missing[i]: error for start, end, error in result.failed for i in range(start, end)}
+        requests = result.requests
+    else:
+        result, errors, requests = None, {}, 0
+
+    if cached:
+        dim = len(next(iter(cached.values())))
+    else:
+        dim = result.matrix.shape[1] if result is not None else MODEL_DIMENSIONS.get(model, 0)
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    embedded = hit.copy()
+    for row, vector in cached.items():
+        matrix[row] = vector
+    if result is not None:
+        position = {text: i for i, text in enumerate(missing)}
+        for row in np.flatnonzero(~hit):
+            i = position[texts[row]]
+            if result.embedded[i]:
+                matrix[row] = result.matrix[i]
+                embedded[row] = True
+
+    failed = []
+    for row in np.flatnonzero(~embedded):
+        error = errors.get(texts[row], "not embedded")
+        if failed and failed[-1][1] == row and failed[-1][2] == error:
+            failed[-1] = (failed[-1][0], row + 1, error)
+        else:
+            failed.append((int(row), int(row) + 1, error))
+    return EmbeddingResult(matrix, embedded, failed, requests)
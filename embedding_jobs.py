@@ -0,0 +1,166 @@
+# embedding_jobs.py
+"""
+Resumable, checkpointed embedding jobs.
+
+An EmbeddingJob embeds its chunks a segment at a time (`checkpoint_every`
+request-sized batches). After each segment the new vectors are written to
+a shard file in the job directory, and a line listing their chunk IDs is
+appended to the manifest. A job that is stopped, crashes or loses its
+browser session resumes from the last checkpoint: chunks already listed
+in the manifest are not embedded again.
+
+    job_dir/
+        job.json          embedding model and a fingerprint of the input
+        manifest.jsonl    one line per shard: {"shard": ..., "ids": [...]}
+        shard_00000.npy   float32 vectors, rows in the order of that line's ids
+
+The fingerprint covers every chunk ID and text. If the input changes, the job
+starts over; with an embedding cache underneath, only the changed chunks cost
+API calls.
+"""
+import hashlib
+import json
+import os
+import shutil
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+from embedding_backends import EmbeddingBackend
+from embedding_cache import EmbeddingCache, embed_with_cache
+from embeddings import MAX_INPUTS_PER_REQUEST, EmbeddingResult, count_tokens, plan_batches, truncate_to_tokens
+
+MANIFEST = "manifest.jsonl"
+JOB_FILE = "job.json"
+
+
+def input_fingerprint(chunk_ids: Sequence[str], texts: Sequence[str]) -> str:
+    h = hashlib.sha256()
+    for chunk_id, text in zip(chunk_ids, texts):
+        h.update(chunk_id.encode("utf-8") + b"\0" + text.encode("utf-8") + b"\0")
+    return h.hexdigest()
+
+
+class EmbeddingJob:
+    """Embed `texts` (keyed by `chunk_ids`) with `backend`, checkpointing to `job_dir`."""
+
+    def __init__(self, job_dir: str, backend: EmbeddingBackend, chunk_ids: Sequence[str],
+                 texts: Sequence[str], checkpoint_every: int = 8, cache: Optional[EmbeddingCache] = None):
+        self.job_dir = job_dir
+        self.backend = backend
+        self.chunk_ids = list(chunk_ids)
+        self.texts = texts
+        self.checkpoint_every = checkpoint_every
+        self.cache = cache
+        self.requests = 0
+        self.fingerprint = input_fingerprint(self.chunk_ids, texts)
+        self.shards: List[Dict] = []
+        self.completed: Set[str] = set()
+        self._open()
+
+    def _open(self):
+        """Load the checkpoints of an earlier run of the same job, or start an empty one."""
+        job_path = os.path.join(self.job_dir, JOB_FILE)
+        job = None
+        if os.path.exists(job_path):
+            with open(job_path, "r", encoding="utf-8") as f:
+                job = json.load(f)
+        if job != {"model": self.backend.name, "fingerprint": self.fingerprint}:
+            self.clear()
+            os.makedirs(self.job_dir, exist_ok=True)
+            with open(job_path, "w", encoding="utf-8") as f:
+                json.dump({"model": self.backend.name, "fingerprint": self.fingerprint}, f)
+            return
+
+        manifest_path = os.path.join(self.job_dir, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # torn last line from an interrupted append; its shard is redone
+                self.shards.append(entry)
+                self.completed.update(entry["ids"])
+
+    @property
+    def pending_rows(self) -> List[int]:
+        return [row for row, chunk_id in enumerate(self.chunk_ids) if chunk_id not in self.completed]
+
+    async def run(self, progress: Optional[Callable[[int, int], None]] = None) -> EmbeddingResult:
+        """
+        Embed every chunk not checkpointed yet and return all vectors, in input order.
+        Rows that fail stay pending (embedded=False) and are retried by the next run.
+        """
+        pending = self.pending_rows
+        total = len(self.chunk_ids)
+        done = total - len(pending)
+        if progress:
+            progress(done, total)
+
+        max_inputs = getattr(self.backend, "batch_size", MAX_INPUTS_PER_REQUEST)
+        token_counts = [count_tokens(truncate_to_tokens(self.texts[row])) for row in pending]
+        batches = plan_batches(token_counts, max_inputs=max_inputs)
+        for i in range(0, len(batches), self.checkpoint_every):
+            segment = batches[i:i + self.checkpoint_every]
+            rows = pending[segment[0][0]:segment[-1][1]]
+            texts = [self.texts[row] for row in rows]
+            if self.cache is not None:
+                result = await embed_with_cache(self.cache, self.backend, texts)
+            else:
+                result = await self.backend.embed(texts)
+            self.requests += result.requests
+            embedded = np.flatnonzero(result.embedded)
+            if len(embedded):
+                self._checkpoint([self.chunk_ids[rows[j]] for j in embedded], result.matrix[embedded])
+            done += len(rows)
+            if progress:
+                progress(done, total)
+        return self.load()
+
+    def _checkpoint(self, ids: List[str], vectors: np.ndarray):
+        """Write a shard, then record it in the manifest; a shard without a manifest line is ignored."""
+        name = f"shard_{len(self.shards):05d}.npy"
+        tmp_path = os.path.join(self.job_dir, name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(vectors, dtype=np.float32))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.job_dir, name))
+
+        entry = {"shard": name, "ids": ids}
+        with open(os.path.join(self.job_dir, MANIFEST), "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.shards.append(entry)
+        self.completed.update(ids)
+
+    def load(self) -> EmbeddingResult:
+        """All checkpointed vectors as an EmbeddingResult over the job's chunks, in input order."""
+        row_of = {chunk_id: row for row, chunk_id in enumerate(self.chunk_ids)}
+        matrix = None
+        embedded = np.zeros(len(self.chunk_ids), dtype=np.bool_)
+        for entry in self.shards:
+            vectors = np.load(os.path.join(self.job_dir, entry["shard"]))
+            if matrix is None:
+                matrix = np.zeros((len(self.chunk_ids), vectors.shape[1]), dtype=np.float32)
+            rows = np.fromiter((row_of[i] for i in entry["ids"]), dtype=np.int64, count=len(entry["ids"]))
+            matrix[rows] = vectors
+            embedded[rows] = True
+        if matrix is None:
+            matrix = np.zeros((len(self.chunk_ids), 0), dtype=np.float32)
+        failed = []
+        for row in np.flatnonzero(~embedded):
+            if failed and failed[-1][1] == row:
+                failed[-1] = (failed[-1][0], int(row) + 1, failed[-1][2])
+            else:
+                failed.append((int(row), int(row) + 1, "not embedded yet; run the job again to resume"))
+        return EmbeddingResult(matrix, embedded, failed, self.requests)
+
+    def clear(self):
+        """Delete the job directory (e.g. once its index has been saved)."""
+        shutil.rmtree(self.job_dir, ignore_errors=True)
+        self.shards = []
+        self.completed = set()
@@ -0,0 +1,284 @@
+# embedding_pipeline.py
+"""
+Pipelined "embed all": every processed document, read -> batch -> embed -> index -> write.
+
+Stages run as asyncio tasks connected by bounded queues, so parsing the next
+document, waiting on embedding requests, adding vectors to FAISS and writing
+finished indexes all overlap. When a downstream stage falls behind, its
+queue fills and the stages upstream wait (backpressure). Memory is therefore
+bounded by the queue sizes and the indexes being filled, not by the corpus:
+each document's vectors go to a memory-mapped file next to its index as they
+arrive, and only the index itself (which, for flat and HNSW, holds the
+vectors) stays in RAM until the document is written. If a stage fails, the
+others are cancelled and the error is raised.
+
+    read    JSON parse + load_chunks + plan_embedding (in a thread)
+    batch   cut each document's planned chunks into batches of `batch_size`
+    embed   `workers` concurrent backend calls, through the embedding cache
+    index   add vectors to the document's FAISS index in chunk order; "auto" is resolved
+            per document from its chunk count, so flat and HNSW indexes (the default's
+            choice for all but huge documents) fill as batches arrive. int8 and IVF
+            indexes train on the whole document, so they are built at write
+    write   write index, metadata and raw vectors files (in a thread)
+
+PipelineStats records items, busy time and queue depth per stage. It is passed
+to `progress` after every change, for live display.
+"""
+import asyncio
+import os
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+from bulk_chunking import load_processed
+from chunk_storage import load_chunks
+from embedding_backends import EmbeddingBackend
+from embedding_cache import EmbeddingCache, embed_with_cache
+from embedding_plan import DEFAULT_LEVELS, plan_embedding
+from ann_index import IndexSpec, adds_incrementally, build_ann_index, build_report, choose_index_spec, new_ann_index
+from vector_compression import add_vectors
+from vector_store import INDEX_DIR, write_index
+
+STAGES = ("read", "batch", "embed", "index", "write")
+
+
+class StageStats:
+    def __init__(self):
+        self.items = 0        # documents for read/write, chunks for batch/embed/index
+        self.busy = 0.0       # seconds spent working (summed over workers)
+        self.queue_depth = 0  # items waiting in the stage's input queue
+        self.max_queue_depth = 0
+
+
+class PipelineStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {name: StageStats() for name in STAGES}
+        self.docs_done = 0
+        self.docs_total = 0
+
+    def rows(self) -> List[Dict]:
+        """One row per stage, for display."""
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return [{
+            "stage": name,
+            "items": s.items,
+            "items/s": round(s.items / elapsed, 1),
+            "busy_s": round(s.busy, 2),
+            "queue": s.queue_depth,
+            "max_queue": s.max_queue_depth,
+        } for name, s in self.stages.items()]
+
+
+class DocResult(NamedTuple):
+    doc_id: str
+    chunks: int
+    error: Optional[str]
+
+
+class _Doc:
+    """A document in flight between the stages."""
+
+    def __init__(self, doc_data: Dict, chunks: List[Dict], n_batches: int, vectors_path: str):
+        self.doc_data = doc_data
+        self.chunks = chunks
+        self.n_batches = n_batches
+        self.spec: Optional[IndexSpec] = None  # resolved for this document's size and width
+        self.index = None  # filled batch by batch when the spec allows it
+        self.add_seconds = 0.0
+        self.vectors_path = vectors_path
+        self.vectors: Optional[np.ndarray] = None  # memory-mapped, rows in chunk order
+        self.rows = 0  # rows of `vectors` filled so far
+        self.pending: Dict[int, np.ndarray] = {}  # out-of-order batches, by sequence number
+        self.next_seq = 0
+        self.error: Optional[str] = None
+
+    def store(self, vectors: np.ndarray):
+        """Append a batch to the document's vectors file (created on the first batch)."""
+        if self.vectors is None:
+            self.vectors = np.lib.format.open_memmap(self.vectors_path, mode="w+", dtype=np.float32,
+                                                     shape=(len(self.chunks), vectors.shape[1]))
+        self.vectors[self.rows:self.rows + len(vectors)] = vectors
+        self.rows += len(vectors)
+
+    def discard(self):
+        """Drop the vectors file; the written index has its own copy."""
+        self.vectors = None
+        if os.path.exists(self.vectors_path):
+            os.remove(self.vectors_path)
+
+
+async def embed_all(paths: Iterable[str], backend: EmbeddingBackend, cache: Optional[EmbeddingCache] = None,
+                    levels: Iterable[str] = DEFAULT_LEVELS, retrievable_only: bool = True,
+                    index_dir: str = INDEX_DIR, batch_size: int = 256, workers: int = 4,
+                    queue_size: int = 8, storage: str = "float32", spec: Optional[IndexSpec] = None,
+                    progress: Optional[Callable[[PipelineStats], None]] = None) -> List[DocResult]:
+    """
+    Embed and index every processed_docs JSON in `paths`. Each queue holds at most
+    `queue_size` items (documents or batches); `storage` is the index's vector format
+    (vector_compression.STORAGE_FORMATS); `spec` chooses an ANN index type instead of an
+    exact scan (ann_index). Returns one DocResult per document.
+    """
+    spec = spec or IndexSpec(storage=storage)
+    paths = list(paths)
+    levels = list(levels)
+    stats = PipelineStats()
+    stats.docs_total = len(paths)
+    queues = {name: asyncio.Queue(maxsize=queue_size) for name in STAGES if name != "read"}
+    results: List[DocResult] = []
+    in_flight: List[_Doc] = []
+    os.makedirs(index_dir, exist_ok=True)
+
+    def report():
+        for name, queue in queues.items():
+            stage = stats.stages[name]
+            stage.queue_depth = queue.qsize()
+            stage.max_queue_depth = max(stage.max_queue_depth, stage.queue_depth)
+        if progress:
+            progress(stats)
+
+    async def put(name, item):
+        await queues[name].put(item)
+        report()
+
+    def finish(doc: _Doc, error: Optional[str] = None):
+        doc.discard()
+        in_flight.remove(doc)
+        results.append(DocResult(doc.doc_data["doc_id"], len(doc.chunks), error))
+        stats.docs_done += 1
+        report()
+
+    async def read():
+        for path in paths:
+            start = time.perf_counter()
+            doc = await asyncio.to_thread(_read_doc, path, backend.name, levels, retrievable_only)
+            stats.stages["read"].busy += time.perf_counter() - start
+            stats.stages["read"].items += 1
+            if isinstance(doc, DocResult):
+                results.append(doc)
+                stats.docs_done += 1
+                report()
+                continue
+            doc_data, chunks = doc
+            n_batches = (len(chunks) + batch_size - 1) // batch_size
+            vectors_path = os.path.join(index_dir, f"{doc_data['doc_id']}_vectors.part.npy")
+            in_flight.append(_Doc(doc_data, chunks, n_batches, vectors_path))
+            await put("batch", in_flight[-1])
+        await put("batch", None)
+
+    async def batch():
+        while (doc := await queues["batch"].get()) is not None:
+            if not doc.chunks:
+                finish(doc)
+                continue
+            for seq in range(doc.n_batches):
+                start = time.perf_counter()
+                texts = [c["content"] for c in doc.chunks[seq * batch_size:(seq + 1) * batch_size]]
+                stats.stages["batch"].busy += time.perf_counter() - start
+                stats.stages["batch"].items += len(texts)
+                await put("embed", (doc, seq, texts))
+        for _ in range(workers):
+            await put("embed", None)
+
+    async def embed():
+        while (item := await queues["embed"].get()) is not None:
+            doc, seq, texts = item
+            start = time.perf_counter()
+            if doc.error is not None:
+                vectors = None  # an earlier batch of this document failed; skip the rest
+            else:
+                try:
+                    if cache is not None:
+                        result = await embed_with_cache(cache, backend, texts)
+                    else:
+                        result = await backend.embed(texts)
+                    vectors = result.matrix if not result.failed else None
+                    if result.failed:
+                        doc.error = f"{len(result.failed)} batch(es) failed: {result.failed[0][2]}"
+                except Exception as e:
+                    vectors = None
+                    doc.error = str(e)
+            stats.stages["embed"].busy += time.perf_counter() - start
+            stats.stages["embed"].items += len(texts)
+            await put("index", (doc, seq, vectors))
+        await put("index", None)
+
+    async def index():
+        remaining_workers = workers
+        while remaining_workers:
+            item = await queues["index"].get()
+            if item is None:
+                remaining_workers -= 1
+                continue
+            doc, seq, vectors = item
+            start = time.perf_counter()
+            doc.pending[seq] = vectors
+            # Vectors are added in chunk order, so index rows line up with the metadata
+            while doc.next_seq in doc.pending:
+                vectors = doc.pending.pop(doc.next_seq)
+                doc.next_seq += 1
+                if vectors is None or doc.error is not None:
+                    continue
+                doc.store(vectors)
+                if doc.spec is None:
+                    doc.spec = choose_index_spec(len(doc.chunks), vectors.shape[1], spec)
+                    if adds_incrementally(doc.spec):
+                        doc.index = new_ann_index(doc.spec, vectors.shape[1])
+                if doc.index is not None:
+                    step = time.perf_counter()
+                    add_vectors(doc.index, vectors)
+                    doc.add_seconds += time.perf_counter() - step
+                stats.stages["index"].items += len(vectors)
+            stats.stages["index"].busy += time.perf_counter() - start
+            if doc.next_seq == doc.n_batches:
+                if doc.error is not None:
+                    finish(doc, doc.error)
+                else:
+                    await put("write", doc)
+        await put("write", None)
+
+    async def write():
+        while (doc := await queues["write"].get()) is not None:
+            start = time.perf_counter()
+            try:
+                doc.vectors.flush()
+                vectors = doc.vectors
+                if doc.index is None:
+                    doc.index, report = await asyncio.to_thread(build_ann_index, vectors, doc.spec)
+                else:
+                    report = await asyncio.to_thread(build_report, doc.index, vectors, doc.spec,
+                                                     build_seconds=doc.add_seconds)
+                await asyncio.to_thread(write_index, doc.doc_data, doc.chunks, doc.index, vectors, backend.name,
+                                        index_dir, report)
+                error = None
+            except Exception as e:
+                error = str(e)
+            stats.stages["write"].busy += time.perf_counter() - start
+            stats.stages["write"].items += 1
+            finish(doc, error)
+
+    tasks = [asyncio.create_task(stage) for stage in (read(), batch(), *(embed() for _ in range(workers)),
+                                                      index(), write())]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # The other stages would wait on their queues forever
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for doc in in_flight:
+            doc.discard()
+        raise
+    return results
+
+
+def _read_doc(path: str, model: str, levels: List[str], retrievable_only: bool):
+    """(doc_data, planned chunks), or a DocResult if the file cannot be used."""
+    doc_data = load_processed(path)
+    doc_id = os.path.splitext(os.path.basename(path))[0]
+    if doc_data is None:
+        return DocResult(doc_id, 0, "processed document missing or unreadable")
+    chunks = load_chunks(doc_data)
+    plan = plan_embedding(chunks, model, levels, retrievable_only)
+    return doc_data, [chunks[i] for i in plan.rows]
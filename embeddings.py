@@ -0,0 +1,404 @@
+# embeddings.py
+"""
+Batched embedding requests.
+
+embed_texts packs chunk texts into as few embeddings.create calls as the
+model's per-request limits allow (number of inputs and total tokens), writes
+each response straight into a preallocated float32 matrix and keeps rows in
+the order of the input texts, whatever order the API returns them in.
+
+embed_texts_async sends the same batches concurrently from an asyncio client
+(e.g. AsyncOpenAI), paced by token buckets for requests and tokens per minute.
+Batches that hit 429 or 5xx responses are retried on their own with jittered
+exponential backoff; a batch that keeps failing is reported, not fatal.
+
+StubEmbeddingsClient mimics the OpenAI embeddings endpoint (same call shape,
+same limits, deterministic vectors) so the batching can be exercised offline;
+AsyncStubEmbeddingsClient adds latency, per-minute quotas and injected errors.
+"""
+import asyncio
+import hashlib
+import random
+import time
+from types import SimpleNamespace
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Limits of the OpenAI embeddings endpoint
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_REQUEST = 300_000
+MAX_TOKENS_PER_INPUT = 8191
+
+# Default account quotas for the async executor; set these to your provider tier
+DEFAULT_REQUESTS_PER_MINUTE = 3000
+DEFAULT_TOKENS_PER_MINUTE = 1_000_000
+
+MODEL_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+_encoding = None
+
+
+def _get_encoding():
+    """tiktoken's cl100k_base if installed, else None (token counts are then estimated)."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in `text`; without tiktoken a deliberately high estimate of one token per 3 UTF-8 bytes."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int = MAX_TOKENS_PER_INPUT) -> str:
+    """Cut `text` so that it fits in `max_tokens`; the API rejects longer inputs."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    if count_tokens(text) <= max_tokens:
+        return text
+    return text.encode("utf-8")[:(max_tokens - 1) * 3].decode("utf-8", errors="ignore")
+
+
+def plan_batches(token_counts: Sequence[int], max_inputs: int = MAX_INPUTS_PER_REQUEST,
+                 max_tokens: int = MAX_TOKENS_PER_REQUEST) -> List[Tuple[int, int]]:
+    """Split inputs, in order, into contiguous [start, end) ranges that respect both limits."""
+    batches = []
+    start = 0
+    tokens = 0
+    for i, n in enumerate(token_counts):
+        if i > start and (i - start >= max_inputs or tokens + n > max_tokens):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += n
+    if start < len(token_counts):
+        batches.append((start, len(token_counts)))
+    return batches
+
+
+def embed_texts(client, texts: Sequence[str], model: str,
+                max_inputs: int = MAX_INPUTS_PER_REQUEST, max_tokens: int = MAX_TOKENS_PER_REQUEST,
+                progress: Optional[Callable[[int, int], None]] = None,
+                dimensions: Optional[int] = None) -> np.ndarray:
+    """
+    Embed `texts` with as few requests as the limits allow.
+    Returns a (len(texts), dim) float32 matrix in input order. Inputs over the
+    per-input token limit are truncated. `progress(done, total)` is called after each request.
+    `dimensions` asks the API for shortened vectors (text-embedding-3 models).
+    """
+    options = {"dimensions": dimensions} if dimensions else {}
+    inputs = [truncate_to_tokens(t) for t in texts]
+    token_counts = [count_tokens(t) for t in inputs]
+    matrix = None
+    done = 0
+
+    for start, end in plan_batches(token_counts, max_inputs, max_tokens):
+        response = client.embeddings.create(model=model, input=inputs[start:end], **options)
+        for item in response.data:
+            vector = item.embedding
+            if matrix is None:
+                matrix = np.empty((len(inputs), len(vector)), dtype=np.float32)
+            matrix[start + item.index] = vector
+        done = end
+        if progress:
+            progress(done, len(inputs))
+
+    if matrix is None:
+        return np.empty((0, dimensions or MODEL_DIMENSIONS.get(model, 0)), dtype=np.float32)
+    return matrix
+
+
+class TokenBucket:
+    """
+    Refills at `per_minute / 60` units per second up to `capacity` (default: one second's worth).
+    Requests larger than the capacity wait for a full bucket and leave it in debt,
+    so the long-run rate holds for any request size.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.max_rate = self.rate
+        self.min_rate = self.rate / 64
+        self.capacity = capacity or max(self.rate, 1.0)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1.0):
+        async with self._lock:  # waiters are served in arrival order
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+                self.updated = now
+                needed = min(amount, self.capacity)
+                if self.level >= needed:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((needed - self.level) / self.rate)
+
+    def pause(self, seconds: float, slow_down: float = 1.0):
+        """
+        Hold every waiter for `seconds`, e.g. after the provider answered 429, and
+        multiply the refill rate by `slow_down` (never below 1/64 of the configured rate).
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.level = min(self.level, 0.0)
+        self.rate = max(self.rate * slow_down, self.min_rate)
+
+    def speed_up(self, factor: float):
+        """Recover towards the configured rate after pause() slowed the bucket down."""
+        self.rate = min(self.rate * factor, self.max_rate)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets acquired together."""
+
+    def __init__(self, requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    async def acquire(self, tokens: int):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+    def pause(self, seconds: float, slow_down: float = 0.5):
+        """Back off after a 429: the quotas were set higher than the provider actually allows."""
+        if time.monotonic() < self.requests.paused_until:
+            return  # other requests in flight during the same burst; one back-off is enough
+        self.requests.pause(seconds, slow_down)
+        self.tokens.pause(seconds, slow_down)
+
+    def succeeded(self, speed_up: float = 1.02):
+        """A request went through: creep back towards the configured quotas."""
+        self.requests.speed_up(speed_up)
+        self.tokens.speed_up(speed_up)
+
+
+class EmbeddingResult(NamedTuple):
+    matrix: np.ndarray    # (n, dim) float32, rows in input order
+    embedded: np.ndarray  # bool per row; False for rows of batches that failed for good
+    failed: List[Tuple[int, int, str]]  # (start, end, last error) of those batches
+    requests: int         # requests sent, retries included
+
+
+def is_retryable(error: Exception) -> bool:
+    """429, 5xx, timeouts and dropped connections are worth retrying; other errors are not."""
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError)) or any(
+        name in type(error).__name__ for name in ("Timeout", "Connection"))
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0,
+                  retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+async def embed_texts_async(client, texts: Sequence[str], model: str, concurrency: int = 8,
+                            limiter: Optional[RateLimiter] = None, max_retries: int = 6,
+                            max_inputs: int = MAX_INPUTS_PER_REQUEST,
+                            max_tokens: int = MAX_TOKENS_PER_REQUEST,
+                            progress: Optional[Callable[[int, int], None]] = None,
+                            dimensions: Optional[int] = None) -> EmbeddingResult:
+    """
+    Embed `texts` with up to `concurrency` requests in flight on an async client
+    (`await client.embeddings.create(model=..., input=[...])`). Create the client with
+    its own retries off (AsyncOpenAI(max_retries=0)) so backoff happens here, in step
+    with the limiter. `progress(done, total)` counts inputs of finished batches.
+    `dimensions` asks the API for shortened vectors (text-embedding-3 models).
+    """
+    options = {"dimensions": dimensions} if dimensions else {}
+    inputs = [truncate_to_tokens(t) for t in texts]
+    token_counts = [count_tokens(t) for t in inputs]
+    batches = plan_batches(token_counts, max_inputs, max_tokens)
+    limiter = limiter or RateLimiter()
+    queue: asyncio.Queue = asyncio.Queue()
+    for batch in batches:
+        queue.put_nowait(batch)
+
+    matrix = None
+    embedded = np.zeros(len(inputs), dtype=np.bool_)
+    failed = []
+    requests = 0
+    finished = 0
+
+    async def run_batch(start: int, end: int):
+        nonlocal matrix, requests
+        tokens = sum(token_counts[start:end])
+        for attempt in range(max_retries + 1):
+            await limiter.acquire(tokens)
+            requests += 1
+            try:
+                response = await client.embeddings.create(model=model, input=inputs[start:end], **options)
+            except Exception as e:
+                if not is_retryable(e) or attempt == max_retries:
+                    return str(e)
+                delay = backoff_delay(attempt, retry_after=_retry_after(e))
+                if _status_code(e) == 429:
+                    limiter.pause(delay)  # everyone backs off, not just this batch
+                await asyncio.sleep(delay)
+                continue
+            limiter.succeeded()
+            for item in response.data:
+                if matrix is None:
+                    matrix = np.zeros((len(inputs), len(item.embedding)), dtype=np.float32)
+                matrix[start + item.index] = item.embedding
+            embedded[start:end] = True
+            return None
+
+    async def worker():
+        nonlocal finished
+        while not queue.empty():
+            start, end = queue.get_nowait()
+            error = await run_batch(start, end)
+            if error is not None:
+                failed.append((start, end, error))
+            finished += end - start
+            if progress:
+                progress(finished, len(inputs))
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(batches))))))
+    if matrix is None:
+        matrix = np.zeros((len(inputs), dimensions or MODEL_DIMENSIONS.get(model, 0)), dtype=np.float32)
+    failed.sort()
+    return EmbeddingResult(matrix, embedded, failed, requests)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class StubEmbeddingsClient:
+    """
+    Offline stand-in for OpenAI(); `client.embeddings.create(model=..., input=...)`.
+    Vectors are unit-length and derived from a hash of the text, so equal texts embed equally.
+    Requests over the endpoint limits raise ValueError; `latency` (seconds) is slept per request.
+    """
+
+    def __init__(self, dimensions: Optional[int] = None, latency: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.requests = 0
+        self.embeddings = self
+
+    def create(self, model: str, input, **kwargs):
+        inputs = [input] if isinstance(input, str) else list(input)
+        if len(inputs) > MAX_INPUTS_PER_REQUEST:
+            raise ValueError(f"Too many inputs: {len(inputs)} > {MAX_INPUTS_PER_REQUEST}")
+        token_counts = [count_tokens(t) for t in inputs]
+        if max(token_counts, default=0) > MAX_TOKENS_PER_INPUT:
+            raise ValueError(f"Input too long: {max(token_counts)} > {MAX_TOKENS_PER_INPUT} tokens")
+        if sum(token_counts) > MAX_TOKENS_PER_REQUEST:
+            raise ValueError(f"Request too large: {sum(token_counts)} > {MAX_TOKENS_PER_REQUEST} tokens")
+
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        dim = kwargs.get("dimensions") or self.dimensions or MODEL_DIMENSIONS.get(model, 1536)
+        data = [SimpleNamespace(index=i, embedding=stub_vector(text, dim).tolist())
+                for i, text in enumerate(inputs)]
+        return SimpleNamespace(data=data, model=model,
+                               usage=SimpleNamespace(prompt_tokens=sum(token_counts),
+                                                     total_tokens=sum(token_counts)))
+
+
+class StubAPIError(Exception):
+    """Error raised by the stubs, shaped like openai.APIStatusError (status_code, response.headers)."""
+
+    def __init__(self, status_code: int, message: str = "", retry_after: Optional[float] = None):
+        super().__init__(message or f"Error code: {status_code}")
+        self.status_code = status_code
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = SimpleNamespace(status_code=status_code, headers=headers)
+
+
+class AsyncStubEmbeddingsClient:
+    """
+    Async fake of the embeddings endpoint for exercising embed_texts_async offline.
+    Each request sleeps `latency` seconds (plus up to `jitter`), fails with a 500 at
+    `error_rate` and answers 429 once the per-minute request or token quota is used
+    up, like the real service. Quotas are enforced over a rolling `window` of seconds
+    (scaled to it), so a short window also rejects bursts within the minute.
+    """
+
+    def __init__(self, dimensions: Optional[int] = None, latency: float = 0.05, jitter: float = 0.0,
+                 error_rate: float = 0.0, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, window: float = 60.0, seed: int = 0):
+        self._sync = StubEmbeddingsClient(dimensions)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self.random = random.Random(seed)
+        self.history: List[Tuple[float, int]] = []  # (time, tokens) of accepted requests
+        self.status_counts = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.embeddings = self
+
+    async def create(self, model: str, input, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+            inputs = [input] if isinstance(input, str) else list(input)
+            tokens = sum(count_tokens(t) for t in inputs)
+            now = time.monotonic()
+            self.history = [(t, n) for t, n in self.history if now - t < self.window]
+            scale = self.window / 60.0
+            if ((self.requests_per_minute and len(self.history) + 1 > self.requests_per_minute * scale) or
+                    (self.tokens_per_minute and
+                     sum(n for _, n in self.history) + tokens > self.tokens_per_minute * scale)):
+                self._count(429)
+                raise StubAPIError(429, "Rate limit reached", retry_after=1.0)
+            if self.random.random() < self.error_rate:
+                self._count(500)
+                raise StubAPIError(500, "Internal server error")
+            self.history.append((now, tokens))
+            self._count(200)
+            return self._sync.create(model=model, input=inputs, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+    def _count(self, status: int):
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+
+def stub_vector(text: str, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
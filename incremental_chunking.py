@@ -0,0 +1,89 @@
+# incremental_chunking.py
+"""
+Incremental re-chunking keyed by section content hashes.
+
+With `id_scheme="content"` a section's ID is a hash of its level, title and
+body, and its paragraph and sentence IDs are numbered inside it. All
+overlap context stays within a section, so an unchanged section yields
+exactly the same chunks as before. rechunk_incremental therefore only
+re-chunks sections whose hash is not in the previous output and copies
+the rest as they were.
+"""
+from typing import Dict, List, Optional, Tuple
+
+from chunk_storage import load_chunks
+from chunking import Chunk, HierarchicalChunker
+
+
+def chunker_config(chunker: HierarchicalChunker) -> Dict:
+    """Settings that affect chunk content; stored chunks are only reused if these match."""
+    return {
+        "strategy": chunker.strategy,
+        "id_scheme": chunker.id_scheme,
+        "paragraph_overlap_sentences": chunker.paragraph_overlap_sentences,
+        "sentence_overlap_chars": chunker.sentence_overlap_chars,
+    }
+
+
+def rechunk_incremental(chunker: HierarchicalChunker, content: str,
+                        previous: Optional[Dict] = None) -> Tuple[List[Chunk], Dict]:
+    """
+    Chunk `content`, reusing the chunks of unchanged sections from `previous`
+    (a processed_docs JSON dict as written by save_chunks, in either storage format, or None).
+
+    Returns (chunks, diff). `diff` holds chunk ID lists for `added`, `removed`,
+    `updated` (same ID, rebuilt content: the document chunk, or everything when
+    the chunker settings changed) and `unchanged`, plus `sections_reused` and
+    `sections_chunked` counts.
+    """
+    if chunker.strategy == "fixed_size" or chunker.id_scheme != "content":
+        raise ValueError("Incremental re-chunking needs a hierarchical strategy with id_scheme='content'")
+
+    previous_chunks = load_chunks(previous) if previous else []
+    old_ids = {c["id"] for c in previous_chunks}
+    stored = {}
+    if previous and previous.get("chunker_config") == chunker_config(chunker):
+        stored = {c["id"]: c for c in previous_chunks}
+
+    overlap = chunker.strategy == "hierarchical_overlap"
+    doc_chunk = chunker._create_document_chunk(content)
+    chunks = [doc_chunk]
+    reused_ids = set()
+    sections_reused = 0
+    sections_chunked = 0
+
+    for section_data in chunker._detect_sections(content):
+        section_id = chunker._section_id(section_data)
+        if section_id in stored:
+            subtree = _stored_subtree(stored, section_id)
+            chunks.extend(Chunk(**c) for c in subtree)
+            reused_ids.update(c["id"] for c in subtree)
+            doc_chunk.children_ids.append(section_id)
+            sections_reused += 1
+        else:
+            chunks.extend(chunker._chunk_section(section_data, doc_chunk, overlap, section_id))
+            sections_chunked += 1
+    chunker.chunks = chunks
+
+    new_ids = [c.id for c in chunks]
+    new_id_set = set(new_ids)
+    diff = {
+        "added": [i for i in new_ids if i not in old_ids],
+        "removed": [c["id"] for c in previous_chunks if c["id"] not in new_id_set],
+        "updated": [i for i in new_ids if i in old_ids and i not in reused_ids],
+        "unchanged": [i for i in new_ids if i in reused_ids],
+        "sections_reused": sections_reused,
+        "sections_chunked": sections_chunked,
+    }
+    return chunks, diff
+
+
+def _stored_subtree(stored: Dict[str, Dict], root_id: str) -> List[Dict]:
+    """A stored section and its descendants, in the same pre-order the chunker emits."""
+    out = []
+    stack = [root_id]
+    while stack:
+        chunk = stored[stack.pop()]
+        out.append(chunk)
+        stack.extend(reversed(chunk.get("children_ids", [])))
+    return out
@@ -0,0 +1,230 @@
+# ingest.py
+"""
+Headless ingestion: chunk -> embed -> index for every document in a directory.
+
+Runs the same steps as the Chunk Document and Embeddings pages, without a
+browser. Chunking goes through bulk_chunking (processed_docs JSON), embedding
+through resumable EmbeddingJobs on top of the embedding cache, and indexing
+through vector_store (one FAISS index + metadata file per document). An
+existing corpus index (corpus_index) or sharded store (sharded_index) is then
+updated in place: only the chunks of re-embedded documents are written. --build-corpus rebuilds it from
+every per-document index instead. Ends
+with a per-stage timing summary, and exits non-zero if any document failed,
+so it can run from cron or a container job.
+
+Usage:
+    python ingest.py data/
+    python ingest.py data/ --strategy hierarchical --workers 8 --incremental
+    python ingest.py data/ --model all-MiniLM-L6-v2 --batch-size 128 --threads 4
+    python ingest.py data/ --dimensions 512 --storage-format int8
+    python ingest.py data/ --index-type auto --memory-budget-mb 1024
+    python ingest.py data/ --build-corpus
+    python ingest.py data/ --skip-embed                 # chunk only
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from bulk_chunking import PROCESSED_DIR, chunk_files, load_processed
+from chunk_storage import load_chunks
+from embedding_backends import OPENAI_MODELS, create_backend
+from embedding_cache import EmbeddingCache
+from embedding_jobs import EmbeddingJob
+from embedding_plan import DEFAULT_LEVELS, plan_embedding
+from embeddings import DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+from ann_index import INDEX_TYPES, IndexSpec
+from corpus_index import build_corpus, sync_corpus
+from sharded_index import sync_shards
+from vector_compression import STORAGE_FORMATS
+from vector_store import INDEX_DIR, save_index
+
+STRATEGIES = ["hierarchical", "hierarchical_overlap", "fixed_size"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Chunk, embed and index a directory of documents")
+    parser.add_argument("data_dir", help="Directory of documents to ingest")
+    parser.add_argument("--processed-dir", default=PROCESSED_DIR, help="Where chunked documents are written")
+    parser.add_argument("--index-dir", default=INDEX_DIR, help="Where FAISS indexes are written")
+
+    chunking = parser.add_argument_group("chunking")
+    chunking.add_argument("--strategy", choices=STRATEGIES, default="hierarchical_overlap")
+    chunking.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Chunking processes")
+    chunking.add_argument("--incremental", action="store_true",
+                          help="Reuse unchanged sections (content-based IDs)")
+    chunking.add_argument("--storage", choices=["full", "compact"], default="full")
+    chunking.add_argument("--paragraph-overlap", type=int, default=2, help="Sentences of paragraph overlap")
+    chunking.add_argument("--sentence-overlap", type=int, default=100, help="Characters of sentence overlap")
+    chunking.add_argument("--fixed-size", type=int, default=200, help="Words per fixed-size chunk")
+
+    embedding = parser.add_argument_group("embedding")
+    embedding.add_argument("--skip-embed", action="store_true", help="Only chunk")
+    embedding.add_argument("--model", default=OPENAI_MODELS[0],
+                           help="OpenAI model, sentence-transformers model or 'hashing'")
+    embedding.add_argument("--dimensions", type=int, default=None,
+                           help="Shortened vector width (API 'dimensions' or Matryoshka truncation)")
+    embedding.add_argument("--storage-format", choices=STORAGE_FORMATS, default="float32",
+                           help="How index vectors are stored")
+    embedding.add_argument("--index-type", choices=("auto",) + INDEX_TYPES, default="auto",
+                           help="Exact scan, HNSW, IVF-Flat or IVF-PQ; auto picks by size and memory budget")
+    embedding.add_argument("--memory-budget-mb", type=float, default=IndexSpec().memory_budget / 2 ** 20,
+                           help="Memory budget per index, for --index-type auto")
+    embedding.add_argument("--build-corpus", action="store_true",
+                           help="Rebuild the corpus index from every index in --index-dir afterwards "
+                                "(an existing corpus is otherwise updated in place)")
+    embedding.add_argument("--levels", nargs="+", default=list(DEFAULT_LEVELS), help="Chunk levels to embed")
+    embedding.add_argument("--include-non-retrievable", action="store_true",
+                           help="Also embed chunks marked retrievable: False")
+    embedding.add_argument("--batch-size", type=int, default=None, help="Local model batch size")
+    embedding.add_argument("--threads", type=int, default=None, help="Local model CPU threads")
+    embedding.add_argument("--concurrency", type=int, default=8, help="Concurrent API requests")
+    embedding.add_argument("--rpm", type=float, default=DEFAULT_REQUESTS_PER_MINUTE, help="API requests per minute")
+    embedding.add_argument("--tpm", type=float, default=DEFAULT_TOKENS_PER_MINUTE, help="API tokens per minute")
+    embedding.add_argument("--checkpoint-every", type=int, default=8, help="Batches per checkpoint")
+    embedding.add_argument("--no-cache", action="store_true", help="Do not use the embedding cache")
+    return parser.parse_args(argv)
+
+
+def chunk_stage(args, paths):
+    chunker_options = {
+        "paragraph_overlap_sentences": args.paragraph_overlap,
+        "sentence_overlap_chars": args.sentence_overlap,
+        "fixed_chunk_size": args.fixed_size,
+    }
+    done, failed, chunks = [], [], 0
+    for result in chunk_files(paths, args.strategy, chunker_options, args.processed_dir,
+                              workers=args.workers, incremental=args.incremental, storage=args.storage):
+        if result["error"]:
+            failed.append(result["doc_name"])
+            print(f"  ! {result['doc_name']}: {result['error']}")
+            continue
+        done.append(result["doc_id"])
+        chunks += result["chunks"]
+        print(f"  chunked {result['doc_name']}: {result['chunks']} chunks "
+              f"({result['docs_per_s']:.1f} docs/s, {result['mb_per_s']:.2f} MB/s)")
+    return done, failed, chunks
+
+
+def embed_and_index(args, doc_ids, timings):
+    backend = create_backend(args.model, batch_size=args.batch_size, concurrency=args.concurrency,
+                             requests_per_minute=args.rpm, tokens_per_minute=args.tpm, threads=args.threads,
+                             dimensions=args.dimensions)
+    cache = None if args.no_cache else EmbeddingCache(os.path.join(args.index_dir, "embedding_cache.sqlite"))
+    failed, embedded, requests = [], 0, 0
+
+    for doc_id in doc_ids:
+        doc_data = load_processed(os.path.join(args.processed_dir, f"{doc_id}.json"))
+        if doc_data is None:
+            failed.append(doc_id)
+            print(f"  ! {doc_id}: processed document missing or unreadable")
+            continue
+        chunks = load_chunks(doc_data)
+        plan = plan_embedding(chunks, backend.name, args.levels, not args.include_non_retrievable)
+        if not plan.rows:
+            print(f"  {doc_id}: nothing to embed")
+            continue
+        chunks = [chunks[i] for i in plan.rows]
+
+        start = time.perf_counter()
+        job_dir = os.path.join(args.index_dir, "jobs", f"{doc_id}__{backend.name.replace('/', '_')}")
+        job = EmbeddingJob(job_dir, backend, [c["id"] for c in chunks], [c["content"] for c in chunks],
+                           checkpoint_every=args.checkpoint_every, cache=cache)
+        resumed = len(job.completed)
+        result = asyncio.run(job.run())
+        timings["embed"] += time.perf_counter() - start
+        requests += result.requests
+        if result.failed:
+            failed.append(doc_id)
+            print(f"  ! {doc_id}: {len(chunks) - int(result.embedded.sum())} chunks not embedded; "
+                  f"re-run to resume")
+            continue
+
+        start = time.perf_counter()
+        spec = IndexSpec(index_type=args.index_type, storage=args.storage_format,
+                         memory_budget=int(args.memory_budget_mb * 2 ** 20))
+        save_index(doc_data, chunks, result.matrix, backend.name, args.index_dir, spec=spec)
+        job.clear()
+        timings["index"] += time.perf_counter() - start
+        embedded += len(chunks)
+        print(f"  indexed {doc_id}: {len(chunks)} chunks, ~{plan.total_tokens:,} tokens"
+              + (f" (resumed after {resumed})" if resumed else ""))
+
+    if cache is not None:
+        stats = cache.stats()
+        print(f"  cache: {stats['hits']} hits, {stats['misses']} misses; {requests} API requests")
+        cache.close()
+    return failed, embedded
+
+
+def main(argv=None):
+    load_dotenv()
+    args = parse_args(argv)
+    paths = sorted(os.path.join(args.data_dir, f) for f in os.listdir(args.data_dir)
+                   if os.path.isfile(os.path.join(args.data_dir, f)))
+    if not paths:
+        print(f"No documents found in {args.data_dir}")
+        return 1
+    os.makedirs(args.index_dir, exist_ok=True)
+    timings = {"chunk": 0.0, "embed": 0.0, "index": 0.0, "corpus": 0.0}
+
+    print(f"Chunking {len(paths)} documents ({args.strategy}, {args.workers} workers)")
+    start = time.perf_counter()
+    doc_ids, chunk_failed, n_chunks = chunk_stage(args, paths)
+    timings["chunk"] = time.perf_counter() - start
+
+    embed_failed, n_embedded = [], 0
+    if not args.skip_embed and doc_ids:
+        print(f"Embedding with {args.model}")
+        try:
+            embed_failed, n_embedded = embed_and_index(args, doc_ids, timings)
+        except (ValueError, ImportError) as e:
+            print(f"  ! {e}")
+            return 1
+
+    n_corpus = 0
+    if not args.skip_embed:
+        start = time.perf_counter()
+        try:
+            if args.build_corpus:
+                manifest = build_corpus(args.index_dir, IndexSpec(
+                    index_type=args.index_type, storage=args.storage_format,
+                    memory_budget=int(args.memory_budget_mb * 2 ** 20)))
+                n_corpus = manifest["rows"]
+                print(f"  corpus: {manifest['documents']} documents, {n_corpus} chunks "
+                      f"({manifest['index']['factory']})")
+                for doc_id, reason in manifest["skipped"].items():
+                    print(f"  corpus skipped {doc_id}: {reason}")
+            else:
+                for name, counts in (("corpus", sync_corpus(args.index_dir)), ("shards", sync_shards(args.index_dir))):
+                    if counts is None:
+                        continue
+                    n_corpus += counts["added"] + counts["updated"] + counts["deleted"]
+                    print(f"  {name}: {counts['documents']} documents changed; {counts['added']} chunks added, "
+                          f"{counts['updated']} updated, {counts['deleted']} deleted, "
+                          f"{counts['unchanged']} unchanged" + (", compacted" if counts["compacted"] else ""))
+        except (OSError, ValueError) as e:
+            print(f"  ! corpus: {e}")
+            return 1
+        timings["corpus"] = time.perf_counter() - start
+
+    print()
+    print(f"{'stage':<8}{'seconds':>10}{'items':>10}{'items/s':>10}")
+    for stage, items in (("chunk", n_chunks), ("embed", n_embedded), ("index", n_embedded),
+                          ("corpus", n_corpus)):
+        seconds = timings[stage]
+        rate = items / seconds if seconds > 0 else 0.0
+        print(f"{stage:<8}{seconds:>10.2f}{items:>10}{rate:>10.0f}")
+    print(f"{'total':<8}{sum(timings.values()):>10.2f}")
+
+    failed = chunk_failed + embed_failed
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# markdown_scanner.py
+"""
+Single-pass Markdown block scanner shared by the chunker and the document editor.
+
+scan_markdown walks the text line by line, once, and yields block events
+with (start, end) offsets into the scanned string:
+
+    heading    ATX heading ("## Title"); `level` is the number of '#', `title` its text
+    paragraph  run of plain text lines
+    list       run of list items ("- ", "* ", "+ ", "1. ", "1) ") and their continuation lines
+    code       fenced code block (``` or ~~~), fences included
+    table      run of lines starting with '|'
+
+Blank lines end the current block. Nothing inside a code fence is reported as a
+heading, so commented-out "# ..." lines in code samples never open sections.
+Each line is matched once against anchored patterns, so scanning stays linear
+in the size of the input however many headings it contains.
+"""
+import re
+from typing import Iterator, NamedTuple
+
+HEADING_PATTERN = re.compile(r' {0,3}(#{1,6})(?:[ \t]+(.*?))?[ \t]*$')
+FENCE_PATTERN = re.compile(r' {0,3}(`{3,}|~{3,})')
+LIST_ITEM_PATTERN = re.compile(r'[ \t]*(?:[-*+]|\d{1,9}[.)])(?:[ \t]|$)')
+TABLE_ROW_PATTERN = re.compile(r'[ \t]*\|')
+BLANK_PATTERN = re.compile(r'[ \t\r]*$')
+
+
+class MarkdownEvent(NamedTuple):
+    kind: str       # 'heading', 'paragraph', 'list', 'code', 'table'
+    start: int      # offset of the block's first character
+    end: int        # offset just past the block's last line (newline excluded)
+    level: int = 0  # heading level, 0 for other blocks
+    title: str = ""  # heading text, '' for other blocks
+
+
+def heading_level(line: str) -> int:
+    """Level of an ATX heading line, or 0 if the line is not a heading."""
+    match = HEADING_PATTERN.match(line.rstrip("\r\n"))
+    return len(match.group(1)) if match else 0
+
+
+def fence_marker(line: str) -> str:
+    """The opening fence characters if `line` opens or closes a code fence, else ''."""
+    match = FENCE_PATTERN.match(line)
+    return match.group(1) if match else ""
+
+
+def closes_fence(line: str, opening: str) -> bool:
+    """Whether `line` closes a fence opened with `opening` (same char, at least as long, nothing after)."""
+    marker = fence_marker(line)
+    return (bool(marker) and marker[0] == opening[0] and len(marker) >= len(opening)
+            and not line.strip()[len(marker):].strip())
+
+
+def scan_markdown(text: str) -> Iterator[MarkdownEvent]:
+    """Yield the block events of `text` in document order."""
+    block_kind = None
+    block_start = 0
+    block_end = 0
+    fence = ""
+
+    pos = 0
+    n = len(text)
+    while pos < n:
+        line_end = text.find("\n", pos)
+        if line_end == -1:
+            line_end = n
+        content_end = line_end - 1 if line_end > pos and text[line_end - 1] == "\r" else line_end
+
+        if fence:
+            # Inside a code fence: only the closing fence matters
+            block_end = content_end
+            if closes_fence(text[pos:content_end], fence):
+                yield MarkdownEvent("code", block_start, block_end)
+                block_kind, fence = None, ""
+            pos = line_end + 1
+            continue
+
+        if BLANK_PATTERN.match(text, pos, line_end):
+            if block_kind:
+                yield MarkdownEvent(block_kind, block_start, block_end)
+                block_kind = None
+            pos = line_end + 1
+            continue
+
+        fence_match = FENCE_PATTERN.match(text, pos, content_end)
+        heading = HEADING_PATTERN.match(text, pos, content_end) if not fence_match else None
+        if fence_match or heading:
+            if block_kind:
+                yield MarkdownEvent(block_kind, block_start, block_end)
+                block_kind = None
+            if heading:
+                yield MarkdownEvent("heading", pos, content_end, len(heading.group(1)),
+                                    (heading.group(2) or "").strip())
+            else:
+                fence = fence_match.group(1)
+                block_kind, block_start, block_end = "code", pos, content_end
+            pos = line_end + 1
+            continue
+
+        if TABLE_ROW_PATTERN.match(text, pos, content_end):
+            kind = "table"
+        elif LIST_ITEM_PATTERN.match(text, pos, content_end):
+            kind = "list"
+        elif block_kind == "list":
+            kind = "list"  # lazy continuation of a list item
+        else:
+            kind = "paragraph"
+
+        if block_kind != kind:
+            if block_kind:
+                yield MarkdownEvent(block_kind, block_start, block_end)
+            block_kind, block_start = kind, pos
+        block_end = content_end
+        pos = line_end + 1
+
+    if block_kind:
+        yield MarkdownEvent(block_kind, block_start, block_end)
@@ -4,6 +4,10 @@ from datetime import datetime
 import json
 import re
 import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from markdown_scanner import scan_markdown
 
 # Initialize session state (these are critical for the app to remember user's documents)
 if 'documents' not in st.session_state:
@@ -367,59 +371,47 @@ def remove_paragraph(parent_section_id: str, paragraph_id_to_remove: str):
 # --- Utility functions ---
 def parse_markdown_to_structure(md_content):
     """Parse markdown content into document structure with sections/subsections/paragraphs."""
-    lines = md_content.split("\n")
     doc_structure = []
     stack = []  # keep track of section hierarchy
-
-    paragraph_buffer = []
-
-    def flush_paragraphs(current_section):
-        nonlocal paragraph_buffer
-        if paragraph_buffer:
-            for idx, para in enumerate(paragraph_buffer, start=1):
-                current_section.setdefault("paragraphs", []).append({
-                    "id": generate_unique_id("para"),
-                    "order": len(current_section.get("paragraphs", [])) + 1,
-                    "content": para.strip()
-                })
-            paragraph_buffer = []
-
-    for line in lines:
-        header_match = re.match(r"^(#+) (.*)", line)
-        if header_match:
-            level = len(header_match.group(1))
-            title = header_match.group(2).strip()
-
+    pending = []  # blocks seen before the first heading go into the first section
+
+    def add_paragraph(section, text):
+        section["paragraphs"].append({
+            "id": generate_unique_id("para"),
+            "order": len(section["paragraphs"]) + 1,
+            "content": text
+        })
+
+    # One pass over the shared block scanner; code fences, lists and tables stay whole
+    for event in scan_markdown(md_content):
+        if event.kind == "heading":
             # Create new section
             new_section = {
                 "id": generate_unique_id("section"),
-                "title": title,
-                "level": level,
+                "title": event.title,
+                "level": event.level,
                 "paragraphs": [],
                 "subsections": []
             }
 
             # Place this section at the right hierarchy level
-            while stack and stack[-1]["level"] >= level:
+            while stack and stack[-1]["level"] >= event.level:
                 stack.pop()
             if stack:
-                parent = stack[-1]
-                flush_paragraphs(parent)
-                parent["subsections"].append(new_section)
+                stack[-1]["subsections"].append(new_section)
             else:
                 doc_structure.append(new_section)
 
             stack.append(new_section)
+            for text in pending:
+                add_paragraph(new_section, text)
+            pending = []
         else:
-            if line.strip():
-                paragraph_buffer.append(line)
+            text = md_content[event.start:event.end].strip()
+            if stack:
+                add_paragraph(stack[-1], text)
             else:
-                if stack:
-                    flush_paragraphs(stack[-1])
-
-    # flush leftover paragraphs
-    if stack:
-        flush_paragraphs(stack[-1])
+                pending.append(text)
 
     return doc_structure
 
@@ -1,47 +1,29 @@
 # pages/2_Chunk_Document.py
 import os
-import json
 import streamlit as st
 from chunking import HierarchicalChunker, get_chunking_analysis
+from bulk_chunking import chunk_files
 
 DATA_DIR = "data"
 PROCESSED_DIR = "processed_docs"
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 
 def load_documents():
+    """Map file name -> path for every file in DATA_DIR. Contents are read on demand."""
     docs = {}
     for fname in os.listdir(DATA_DIR):
         fpath = os.path.join(DATA_DIR, fname)
         if os.path.isfile(fpath):
-            try:
-                with open(fpath, "r", encoding="utf-8") as f:
-                    docs[fname] = f.read()
-            except Exception:
-                st.warning(f"Could not read {fname}. Skipping...")
+            docs[fname] = fpath
     return docs
 
-def chunk_to_dict(chunk):
-    """Convert Chunk object to JSON serializable dict."""
-    return {
-        "id": chunk.id,
-        "content": chunk.content,
-        "level": chunk.level,
-        "parent_id": chunk.parent_id,
-        "children_ids": chunk.children_ids,
-        "metadata": chunk.metadata,
-    }
-
-def save_chunks(doc_id, doc_name, strategy, chunks):
-    """Save chunks and metadata to JSON for later embedding."""
-    out = {
-        "doc_id": doc_id,
-        "doc_name": doc_name,
-        "strategy": strategy,
-        "chunks": [chunk_to_dict(c) for c in chunks],
-    }
-    out_path = os.path.join(PROCESSED_DIR, f"{doc_id}.json")
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(out, f, indent=2, ensure_ascii=False)
+def read_document(fpath):
+    try:
+        with open(fpath, "r", encoding="utf-8") as f:
+            return f.read()
+    except Exception:
+        st.warning(f"Could not read {os.path.basename(fpath)}. Skipping...")
+        return None
 
 def main():
     st.title("📄 Document Chunking & Analysis")
@@ -70,6 +52,20 @@ def main():
     elif strategy == "Fixed-size":
         fixed_size = st.sidebar.slider("Fixed-size chunk length (words)", 50, 500, 200, step=50)
 
+    workers = st.sidebar.number_input(
+        "Worker processes (bulk chunking)", min_value=1, max_value=os.cpu_count() or 1,
+        value=os.cpu_count() or 1
+    )
+    incremental = st.sidebar.checkbox(
+        "Incremental re-chunking (reuse unchanged sections, content-based IDs)",
+        value=False, disabled=(strategy == "Fixed-size")
+    )
+    storage_format = st.sidebar.radio(
+        "Storage format",
+        ["Full", "Compact"],
+        help="Compact stores each text once and rebuilds overlap context when loaded"
+    )
+
     # ---- Preview single document ----
     if st.sidebar.button("Run Chunking"):
         st.subheader(f"Chunking Preview: {doc_name}")
@@ -91,7 +87,9 @@ def main():
             fixed_chunk_size=fixed_size if fixed_size else 200
         )
 
-        content = docs[doc_name]
+        content = read_document(docs[doc_name])
+        if content is None:
+            return
         chunks = chunker.chunk_document(content)
 
         # Show stats
@@ -114,32 +112,42 @@ def main():
     if st.sidebar.button("🚀 Create Chunks for All Documents"):
         st.subheader("Processing all documents...")
 
-        for fname, content in docs.items():
-            doc_id = os.path.splitext(fname)[0]
-
-            # Map strategy
-            if strategy == "Hierarchical":
-                mode = "hierarchical"
-            elif strategy == "Hierarchical with Overlap":
-                mode = "hierarchical_overlap"
-            else:
-                mode = "fixed_size"
-
-            chunker = HierarchicalChunker(
-                doc_id=doc_id,
-                title=fname,
-                paragraph_overlap_sentences=paragraph_overlap if paragraph_overlap else 0,
-                sentence_overlap_chars=sentence_overlap if sentence_overlap else 0,
-                strategy=mode,
-                fixed_chunk_size=fixed_size if fixed_size else 200
-            )
-
-            chunks = chunker.chunk_document(content)
+        # Map strategy
+        if strategy == "Hierarchical":
+            mode = "hierarchical"
+        elif strategy == "Hierarchical with Overlap":
+            mode = "hierarchical_overlap"
+        else:
+            mode = "fixed_size"
 
-            # Save to processed_docs
-            save_chunks(doc_id, fname, mode, chunks)
+        chunker_options = {
+            "paragraph_overlap_sentences": paragraph_overlap if paragraph_overlap else 0,
+            "sentence_overlap_chars": sentence_overlap if sentence_overlap else 0,
+            "fixed_chunk_size": fixed_size if fixed_size else 200,
+        }
+
+        # Workers stream each file into processed_docs and report back as they finish
+        progress = st.progress(0.0)
+        throughput = st.empty()
+        changes = {"added": 0, "removed": 0, "updated": 0, "unchanged": 0}
+        for done, result in enumerate(chunk_files(docs.values(), mode, chunker_options,
+                                                  PROCESSED_DIR, workers=int(workers),
+                                                  incremental=incremental,
+                                                  storage=storage_format.lower()), start=1):
+            for key in changes:
+                changes[key] += result.get(key, 0)
+            if result["error"]:
+                st.warning(f"Could not process {result['doc_name']}: {result['error']}. Skipping...")
+            progress.progress(done / len(docs))
+            throughput.markdown(
+                f"**{done}/{len(docs)}** documents · "
+                f"{result['docs_per_s']:.1f} docs/s · {result['mb_per_s']:.2f} MB/s"
+            )
 
         st.success(f"✅ All documents processed and saved in `{PROCESSED_DIR}`")
+        if incremental and mode != "fixed_size":
+            st.markdown("### ♻️ Chunk Changes")
+            st.json(changes)
 
 if __name__ == "__main__":
     main()
@@ -2,27 +2,30 @@
 import os
 import sys
 import json
+import asyncio
 import uuid
-import faiss
 import numpy as np
 import streamlit as st
-from openai import OpenAI
 from dotenv import load_dotenv
 
 # Add parent directory to import chunker if needed
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from chunk_storage import load_chunks
+from embedding_backends import OPENAI_MODELS, create_backend
+from embedding_cache import EmbeddingCache, embed_with_cache
+from embedding_jobs import EmbeddingJob
+from embedding_pipeline import embed_all
+from embedding_plan import DEFAULT_LEVELS, LEVEL_ORDER, plan_embedding
+from embeddings import DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_TOKENS_PER_MINUTE
+from ann_index import INDEX_TYPES, IndexSpec
+from corpus_index import build_corpus, sync_corpus
+from sharded_index import sync_shards
+from vector_compression import STORAGE_FORMATS, compression_report
+from vector_store import index_paths, load_metadata, save_index
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Make sure the API key is available
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    st.error("❌ OPENAI_API_KEY not found in .env. Please set it.")
-    st.stop()
-else:
-    client = OpenAI(api_key=api_key)
-
 # Paths
 DATA_DIR = "processed_docs"   # where chunked docs are stored
 INDEX_DIR = "vector_store"    # where FAISS indexes will be stored
@@ -42,7 +45,8 @@ doc_file = st.selectbox("📑 Select a document", docs)
 with open(os.path.join(DATA_DIR, doc_file), "r", encoding="utf-8") as f:
     doc_data = json.load(f)
 
-chunks = doc_data.get("chunks", [])
+# Compact files are expanded back to full chunks (contextual content rebuilt)
+chunks = load_chunks(doc_data)
 if not chunks:
     st.error("❌ No chunks found in this document. Please check chunking step.")
     st.stop()
@@ -50,62 +54,201 @@ if not chunks:
 st.success(f"Loaded `{doc_file}` with {len(chunks)} chunks")
 
 # Step 2: Choose embedding model
+LOCAL_MODELS = ["all-MiniLM-L6-v2", "all-mpnet-base-v2"]
+MODEL_LABELS = {"hashing": "hashing (offline, deterministic)", **{m: f"{m} (local)" for m in LOCAL_MODELS}}
+
 embedding_model = st.selectbox(
     "🤖 Select embedding model",
-    ["text-embedding-3-small", "text-embedding-3-large"]
+    list(OPENAI_MODELS) + LOCAL_MODELS + ["hashing"],
+    format_func=lambda m: MODEL_LABELS.get(m, m)
 )
 
-# Step 3: Generate embeddings
-if st.button("🚀 Generate & Save Embeddings"):
-    embeddings = []
-    metadata = []
-
+with st.expander("⚙️ Throughput settings"):
+    if embedding_model in OPENAI_MODELS:
+        concurrency = st.number_input("Concurrent requests", min_value=1, max_value=64, value=8)
+        requests_per_minute = st.number_input("Requests per minute (account quota)", min_value=1,
+                                              value=DEFAULT_REQUESTS_PER_MINUTE)
+        tokens_per_minute = st.number_input("Tokens per minute (account quota)", min_value=1000,
+                                            value=DEFAULT_TOKENS_PER_MINUTE, step=10_000)
+    else:
+        batch_size = st.number_input("Batch size", min_value=1, max_value=1024, value=64)
+        threads = st.number_input("CPU threads (0 = default)", min_value=0,
+                                  max_value=os.cpu_count() or 1, value=0)
+        float16 = st.checkbox("float16 output", value=False)
+
+# Shorter vectors and smaller storage formats trade recall for memory; see "Size & recall" below
+DIMENSION_OPTIONS = [None, 1024, 512, 256, 128]
+col1, col2 = st.columns(2)
+with col1:
+    output_dimensions = st.selectbox("📏 Output dimensions", DIMENSION_OPTIONS,
+                                     format_func=lambda d: "Full (model default)" if d is None else str(d))
+with col2:
+    storage = st.selectbox("🗜️ Vector storage", STORAGE_FORMATS,
+                           help="float16 halves the index, int8 quarters it, binary keeps 1 bit per dimension")
+
+# Exact scan is fine up to tens of thousands of chunks; ANN indexes keep queries fast beyond that
+col1, col2 = st.columns(2)
+with col1:
+    index_type = st.selectbox("🧭 Index type", ("auto",) + INDEX_TYPES,
+                              help="auto: exact below 50k vectors, then HNSW, IVF-Flat or IVF-PQ "
+                                   "depending on the memory budget")
+with col2:
+    memory_budget_mb = st.number_input("Memory budget per index (MB)", min_value=1,
+                                       value=IndexSpec().memory_budget // 2 ** 20)
+index_spec = IndexSpec(index_type=index_type, storage=storage, memory_budget=int(memory_budget_mb) * 2 ** 20)
+
+
+# Step 3: Plan what to embed, before any API call
+present_levels = [l for l in LEVEL_ORDER if any(c.get("level") == l for c in chunks)]
+selected_levels = st.multiselect("📐 Levels to embed", present_levels,
+                                 default=[l for l in present_levels if l in DEFAULT_LEVELS])
+retrievable_only = st.checkbox("Only chunks marked retrievable", value=True)
+
+plan = plan_embedding(chunks, embedding_model, selected_levels, retrievable_only)
+st.dataframe(plan.summary(), hide_index=True)
+st.write(f"**Plan:** {len(plan.rows)} of {len(chunks)} chunks, ~{plan.total_tokens:,} tokens, "
+         f"est. cost ${plan.total_cost:.4f} (token counts approximate)")
+
+
+@st.cache_resource
+def load_local_backend(model_name: str, batch_size: int, threads: int, float16: bool, dimensions=None):
+    """Load each local model once per session rather than on every click."""
+    return create_backend(model_name, batch_size=batch_size, threads=threads or None, float16=float16,
+                          dimensions=dimensions)
+
+
+def make_backend(dimensions=output_dimensions):
+    """The embedding backend for the selected model (EMBEDDINGS_STUB=1 fakes OpenAI offline)."""
+    try:
+        if embedding_model not in OPENAI_MODELS:
+            return load_local_backend(embedding_model, int(batch_size), int(threads), float16, dimensions)
+        return create_backend(embedding_model, concurrency=int(concurrency),
+                              requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute,
+                              dimensions=dimensions)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        st.stop()
+
+
+def show_corpus_update(counts):
+    """Report an in-place corpus or shard update (nothing if there is no such index yet)."""
+    if counts is not None and counts["documents"]:
+        st.info(f"🗂️ Corpus index updated: {counts['added']} chunks added, {counts['updated']} updated, "
+                f"{counts['deleted']} deleted, {counts['unchanged']} unchanged"
+                + (" (compacted)" if counts["compacted"] else ""))
+
+
+# Size & recall: embed a sample at full width, then score each (dimensions, storage) setting offline
+with st.expander("📊 Size & recall by setting"):
+    sample_size = st.number_input("Sample chunks", min_value=50, max_value=20_000, value=2000, step=50)
+    if st.button("Estimate", disabled=len(plan.rows) < 20):
+        backend = make_backend(dimensions=None)
+        rng = np.random.default_rng(0)
+        rows = sorted(rng.choice(plan.rows, size=min(int(sample_size), len(plan.rows)), replace=False))
+        cache = EmbeddingCache(os.path.join(INDEX_DIR, "embedding_cache.sqlite"))
+        with st.spinner("Embedding sample at full width..."):
+            sample = asyncio.run(embed_with_cache(cache, backend, [chunks[i]["content"] for i in rows]))
+        cache.close()
+        vectors = sample.matrix[sample.embedded]
+        with st.spinner("Scoring settings..."):
+            report = compression_report(vectors, DIMENSION_OPTIONS, rows=len(plan.rows))
+        st.dataframe(report, hide_index=True)
+        st.caption(f"index_MB is for this document's {len(plan.rows)} planned chunks. Recall@10 uses "
+                   f"{len(vectors)} sampled chunks as queries against exact full-width search, "
+                   f"so it is an upper bound for real queries.")
+
+
+# Step 4: Generate embeddings for the planned chunks only
+if st.button("🚀 Generate & Save Embeddings", disabled=not plan.rows):
     st.info("Generating embeddings... this may take a while ⏳")
-
-    for idx, chunk in enumerate(chunks):
-        try:
-            response = client.embeddings.create(
-                model=embedding_model,
-                input=chunk["content"]
-            )
-            vector = response.data[0].embedding
-            embeddings.append(vector)
-
-            metadata.append({
-                "doc_id": doc_data["doc_id"],
-                "doc_name": doc_data.get("doc_name", ""),
-                "chunk_id": chunk["id"],
-                "strategy": doc_data.get("strategy", "unknown"),
-                "embedding_model": embedding_model,
-                "content": chunk["content"],
-                "level": chunk.get("level", ""),
-                "metadata": chunk.get("metadata", {})
-            })
-
-        except Exception as e:
-            st.error(f"Error generating embedding for chunk {idx}: {e}")
-            st.stop()
-
-    # Convert to numpy array for FAISS
-    embeddings_np = np.array(embeddings).astype("float32")
-
-    # Create FAISS index
-    dim = len(embeddings_np[0])
-    index = faiss.IndexFlatL2(dim)
-    index.add(embeddings_np)
-
-    # Save FAISS index
-    index_path = os.path.join(INDEX_DIR, f"{doc_data['doc_id']}_index.faiss")
-    faiss.write_index(index, index_path)
-
-    # Save metadata
-    meta_path = os.path.join(INDEX_DIR, f"{doc_data['doc_id']}_meta.json")
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=2, ensure_ascii=False)
+    progress = st.progress(0.0)
+
+    # Chunks already in the embedding cache are not embedded again; OpenAI models pack the
+    # rest into as few requests as the limits allow, local models encode them in batches.
+    # Vectors are checkpointed to the job directory, so an interrupted run resumes here.
+    backend = make_backend()
+    chunks = [chunks[i] for i in plan.rows]
+    cache = EmbeddingCache(os.path.join(INDEX_DIR, "embedding_cache.sqlite"))
+    job_dir = os.path.join(INDEX_DIR, "jobs", f"{doc_data['doc_id']}__{backend.name.replace('/', '_')}")
+    job = EmbeddingJob(job_dir, backend, [chunk["id"] for chunk in chunks],
+                       [chunk["content"] for chunk in chunks], cache=cache)
+    if job.completed:
+        st.info(f"Resuming: {len(job.completed)} of {len(chunks)} chunks were already embedded")
+    result = asyncio.run(job.run(progress=lambda done, total: progress.progress(done / total)))
+    cache_stats = cache.stats()
+    cache.close()
+    st.write(f"**Embedding cache:** {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+             f"{result.requests} API requests")
+    if result.failed:
+        st.warning(f"{len(chunks) - int(result.embedded.sum())} chunks could not be embedded; "
+                   f"click Generate again to resume the job. The index is not saved until all are embedded.")
+        st.stop()
+
+    # Save FAISS index and metadata
+    index_path, meta_path = save_index(doc_data, chunks, result.matrix, backend.name, INDEX_DIR, spec=index_spec)
+    metadata = load_metadata(meta_path)
+
+    # The index is saved; the vectors stay in the embedding cache
+    job.clear()
+    show_corpus_update(sync_corpus(INDEX_DIR))
+    show_corpus_update(sync_shards(INDEX_DIR))
 
     st.success(f"✅ Saved embeddings & metadata for {len(chunks)} chunks")
-    st.write(f"**FAISS index:** `{index_path}`")
+    with open(index_paths(doc_data["doc_id"], INDEX_DIR)["report"], "r", encoding="utf-8") as f:
+        report = json.load(f)
+    st.write(f"**FAISS index:** `{index_path}` ({report['factory']}, {os.path.getsize(index_path) / 1e6:.2f} MB, "
+             f"built in {report['build_s']:.2f}s, recall@10 {report.get('recall@10', 1.0):.3f}, "
+             f"{report.get('query_ms', 0.0):.2f} ms/query)")
+    if report.get("sweep"):
+        st.dataframe(report["sweep"], hide_index=True)
     st.write(f"**Metadata file:** `{meta_path}`")
+    st.caption("Raw vectors are kept next to the index (`_vectors.npy`); "
+               "`python rebuild_index.py` builds other index types from them without re-embedding.")
 
     st.markdown("### 🔍 Example Metadata Entry")
     st.json(metadata[0])  # show preview
+
+# Step 5: Embed every processed document in one pipelined run
+st.markdown("---")
+st.subheader("📚 Embed All Documents")
+pipeline_workers = st.number_input("Embedding workers", min_value=1, max_value=64, value=8)
+if st.button("🚀 Embed & Index All Documents"):
+    backend = make_backend()
+    cache = EmbeddingCache(os.path.join(INDEX_DIR, "embedding_cache.sqlite"))
+    progress = st.progress(0.0)
+    stage_table = st.empty()
+
+    def show(stats):
+        progress.progress(stats.docs_done / max(stats.docs_total, 1))
+        stage_table.dataframe(stats.rows(), hide_index=True)
+
+    # Reading, embedding, FAISS adds and file writes overlap; bounded queues keep memory flat
+    results = asyncio.run(embed_all(
+        [os.path.join(DATA_DIR, f) for f in docs], backend, cache=cache,
+        levels=selected_levels, retrievable_only=retrievable_only, index_dir=INDEX_DIR,
+        workers=int(pipeline_workers), spec=index_spec, progress=show
+    ))
+    cache.close()
+    for r in results:
+        if r.error:
+            st.warning(f"{r.doc_id}: {r.error}")
+    done = [r for r in results if not r.error]
+    st.success(f"✅ Indexed {len(done)} of {len(results)} documents "
+               f"({sum(r.chunks for r in done)} chunks) in `{INDEX_DIR}`")
+    show_corpus_update(sync_corpus(INDEX_DIR))
+    show_corpus_update(sync_shards(INDEX_DIR))
+
+# Step 6: Merge every document's index into one corpus index (one search for all documents)
+st.markdown("---")
+st.subheader("🗂️ Corpus Index")
+if st.button("🔗 Build Corpus Index"):
+    with st.spinner("Merging document indexes..."):
+        try:
+            corpus = build_corpus(INDEX_DIR, index_spec)
+        except (OSError, ValueError) as e:
+            st.error(f"❌ {e}")
+            st.stop()
+    for doc_id, reason in corpus["skipped"].items():
+        st.warning(f"{doc_id} skipped: {reason}")
+    st.success(f"✅ Corpus index: {corpus['documents']} documents, {corpus['rows']} chunks "
+               f"({corpus['index']['factory']}, {corpus['embedding_model']})")
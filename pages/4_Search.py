@@ -0,0 +1,87 @@
+# pages/4_Search.py
+import os
+import sys
+import logging
+import streamlit as st
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from retrieval import CONTEXT_LEVELS, SearchEngine
+
+# Load environment variables from .env file (OpenAI models embed the query through the API)
+load_dotenv()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+INDEX_DIR = "vector_store"    # where 3_Embeddings saved the FAISS indexes
+DATA_DIR = "processed_docs"   # processed documents, for chunk contexts
+
+
+@st.cache_resource
+def get_engine(index_dir: str, processed_dir: str) -> SearchEngine:
+    """One engine per process: indexes load on first search and stay loaded across reruns."""
+    return SearchEngine(index_dir, processed_dir)
+
+
+engine = get_engine(INDEX_DIR, DATA_DIR)
+
+st.title("🔍 Search Documents")
+
+doc_ids = engine.available()
+if not doc_ids:
+    st.warning("⚠️ No indexes found. Please go to '3_Embeddings' and embed a document first.")
+    st.stop()
+
+selected_docs = st.multiselect("📑 Documents to search", doc_ids, default=doc_ids)
+query = st.text_input("💬 Query", placeholder="Ask something about your documents...")
+
+col1, col2 = st.columns(2)
+with col1:
+    k = st.slider("Results (top-k)", min_value=1, max_value=50, value=5)
+with col2:
+    context_level = st.selectbox("Context returned with each hit", CONTEXT_LEVELS, index=1)
+
+if query and selected_docs:
+    try:
+        result = engine.search(query, k=k, doc_ids=selected_docs, context_level=context_level)
+    except (ValueError, ImportError, RuntimeError) as e:
+        st.error(f"❌ {e}")
+        st.stop()
+
+    t = result.timings
+    st.caption(f"⏱️ {t['total']:.1f} ms total · embed {t['embed']:.1f} ms · "
+               f"search {t['search']:.1f} ms · context {t['context']:.1f} ms")
+    if not result.hits:
+        st.info("No results.")
+
+    for rank, hit in enumerate(result.hits, 1):
+        with st.expander(f"#{rank} · {hit.score:.3f} · {hit.doc_id} · {hit.level} · `{hit.chunk_id}`",
+                         expanded=rank <= 3):
+            st.markdown(hit.content)
+            if context_level != "chunk" and hit.context != hit.content:
+                st.markdown(f"**{context_level.capitalize()} context:**")
+                st.text(hit.context)
+            if hit.metadata:
+                st.json(hit.metadata, expanded=False)
+
+# Latency of recent queries, across all sessions of this process
+with st.sidebar:
+    st.subheader("⏱️ Query latency")
+    summary = engine.latency_summary()
+    st.metric("Queries", summary["queries"])
+    if summary["queries"]:
+        st.metric("p50", f"{summary['p50_ms']:.1f} ms")
+        st.metric("p95", f"{summary['p95_ms']:.1f} ms")
+        st.metric("p99", f"{summary['p99_ms']:.1f} ms")
+    shards = engine.shards()
+    corpus = engine.corpus()
+    if shards is not None:
+        covered = sum(shards.covers(doc_id, INDEX_DIR) for doc_id in doc_ids)
+        st.caption(f"🧩 Sharded store: {covered} of {len(doc_ids)} documents searched across "
+                   f"{len(shards.clients)} shard processes")
+    elif corpus is not None:
+        covered = sum(corpus.covers(doc_id, INDEX_DIR) for doc_id in doc_ids)
+        st.caption(f"🗂️ Corpus index: {covered} of {len(doc_ids)} documents searched in one call"
+                   f" ({corpus.manifest['index']['factory']}, {corpus.tombstone_ratio:.0%} deleted awaiting compaction)")
+    if st.button("🔄 Reload indexes"):
+        engine.clear()
+        st.rerun()
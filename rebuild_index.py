@@ -0,0 +1,151 @@
+# rebuild_index.py
+"""
+Rebuild FAISS indexes from the raw vectors saved next to them, without re-embedding.
+
+Every embedding run writes <doc_id>_vectors.npy beside the index. This reads
+it memory-mapped and builds a new index of another type (exact, HNSW, IVF-Flat,
+IVF-PQ or auto), storage format, metric or shorter width, at disk speed.
+Indexes written before the sidecar existed get one first, recovered from the
+index if it is an exact float32 index.
+
+Each build writes <doc_id>_build_report.json: build time, size, recall@10
+against exact search and an nprobe/efSearch sweep.
+
+--corpus instead merges the documents' vectors into one corpus index with
+stable chunk IDs (corpus_index), for single-call search over all of them.
+--shards N splits them across N such indexes by document (sharded_index),
+searched in parallel by shard processes.
+
+Usage:
+    python rebuild_index.py                                  # every document in vector_store/
+    python rebuild_index.py --storage int8 --metric ip
+    python rebuild_index.py --index-type auto --memory-budget-mb 512 --target-recall 0.95
+    python rebuild_index.py --index-type ivf_pq --nlist 1024 --pq-m 32 --nprobe 32
+    python rebuild_index.py --doc my_doc --dimensions 256 --output-dir /tmp/experiment
+    python rebuild_index.py --corpus --index-type auto
+    python rebuild_index.py --shards 4 --index-type hnsw
+"""
+import argparse
+import os
+import sys
+import time
+
+from ann_index import INDEX_TYPES, IndexSpec
+from corpus_index import build_corpus
+from sharded_index import build_shards
+from vector_compression import METRICS, STORAGE_FORMATS
+from vector_store import INDEX_DIR, export_vectors, index_paths, rebuild_index
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild FAISS indexes from their vectors sidecar")
+    parser.add_argument("--index-dir", default=INDEX_DIR, help="Directory of indexes to rebuild")
+    parser.add_argument("--doc", nargs="+", default=None, help="Document IDs (default: all)")
+    parser.add_argument("--storage", choices=STORAGE_FORMATS, default="float32")
+    parser.add_argument("--metric", choices=list(METRICS), default="l2")
+    parser.add_argument("--dimensions", type=int, default=None, help="Truncate vectors to this width")
+    parser.add_argument("--output-dir", default=None, help="Write here instead of replacing the indexes")
+    parser.add_argument("--corpus", action="store_true", help="Build the corpus index from these documents")
+    parser.add_argument("--shards", type=int, default=0, help="Build a sharded store of this many shards")
+
+    ann = parser.add_argument_group("index type")
+    ann.add_argument("--index-type", choices=("auto",) + INDEX_TYPES, default="flat")
+    ann.add_argument("--memory-budget-mb", type=float, default=IndexSpec().memory_budget / 2 ** 20,
+                     help="Memory budget per index, for --index-type auto")
+    ann.add_argument("--nlist", type=int, default=0, help="IVF cells (default 4*sqrt(n))")
+    ann.add_argument("--pq-m", type=int, default=0, help="PQ sub-quantizers (default: from the budget)")
+    ann.add_argument("--pq-bits", type=int, default=8)
+    ann.add_argument("--hnsw-m", type=int, default=32, help="HNSW links per node")
+    ann.add_argument("--ef-construction", type=int, default=40)
+    ann.add_argument("--nprobe", type=int, default=16, help="IVF cells scanned per query")
+    ann.add_argument("--ef-search", type=int, default=64, help="HNSW candidates per query")
+    ann.add_argument("--target-recall", type=float, default=None,
+                     help="Keep the smallest nprobe/efSearch reaching this recall@10")
+    return parser.parse_args(argv)
+
+
+def index_spec(args) -> IndexSpec:
+    return IndexSpec(index_type=args.index_type, storage=args.storage, nlist=args.nlist, pq_m=args.pq_m,
+                     pq_bits=args.pq_bits, hnsw_m=args.hnsw_m, ef_construction=args.ef_construction,
+                     nprobe=args.nprobe, ef_search=args.ef_search,
+                     memory_budget=int(args.memory_budget_mb * 2 ** 20), target_recall=args.target_recall)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    doc_ids = args.doc or sorted(f[:-len("_index.faiss")] for f in os.listdir(args.index_dir)
+                                 if f.endswith("_index.faiss"))
+    if not doc_ids:
+        print(f"No indexes found in {args.index_dir}")
+        return 1
+
+    spec = index_spec(args)
+    if args.shards:
+        return shards_main(args, spec)
+    if args.corpus:
+        return corpus_main(args, doc_ids, spec)
+
+    failed, total_rows, total_seconds = [], 0, 0.0
+    print(f"{'document':<32}{'rows':>10}{'seconds':>10}{'rows/s':>12}{'MB':>10}  {'index':<16}"
+          f"{'recall@10':>10}{'ms/query':>10}")
+    for doc_id in doc_ids:
+        manifest_path = index_paths(doc_id, args.index_dir)["manifest"]
+        if not os.path.exists(manifest_path) and export_vectors(doc_id, args.index_dir) is None:
+            failed.append(doc_id)
+            print(f"{doc_id:<32} ! no vectors sidecar and the index is not exact float32; embed it again")
+            continue
+        start = time.perf_counter()
+        try:
+            manifest, report = rebuild_index(manifest_path, spec, args.metric, args.dimensions, args.output_dir)
+        except (OSError, ValueError) as e:
+            failed.append(doc_id)
+            print(f"{doc_id:<32} ! {e}")
+            continue
+        seconds = time.perf_counter() - start
+        size = os.path.getsize(index_paths(doc_id, args.output_dir or args.index_dir)["index"])
+        total_rows += manifest["rows"]
+        total_seconds += seconds
+        print(f"{doc_id:<32}{manifest['rows']:>10}{seconds:>10.2f}{manifest['rows'] / max(seconds, 1e-9):>12.0f}"
+              f"{size / 1e6:>10.2f}  {report['factory']:<16}{report.get('recall@10', 1.0):>10.3f}"
+              f"{report.get('query_ms', 0.0):>10.3f}")
+
+    print(f"{'total':<32}{total_rows:>10}{total_seconds:>10.2f}")
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+    return 1 if failed else 0
+
+
+def corpus_main(args, doc_ids, spec) -> int:
+    start = time.perf_counter()
+    try:
+        manifest = build_corpus(args.index_dir, spec, doc_ids, args.output_dir, metric=args.metric)
+    except (OSError, ValueError) as e:
+        print(f"! {e}")
+        return 1
+    seconds = time.perf_counter() - start
+    for doc_id, reason in manifest["skipped"].items():
+        print(f"{doc_id:<32} ! skipped: {reason}")
+    print(f"corpus: {manifest['documents']} documents, {manifest['rows']} chunks, {manifest['embedding_model']}, "
+          f"{manifest['index']['factory']} in {seconds:.2f}s")
+    return 1 if manifest["skipped"] else 0
+
+
+def shards_main(args, spec) -> int:
+    start = time.perf_counter()
+    try:
+        manifest = build_shards(args.index_dir, args.shards, spec, args.output_dir, metric=args.metric)
+    except (OSError, ValueError) as e:
+        print(f"! {e}")
+        return 1
+    seconds = time.perf_counter() - start
+    print(f"{'shard':<32}{'documents':>10}{'rows':>10}  index")
+    for shard, built in manifest["built"].items():
+        print(f"{shard:<32}{built['documents']:>10}{built['rows']:>10}  {built['factory']}")
+    for doc_id, reason in manifest["skipped"].items():
+        print(f"{doc_id:<32} ! skipped: {reason}")
+    print(f"{len(manifest['built'])} of {manifest['shards']} shards built in {seconds:.2f}s")
+    return 1 if manifest["skipped"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
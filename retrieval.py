@@ -0,0 +1,290 @@
+# retrieval.py
+"""
+Search over the saved document indexes.
+
+A SearchEngine loads a document's index, metadata and context index the
+first time the document is searched, and keeps them for the life of the
+process. A document is reloaded only after its files change on disk (for
+example, after re-embedding or rebuild_index). The Search page shares one
+engine across reruns and sessions through st.cache_resource.
+
+A query is embedded once per embedding model, with the backend the index was
+built for. The manifest names that model, including any "@<dimensions>"
+width. Documents held (at their current version) by the corpus index
+(corpus_index) are searched together in one FAISS call. If a sharded store
+(sharded_index) has been built, it takes the corpus index's place: one
+scatter-gather across the shard processes. Any other selected document's own
+index is searched separately. The hits are merged by score and
+resolved to their contexts:
+
+    engine = SearchEngine()
+    result = engine.search("How do I request leave?", k=5, context_level="section")
+    for hit in result.hits:
+        print(hit.score, hit.chunk_id, hit.context)
+
+Scores are similarities, so hits from different indexes compare. Inner
+product indexes give the dot product. L2 indexes over unit vectors give
+1 - d²/2, the cosine. Binary indexes give 1 - 2·hamming/bits.
+
+Every query logs its latency per step (embed, search, context) at INFO level
+on the "retrieval" logger. The engine also keeps recent latencies, so
+latency_summary() can report percentiles.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+from bulk_chunking import PROCESSED_DIR, load_processed
+from context_index import ContextIndex
+from ann_index import search_params, set_search_params
+from corpus_index import CorpusIndex, current_corpus
+from sharded_index import ShardedIndex, shards_manifest_path
+from embedding_backends import EmbeddingBackend, create_backend
+from vector_compression import index_metric, search as search_index, similarity
+from vector_store import INDEX_DIR, index_paths, load_index, load_manifest, load_metadata
+
+logger = logging.getLogger("retrieval")
+
+CONTEXT_LEVELS = ("chunk", "paragraph", "section", "document")
+LATENCY_WINDOW = 1000  # queries kept for latency_summary
+
+
+class Hit(NamedTuple):
+    doc_id: str
+    chunk_id: str
+    score: float
+    level: str
+    content: str
+    context: str     # the chunk's ancestor at the requested context level (or the chunk itself)
+    metadata: Dict
+
+
+class SearchResult(NamedTuple):
+    hits: List[Hit]
+    timings: Dict[str, float]  # milliseconds: embed, search, context, total
+
+
+class DocumentIndex:
+    """One document's index and row metadata."""
+
+    def __init__(self, doc_id: str, index_dir: str = INDEX_DIR):
+        self.doc_id = doc_id
+        paths = index_paths(doc_id, index_dir)
+        self.index = load_index(paths["index"])
+        self.metadata: List[Dict] = load_metadata(paths["meta"])
+        if os.path.exists(paths["manifest"]):
+            entry = load_manifest(paths["manifest"])["index"]
+            self.embedding_model = entry["embedding_model"]
+            set_search_params(self.index, **entry.get("search_params", {}))
+        else:
+            # Indexes written before manifests existed: the model is on every metadata entry
+            self.embedding_model = self.metadata[0]["embedding_model"] if self.metadata else ""
+        self.metric = index_metric(self.index)
+        self.version = _version(paths)
+        # Per-search nprobe / efSearch overrides are set on the shared index
+        self.lock = threading.Lock()
+
+    def search(self, query_vector: np.ndarray, k: int, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None):
+        """
+        (scores, rows) of the `k` best rows; rows of -1 (fewer than k vectors) are dropped.
+        `nprobe` / `ef_search` override the index's own setting for this search.
+        """
+        with self.lock:
+            default = search_params(self.index)
+            set_search_params(self.index, nprobe, ef_search)
+            try:
+                distances, rows = search_index(self.index, query_vector, min(k, self.index.ntotal))
+            finally:
+                set_search_params(self.index, **default)
+        distances, rows = distances[0], rows[0]
+        keep = rows >= 0
+        return similarity(distances[keep], self.metric, self.index.d), rows[keep]
+
+
+class SearchEngine:
+    """Loaded-once corpus, shard and document indexes and query backends, shared by every search."""
+
+    def __init__(self, index_dir: str = INDEX_DIR, processed_dir: str = PROCESSED_DIR,
+                 corpus_dir: Optional[str] = None, shards_dir: Optional[str] = None):
+        self.index_dir = index_dir
+        self.processed_dir = processed_dir
+        self.corpus_dir = corpus_dir or os.path.join(index_dir, "corpus")
+        self.shards_dir = shards_dir or os.path.join(index_dir, "shards")
+        self._corpus: Optional[CorpusIndex] = None
+        self._shards: Optional[ShardedIndex] = None
+        self._documents: Dict[str, DocumentIndex] = {}
+        self._context_indexes: Dict[str, Optional[ContextIndex]] = {}
+        self._backends: Dict[str, EmbeddingBackend] = {}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        # Guards the loaded indexes and backends: sessions search from their own threads
+        self.lock = threading.RLock()
+
+    def available(self) -> List[str]:
+        """IDs of the documents that have an index in index_dir (the corpus only copies them)."""
+        if not os.path.isdir(self.index_dir):
+            return []
+        return sorted(f[:-len("_index.faiss")] for f in os.listdir(self.index_dir) if f.endswith("_index.faiss"))
+
+    def corpus(self) -> Optional[CorpusIndex]:
+        """
+        The loaded corpus index, (re)loaded after a build or compaction and brought up to date
+        with in-place updates; None if there is none.
+        """
+        with self.lock:
+            self._corpus = current_corpus(self.corpus_dir, self._corpus)
+            return self._corpus
+
+    def shards(self) -> Optional[ShardedIndex]:
+        """The sharded store, its shard servers (re)started after a build; None if there is none."""
+        path = shards_manifest_path(self.shards_dir)
+        with self.lock:
+            if self._shards is not None and (not os.path.exists(path)
+                                             or self._shards.version != os.path.getmtime(path)):
+                self._shards.close()
+                self._shards = None
+            if self._shards is None and os.path.exists(path):
+                self._shards = ShardedIndex(self.shards_dir)
+            return self._shards
+
+    def document(self, doc_id: str) -> DocumentIndex:
+        """The document's loaded index, (re)loaded if it is new or its files changed."""
+        with self.lock:
+            loaded = self._documents.get(doc_id)
+            if loaded is None or loaded.version != _version(index_paths(doc_id, self.index_dir)):
+                loaded = DocumentIndex(doc_id, self.index_dir)
+                self._documents[doc_id] = loaded
+                self._context_indexes.pop(doc_id, None)
+            return loaded
+
+    def context_index(self, doc_id: str) -> Optional[ContextIndex]:
+        """Built on first use from the processed document; None if that file is gone."""
+        with self.lock:
+            if self._context_indexes.get(doc_id) is None:
+                doc_data = load_processed(os.path.join(self.processed_dir, f"{doc_id}.json"))
+                self._context_indexes[doc_id] = ContextIndex.from_processed(doc_data) if doc_data is not None else None
+            return self._context_indexes[doc_id]
+
+    def backend(self, model: str) -> EmbeddingBackend:
+        with self.lock:
+            if model not in self._backends:
+                self._backends[model] = create_backend(model)
+            return self._backends[model]
+
+    def embed_query(self, query: str, model: str) -> np.ndarray:
+        result = asyncio.run(self.backend(model).embed([query]))
+        if result.failed:
+            raise RuntimeError(f"Could not embed the query with {model}: {result.failed[0][2]}")
+        return result.matrix[:1]
+
+    def search(self, query: str, k: int = 5, doc_ids: Optional[Iterable[str]] = None,
+               context_level: str = "paragraph", nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None) -> SearchResult:
+        """
+        The `k` best chunks for `query` across `doc_ids` (default: every indexed document),
+        best first, each with its context at `context_level` ("chunk" for the chunk itself).
+        `nprobe` (IVF) and `ef_search` (HNSW) trade speed for recall on ANN indexes.
+        """
+        start = time.perf_counter()
+        doc_ids = list(doc_ids) if doc_ids is not None else self.available()
+        corpus = self.shards() or self.corpus()
+        in_corpus = [d for d in doc_ids if corpus is not None and corpus.covers(d, self.index_dir)]
+        covered = set(in_corpus)
+        documents = [self.document(doc_id) for doc_id in doc_ids if doc_id not in covered]
+        timings = {"embed": 0.0, "search": 0.0, "context": 0.0}
+        query_vectors: Dict[str, np.ndarray] = {}
+
+        def query_vector(model: str) -> np.ndarray:
+            step = time.perf_counter()
+            if model not in query_vectors:
+                query_vectors[model] = self.embed_query(query, model)
+            timings["embed"] += time.perf_counter() - step
+            return query_vectors[model]
+
+        candidates = []  # (score, doc_id, metadata entry)
+        if in_corpus:
+            vector = query_vector(corpus.embedding_model)
+            step = time.perf_counter()
+            # All of them at once: no selector is needed when the whole corpus is selected
+            selected = None if len(covered) == len(corpus.doc_ids) else in_corpus
+            if isinstance(corpus, ShardedIndex):
+                candidates.extend(corpus.search(vector, k, selected, nprobe, ef_search))
+            else:
+                distances, slots = corpus.search(vector, k, selected, nprobe, ef_search)
+                scores = similarity(distances, corpus.metric, corpus.index.d)
+                entries = corpus.lookup(slots.tolist())
+                candidates.extend((score, entries[slot]["doc_id"], entries[slot])
+                                  for score, slot in zip(scores.tolist(), slots.tolist()) if slot in entries)
+            timings["search"] += time.perf_counter() - step
+
+        for document in documents:
+            if document.index.ntotal == 0:
+                continue
+            vector = query_vector(document.embedding_model)
+            step = time.perf_counter()
+            scores, rows = document.search(vector, k, nprobe, ef_search)
+            candidates.extend((score, document.doc_id, document.metadata[row])
+                              for score, row in zip(scores.tolist(), rows.tolist()))
+            timings["search"] += time.perf_counter() - step
+        candidates.sort(key=lambda c: -c[0])
+        candidates = candidates[:k]
+
+        step = time.perf_counter()
+        hits = self._hits(candidates, context_level)
+        timings["context"] = time.perf_counter() - step
+
+        timings = {name: seconds * 1000 for name, seconds in timings.items()}
+        timings["total"] = (time.perf_counter() - start) * 1000
+        self.latencies.append(timings["total"])
+        logger.info("query k=%d docs=%d corpus=%d hits=%d embed=%.1fms search=%.1fms context=%.1fms "
+                    "total=%.1fms", k, len(doc_ids), len(in_corpus), len(hits), timings["embed"],
+                    timings["search"], timings["context"], timings["total"])
+        return SearchResult(hits, timings)
+
+    def _hits(self, candidates, context_level: str) -> List[Hit]:
+        # One batched context lookup per document
+        contexts: Dict[str, Dict[str, str]] = {}
+        if context_level != "chunk":
+            by_doc: Dict[str, List[str]] = {}
+            for _, doc_id, entry in candidates:
+                by_doc.setdefault(doc_id, []).append(entry["chunk_id"])
+            for doc_id, chunk_ids in by_doc.items():
+                context_index = self.context_index(doc_id)
+                if context_index is not None:
+                    contexts[doc_id] = context_index.get_contexts(chunk_ids, context_level)
+
+        hits = []
+        for score, doc_id, entry in candidates:
+            context = contexts.get(doc_id, {}).get(entry["chunk_id"], entry["content"])
+            hits.append(Hit(doc_id, entry["chunk_id"], score, entry.get("level", ""),
+                            entry["content"], context, entry.get("metadata", {})))
+        return hits
+
+    def latency_summary(self) -> Dict[str, float]:
+        """Count and p50/p95/p99 of recent query latencies, in milliseconds."""
+        if not self.latencies:
+            return {"queries": 0}
+        p50, p95, p99 = np.percentile(np.fromiter(self.latencies, dtype=np.float64), [50, 95, 99])
+        return {"queries": len(self.latencies), "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99)}
+
+    def clear(self):
+        """Drop every loaded index (the next search reloads from disk) and stop the shard servers."""
+        with self.lock:
+            if self._shards is not None:
+                self._shards.close()
+                self._shards = None
+            self._corpus = None
+            self._documents.clear()
+            self._context_indexes.clear()
+
+
+def _version(paths: Dict[str, str]):
+    """Modification times of the files a loaded document depends on."""
+    return tuple(os.path.getmtime(paths[name]) if os.path.exists(paths[name]) else None
+                 for name in ("index", "meta", "manifest"))
@@ -0,0 +1,35 @@
+# shard_server.py
+"""
+Serve one shard of a sharded store (sharded_index) to remote coordinators.
+
+The shard directory comes from rebuild_index.py --shards, copied to this node
+along with whatever keeps it in sync. Coordinators connect with
+ShardedIndex(addresses=[(host, port), ...]). The server and its coordinators
+authenticate with the shared secret in SHARD_AUTHKEY.
+
+Usage:
+    SHARD_AUTHKEY=... python shard_server.py vector_store/shards/shard_000 --host 0.0.0.0 --port 6100
+"""
+import argparse
+import os
+import sys
+
+from sharded_index import AUTHKEY_ENV, serve
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve one shard of a sharded vector store")
+    parser.add_argument("shard_dir", help="Shard directory (vector_store/shards/shard_NNN)")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=6100)
+    args = parser.parse_args(argv)
+    if not os.environ.get(AUTHKEY_ENV):
+        print(f"Set {AUTHKEY_ENV} to the secret shared with the coordinator")
+        return 1
+    print(f"Serving {args.shard_dir} on {args.host}:{args.port}")
+    serve(args.shard_dir, (args.host, args.port), os.environ[AUTHKEY_ENV].encode("utf-8"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+# sharded_index.py
+"""
+A corpus index split across shards, searched by scatter-gather.
+
+build_shards partitions documents across N shards by a hash of doc_id
+(corpus_index.shard_of). Each shard is an ordinary corpus index with its own
+FAISS file and chunk table, updated in place and compacted like the single
+corpus:
+
+    vector_store/shards/
+        shards.json     shard count, embedding model, metric, dimensions
+        shard_000/      corpus_index directory for the documents of shard 0
+        shard_001/      ...
+
+A shard server holds one shard in memory and answers over
+multiprocessing.connection, which works between processes of one machine
+and over TCP between machines alike:
+
+    python shard_server.py vector_store/shards/shard_000 --port 6100   # SHARD_AUTHKEY in the environment
+
+ShardedIndex is the coordinator. By default it starts one server subprocess
+per local shard. It can also connect to servers at given addresses. A search
+is sent to every shard holding selected documents before any reply is read,
+so the shards work on it in parallel. Each shard returns its own top k,
+scored and resolved to chunk entries. The coordinator heap-merges them into
+the global top k.
+
+Shard processes give a query more cores than one FAISS call gets, and let the
+corpus outgrow one machine's RAM. They cost one round trip per query, so
+measure with bench_shards.py before sharding a corpus that fits one index.
+"""
+import heapq
+import os
+import shutil
+import threading
+import multiprocessing
+from itertools import islice
+from multiprocessing.connection import Client, Listener
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ann_index import IndexSpec
+from corpus_index import (CorpusIndex, build_corpus, current_corpus, load_document_manifests, majority_model,
+                          shard_of, sync_corpus, _indexed_documents)
+from vector_compression import similarity
+from vector_store import INDEX_DIR, _write_json, index_paths, load_manifest
+
+SHARDS_DIR = os.path.join(INDEX_DIR, "shards")
+AUTHKEY_ENV = "SHARD_AUTHKEY"  # shared secret of remote shard servers and their coordinator
+
+
+def shards_manifest_path(shards_dir: str = SHARDS_DIR) -> str:
+    return os.path.join(shards_dir, "shards.json")
+
+
+def shard_dir(shards_dir: str, shard: int) -> str:
+    return os.path.join(shards_dir, f"shard_{shard:03d}")
+
+
+def build_shards(index_dir: str = INDEX_DIR, shards: int = 4, spec: IndexSpec = IndexSpec(index_type="auto"),
+                 shards_dir: Optional[str] = None, embedding_model: Optional[str] = None,
+                 metric: str = "l2") -> Dict:
+    """
+    Build `shards` corpus indexes over the per-document indexes in `index_dir`, each holding
+    the documents that hash to it. Shards no document hashes to are left out. Returns the
+    store manifest, with each shard's document and chunk counts.
+    """
+    if shards < 1:
+        raise ValueError("A sharded store needs at least one shard")
+    shards_dir = shards_dir or os.path.join(index_dir, "shards")
+    doc_ids = _indexed_documents(index_dir)
+    # One model for every shard, so a query is embedded once
+    embedding_model = embedding_model or majority_model(load_document_manifests(index_dir, doc_ids)[0])
+    if embedding_model is None:
+        raise ValueError("No embedded documents to build a sharded store from")
+
+    os.makedirs(shards_dir, exist_ok=True)
+    manifest = {"shards": shards, "embedding_model": embedding_model, "metric": metric, "dimensions": None,
+                "built": {}, "skipped": {}}
+    for shard in range(shards):
+        path = shard_dir(shards_dir, shard)
+        members = [doc_id for doc_id in doc_ids if shard_of(doc_id, shards) == shard]
+        if not members:
+            shutil.rmtree(path, ignore_errors=True)
+            continue
+        try:
+            built = build_corpus(index_dir, spec, members, path, embedding_model, metric, (shard, shards))
+        except ValueError:
+            # Nothing embedded with this model among the shard's documents
+            shutil.rmtree(path, ignore_errors=True)
+            continue
+        manifest["dimensions"] = built["dimensions"]
+        manifest["built"][str(shard)] = {"documents": built["documents"], "rows": built["rows"],
+                                         "factory": built["index"]["factory"]}
+        manifest["skipped"].update(built["skipped"])
+    if not manifest["built"]:
+        raise ValueError(f"No documents embedded with {embedding_model} to shard")
+    # Shard directories from an earlier build with more shards
+    for name in os.listdir(shards_dir):
+        if name.startswith("shard_") and int(name[len("shard_"):]) >= shards:
+            shutil.rmtree(os.path.join(shards_dir, name), ignore_errors=True)
+    _write_json(shards_manifest_path(shards_dir), manifest)
+    return manifest
+
+
+def sync_shards(index_dir: str = INDEX_DIR, shards_dir: Optional[str] = None,
+                compact: bool = True) -> Optional[Dict[str, int]]:
+    """Update every shard in place (see corpus_index.sync_corpus); summed counts, or None without shards."""
+    shards_dir = shards_dir or os.path.join(index_dir, "shards")
+    if not os.path.exists(shards_manifest_path(shards_dir)):
+        return None
+    total: Dict[str, int] = {}
+    for shard in range(load_manifest(shards_manifest_path(shards_dir))["shards"]):
+        counts = sync_corpus(index_dir, shard_dir(shards_dir, shard), compact) or {}
+        for name, count in counts.items():
+            total[name] = total.get(name, 0) + count
+    return total
+
+
+def serve(corpus_dir: str, address: Tuple[str, int], authkey: bytes, ready=None):
+    """
+    Serve one shard until the process is stopped. `ready` (a Pipe end) receives the bound
+    address once the shard is loaded, for servers started on port 0.
+    """
+    listener = Listener(address, authkey=authkey)
+    state = _ShardState(corpus_dir)
+    if ready is not None:
+        ready.send(listener.address)
+        ready.close()
+    while True:
+        conn = listener.accept()
+        threading.Thread(target=state.handle, args=(conn,), daemon=True).start()
+
+
+class _ShardState:
+    """The shard a server holds, kept current as the shard is updated or compacted."""
+
+    def __init__(self, corpus_dir: str):
+        self.corpus_dir = corpus_dir
+        self.lock = threading.Lock()
+        self.corpus: Optional[CorpusIndex] = current_corpus(corpus_dir)
+
+    def current(self) -> CorpusIndex:
+        with self.lock:
+            self.corpus = current_corpus(self.corpus_dir, self.corpus)
+            if self.corpus is None:
+                raise ValueError(f"No corpus index in {self.corpus_dir}")
+            return self.corpus
+
+    def handle(self, conn):
+        """Answer one coordinator's requests until it disconnects."""
+        sent = None  # state of the documents table last sent on this connection
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    corpus = self.current()
+                    if request[0] == "search":
+                        reply = self.search(corpus, *request[1:])
+                    elif request[0] == "info":
+                        reply = {"shard": corpus.shard, "embedding_model": corpus.embedding_model,
+                                 "metric": corpus.metric, "rows": corpus.index.ntotal - corpus.dead}
+                    else:
+                        raise ValueError(f"Unknown request {request[0]!r}")
+                    # Document versions ride along whenever they changed, for the coordinator's covers()
+                    state = (corpus.version, corpus._data_version)
+                    documents = corpus.documents if state != sent else None
+                    sent = state
+                    conn.send(("ok", reply, documents))
+                except Exception as e:  # the coordinator raises it; the server keeps serving
+                    conn.send(("error", f"{type(e).__name__}: {e}", None))
+
+    @staticmethod
+    def search(corpus: CorpusIndex, query_vector, k, doc_ids, nprobe, ef_search) -> List[Tuple[float, str, Dict]]:
+        distances, slots = corpus.search(query_vector, k, doc_ids, nprobe, ef_search)
+        scores = similarity(distances, corpus.metric, corpus.index.d)
+        entries = corpus.lookup(slots.tolist())
+        return [(score, entries[slot]["doc_id"], entries[slot])
+                for score, slot in zip(scores.tolist(), slots.tolist()) if slot in entries]
+
+
+class ShardClient:
+    """Connection to one shard server: a local subprocess or a remote node."""
+
+    def __init__(self, address: Tuple[str, int], authkey: bytes, process=None):
+        self.address = address
+        self.process = process
+        self.conn = Client(address, authkey=authkey)
+
+    def send(self, *request):
+        try:
+            self.conn.send(request)
+        except OSError as e:
+            raise RuntimeError(f"Shard server {self.address} is unreachable: {e}") from e
+
+    def recv(self):
+        """(reply, documents or None); raises RuntimeError for server-side errors."""
+        try:
+            status, reply, documents = self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise RuntimeError(f"Shard server {self.address} is unreachable: {e}") from e
+        if status != "ok":
+            raise RuntimeError(f"Shard server {self.address}: {reply}")
+        return reply, documents
+
+    def close(self):
+        self.conn.close()
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+
+
+class ShardedIndex:
+    """
+    Coordinator over the shards of a sharded store. Without `addresses`, one server
+    subprocess per shard directory is started here; with them (host, port pairs, in any
+    order), it connects to running servers sharing `authkey` (default: SHARD_AUTHKEY).
+    """
+
+    def __init__(self, shards_dir: str = SHARDS_DIR, addresses: Optional[Sequence[Tuple[str, int]]] = None,
+                 authkey: Optional[bytes] = None):
+        path = shards_manifest_path(shards_dir)
+        self.shards_dir = shards_dir
+        self.manifest = load_manifest(path)
+        self.version = os.path.getmtime(path)
+        self.embedding_model = self.manifest["embedding_model"]
+        self.metric = self.manifest["metric"]
+        self.dimensions = self.manifest["dimensions"]
+        self.lock = threading.Lock()  # one request in flight per connection
+        self.clients: Dict[int, ShardClient] = {}
+        self.documents: Dict[str, float] = {}  # doc_id -> version held, as last reported by its shard
+
+        if addresses is None:
+            authkey = os.urandom(32)
+            context = multiprocessing.get_context("spawn")  # FAISS and SQLite state do not survive fork
+            starting = []
+            for shard in map(int, self.manifest["built"]):
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(target=serve, daemon=True,
+                                          args=(shard_dir(shards_dir, shard), ("127.0.0.1", 0), authkey, sender))
+                process.start()
+                sender.close()  # so that recv() sees EOF if the server exits before it is ready
+                starting.append((shard, receiver, process))
+            clients = []
+            for shard, receiver, process in starting:
+                try:
+                    clients.append(ShardClient(receiver.recv(), authkey, process))
+                except (EOFError, OSError) as e:
+                    # The server died before it was ready (e.g. a missing or damaged shard)
+                    for client in clients:
+                        client.conn.close()
+                    for _, _, started in starting:
+                        started.terminate()
+                        started.join()
+                    raise RuntimeError(f"Shard server for {shard_dir(shards_dir, shard)} failed to start") from e
+        else:
+            authkey = authkey or os.environ[AUTHKEY_ENV].encode("utf-8")
+            clients = [ShardClient(tuple(address), authkey) for address in addresses]
+        self.authkey = authkey  # lets further coordinators connect to the same servers
+
+        try:
+            for client in clients:
+                client.send("info")
+            for client in clients:
+                info, documents = client.recv()
+                if info["embedding_model"] != self.embedding_model:
+                    raise ValueError(f"Shard server {client.address} holds {info['embedding_model']}, "
+                                     f"the store {self.embedding_model}")
+                if info["shard"] is None or info["shard"][1] != self.manifest["shards"]:
+                    raise ValueError(f"Shard server {client.address} does not serve a shard of this "
+                                     f"{self.manifest['shards']}-shard store (it holds shard {info['shard']})")
+                self.clients[info["shard"][0]] = client
+                self.documents.update(documents or {})
+        except Exception:
+            for client in clients:
+                client.close()
+            raise
+
+    @property
+    def doc_ids(self) -> List[str]:
+        return list(self.documents)
+
+    def covers(self, doc_id: str, index_dir: str = INDEX_DIR) -> bool:
+        """True if a shard holds the current embedding of `doc_id`."""
+        version = self.documents.get(doc_id)
+        path = index_paths(doc_id, index_dir)["manifest"]
+        return version is not None and os.path.exists(path) and os.path.getmtime(path) == version
+
+    def search(self, query_vector: np.ndarray, k: int, doc_ids: Optional[Iterable[str]] = None,
+               nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[Tuple[float, str, Dict]]:
+        """The `k` best (score, doc_id, chunk entry) across the shards, within `doc_ids` if given."""
+        shards = self.manifest["shards"]
+        if doc_ids is None:
+            targets = {shard: None for shard in self.clients}
+        else:
+            targets: Dict[int, Optional[List[str]]] = {}
+            for doc_id in doc_ids:
+                targets.setdefault(shard_of(doc_id, shards), []).append(doc_id)
+        query_vector = np.ascontiguousarray(np.atleast_2d(query_vector), dtype=np.float32)
+
+        with self.lock:
+            # Scatter to every shard first, then gather: the shards search concurrently
+            targets = {shard: docs for shard, docs in targets.items() if shard in self.clients}
+            sent, errors = [], []
+            for shard, docs in targets.items():
+                try:
+                    self.clients[shard].send("search", query_vector, k, docs, nprobe, ef_search)
+                except RuntimeError as e:
+                    errors.append(e)
+                    break
+                sent.append(shard)
+            # Every reply is read before raising, so none is left to answer the next query
+            results = []
+            for shard in sent:
+                try:
+                    hits, documents = self.clients[shard].recv()
+                except RuntimeError as e:
+                    errors.append(e)
+                    continue
+                if documents is not None:
+                    self._update_documents(shard, documents)
+                results.append(hits)
+            if errors:
+                raise errors[0]
+        # Each shard's hits are best first: a k-way heap merge stops after k
+        return list(islice(heapq.merge(*results, key=lambda hit: -hit[0]), k))
+
+    def _update_documents(self, shard: int, documents: Dict[str, float]):
+        shards = self.manifest["shards"]
+        self.documents = {doc_id: version for doc_id, version in self.documents.items()
+                          if shard_of(doc_id, shards) != shard}
+        self.documents.update(documents)
+
+    def close(self):
+        with self.lock:
+            for client in self.clients.values():
+                client.close()
+            self.clients.clear()
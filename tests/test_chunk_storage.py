@@ -0,0 +1,46 @@
+# tests/test_chunk_storage.py
+import copy
+import io
+import json
+
+import pytest
+
+from bench_chunking import make_document
+from bulk_chunking import chunk_to_dict
+from chunk_storage import ContextResolver, compact_chunks, expand_chunks
+from chunking import HierarchicalChunker
+
+
+def full_chunks(strategy, stream=False, id_scheme="positional"):
+    chunker = HierarchicalChunker("d", "T", strategy=strategy, id_scheme=id_scheme)
+    content = make_document(30_000, seed=5)
+    chunks = chunker.chunk_stream(io.StringIO(content)) if stream else chunker.chunk_document(content)
+    # As saved and loaded: tuples become lists
+    return json.loads(json.dumps([chunk_to_dict(c) for c in chunks]))
+
+
+def compact(chunks):
+    return json.loads(json.dumps(list(compact_chunks(copy.deepcopy(chunks)))))
+
+
+@pytest.mark.parametrize("strategy", ["hierarchical", "hierarchical_overlap", "fixed_size"])
+@pytest.mark.parametrize("stream", [False, True])
+@pytest.mark.parametrize("id_scheme", ["positional", "content"])
+def test_compact_records_expand_to_the_full_chunks(strategy, stream, id_scheme):
+    chunks = full_chunks(strategy, stream, id_scheme)
+    assert expand_chunks(compact(chunks)) == chunks
+
+
+def test_version_1_records_still_expand():
+    chunks = full_chunks("hierarchical_overlap")
+    records = compact(chunks)
+    # Restoring in place gives records with every parent ID and metadata value, as version 1 stored them
+    ContextResolver(records, version=2)
+    assert all("parent_id" in r and "metadata" in r for r in records)
+    assert expand_chunks(records, version=1) == chunks
+
+
+def test_overlapping_chunks_shrink_by_an_order_of_magnitude():
+    chunks = full_chunks("hierarchical_overlap")
+    full = len(json.dumps(chunks, indent=2))
+    assert full / len(json.dumps(compact(chunks), separators=(",", ":"))) > 8
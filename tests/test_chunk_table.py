@@ -0,0 +1,49 @@
+# tests/test_chunk_table.py
+import io
+
+import pytest
+
+from bench_chunking import make_document
+from chunk_table import ChunkTable
+from chunking import HierarchicalChunker
+
+
+def dicts(chunks):
+    return [chunk.to_dict() for chunk in chunks]
+
+
+@pytest.mark.parametrize("strategy", ["hierarchical", "hierarchical_overlap"])
+def test_rows_convert_back_to_the_same_chunks(strategy):
+    chunks = HierarchicalChunker("handbook", "Handbook", strategy=strategy).chunk_document(make_document(20_000))
+    table = ChunkTable.from_chunks(chunks)
+
+    assert dicts(table) == dicts(chunks)
+    sentences = table.select(level="sentence", doc_id="handbook", retrievable=True)
+    assert [c.id for c in table.to_chunks(sentences)] == [c.id for c in chunks if c.level == "sentence"]
+
+
+def test_doc_ids_come_from_the_document_chunk():
+    # The streamed document chunk comes last; "my_para_doc" looks like a paragraph ID
+    streamed = HierarchicalChunker("my_para_doc", "T").chunk_stream(io.StringIO(make_document(5_000, seed=1)))
+    other = HierarchicalChunker("my", "T").chunk_document(make_document(5_000, seed=2))
+    table = ChunkTable.from_chunks([*streamed, *other])
+
+    assert table.doc_ids == ["my_para_doc", "my"]
+    assert len(table.select(doc_id="my_para_doc")) + len(table.select(doc_id="my")) == len(table)
+    assert table.to_chunk(table.select(doc_id="my")[0]).id == "my_doc"
+
+
+def test_chunks_without_a_document_chunk_need_a_doc_id():
+    chunks = HierarchicalChunker("notes", "T", strategy="fixed_size").chunk_document(make_document(5_000))
+    with pytest.raises(ValueError, match="pass doc_id"):
+        ChunkTable.from_chunks(chunks)
+    assert len(ChunkTable.from_chunks(chunks, doc_id="notes").select(doc_id="notes")) == len(chunks)
+
+
+def test_overlap_info_is_stored_in_typed_columns():
+    chunks = HierarchicalChunker("d", "T", strategy="hierarchical_overlap").chunk_document(make_document(20_000))
+    overlap = ChunkTable.from_chunks(chunks).metadata["overlap_info"]
+
+    assert overlap.kind == "dict"
+    assert overlap.values["has_overlap"].kind == "bool"
+    assert overlap.values["overlap_source"].values.kind == "category"
@@ -0,0 +1,88 @@
+# tests/test_chunking.py
+import io
+
+import pytest
+
+from bench_chunking import make_document
+from bulk_chunking import chunk_file, load_processed
+from chunk_storage import load_chunks
+from chunking import HierarchicalChunker, SpanChunk, get_chunking_analysis
+
+
+def dicts(chunks):
+    out = [chunk.to_dict() for chunk in chunks]
+    for chunk in out:
+        chunk["metadata"].pop("created_at", None)
+    return out
+
+
+@pytest.mark.parametrize("strategy", ["hierarchical", "hierarchical_overlap"])
+@pytest.mark.parametrize("id_scheme", ["positional", "content"])
+def test_span_chunks_match_copied_chunks(strategy, id_scheme):
+    content = make_document(50_000, seed=1)
+    copied = HierarchicalChunker("d", "T", strategy=strategy, id_scheme=id_scheme).chunk_document(content)
+    spans = HierarchicalChunker("d", "T", strategy=strategy, id_scheme=id_scheme,
+                                use_spans=True).chunk_document(content)
+
+    assert all(isinstance(chunk, SpanChunk) for chunk in spans)
+    assert dicts(spans) == dicts(copied)
+    assert get_chunking_analysis(spans)["chunk_counts_by_level"] == \
+        get_chunking_analysis(copied)["chunk_counts_by_level"]
+
+
+def test_streamed_span_chunks_match_copied_chunks():
+    content = make_document(20_000, seed=2)
+    copied = HierarchicalChunker("d", "T").chunk_stream(io.StringIO(content))
+    spans = HierarchicalChunker("d", "T", use_spans=True).chunk_stream(io.StringIO(content))
+    assert dicts(spans) == dicts(copied)
+
+
+def test_span_chunks_share_their_layout():
+    chunks = HierarchicalChunker("d", "T", use_spans=True).chunk_document(make_document(20_000))
+    sentences = [chunk for chunk in chunks if chunk.level == "sentence"]
+
+    assert not hasattr(sentences[0], "__dict__")
+    assert sentences[0]._keys is sentences[-1]._keys
+    assert sentences[1]._offsets is sentences[-1]._offsets
+    assert len(sentences[1].text) == len(sentences[1].content)
+
+
+def test_incremental_bulk_chunking_uses_spans(tmp_path):
+    source = tmp_path / "doc.md"
+    source.write_text(make_document(5_000), encoding="utf-8")
+    (tmp_path / "out").mkdir()
+    result = chunk_file(str(source), "hierarchical_overlap", out_dir=str(tmp_path / "out"), incremental=True)
+
+    assert result["error"] is None
+    saved = load_processed(str(tmp_path / "out" / "doc.json"))["chunks"]
+    expected = HierarchicalChunker("doc", "doc.md", id_scheme="content").chunk_document(source.read_text())
+    assert [c["content"] for c in saved] == [c.content for c in expected]
+
+
+@pytest.mark.parametrize("storage", ["full", "compact"])
+def test_streamed_files_keep_the_document_text(tmp_path, storage):
+    source = tmp_path / "doc.md"
+    source.write_text(make_document(5_000, seed=3) + "Ünïcode \"quoted\" \\ tab\t\n", encoding="utf-8")
+    (tmp_path / "out").mkdir()
+    result = chunk_file(str(source), "hierarchical", out_dir=str(tmp_path / "out"), storage=storage)
+
+    assert result["error"] is None
+    saved = load_chunks(load_processed(str(tmp_path / "out" / "doc.json")))
+    expected = HierarchicalChunker("doc", "doc.md").chunk_document(source.read_text(encoding="utf-8"))
+    assert saved[-1]["content"] == expected[0].content == source.read_text(encoding="utf-8")
+
+
+def sections(content):
+    return [(c.metadata["title"], c.content) for c in HierarchicalChunker("d", "T").chunk_document(content)
+            if c.level == "section"]
+
+
+def test_headings_may_be_indented_up_to_three_spaces():
+    # As in CommonMark; four spaces make an indented code block, not a heading
+    assert sections("   # A\n\nbody a\n") == [("A", "# A\n\nbody a")]
+    assert sections("    # A\n\nbody a\n") == [("Introduction", "# Introduction\n\n# A\n\nbody a")]
+
+
+def test_consecutive_headings_each_start_a_section():
+    # A has no body of its own; B and its text are not folded into it
+    assert sections("# A\n# B\nbody b\n") == [("A", "# A\n\n"), ("B", "# B\n\nbody b")]
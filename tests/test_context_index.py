@@ -0,0 +1,78 @@
+# tests/test_context_index.py
+import io
+import json
+
+import pytest
+
+from bulk_chunking import save_chunks
+from chunking import HierarchicalChunker
+from context_index import ANCESTOR_LEVELS, AncestorIndexBuilder, ContextIndex
+
+MARKDOWN = """# Guide
+
+Intro paragraph. It has two sentences.
+
+## Install
+
+Run the installer. Then restart.
+
+Second paragraph here.
+
+## Use
+
+Open the app. Pick a file.
+"""
+
+
+def streamed_chunks(strategy="hierarchical"):
+    chunker = HierarchicalChunker("guide", "Guide", strategy=strategy)
+    return list(chunker.chunk_stream(io.StringIO(MARKDOWN)))
+
+
+@pytest.mark.parametrize("strategy", ["hierarchical", "hierarchical_overlap"])
+def test_stream_indexes_the_document_chunk_that_comes_last(strategy):
+    chunks = streamed_chunks(strategy)
+    assert chunks[-1].level == "document"
+    index = ContextIndex.from_chunks(chunks)
+
+    for chunk in chunks[:-1]:
+        assert index.ancestor(chunk.id, "document") == "guide_doc"
+    sentence = next(c for c in chunks if c.level == "sentence")
+    paragraph = index.ancestor(sentence.id, "paragraph")
+    assert paragraph == sentence.parent_id
+    assert index.ancestor(paragraph, "section") == next(c for c in chunks if c.id == paragraph).parent_id
+
+
+def test_stream_matches_chunk_document():
+    chunker = HierarchicalChunker("guide", "Guide", strategy="hierarchical")
+    in_order = ContextIndex.from_chunks(chunker.chunk_document(MARKDOWN))
+    streamed = ContextIndex.from_chunks(streamed_chunks())
+
+    assert sorted(streamed.ids) == sorted(in_order.ids)
+    for chunk_id in in_order.ids:
+        for level in ANCESTOR_LEVELS:
+            assert streamed.ancestor(chunk_id, level) == in_order.ancestor(chunk_id, level)
+
+
+def test_saved_stream_stores_document_rows(tmp_path):
+    source = tmp_path / "guide.md"
+    source.write_text(MARKDOWN, encoding="utf-8")
+    chunker = HierarchicalChunker("guide", "Guide", strategy="hierarchical")
+    with open(source, encoding="utf-8") as f:
+        save_chunks("guide", "guide.md", "hierarchical", chunker.chunk_stream(f), str(tmp_path), source_path=str(source))
+    with open(tmp_path / "guide.json", encoding="utf-8") as f:
+        doc_data = json.load(f)
+
+    document_row = len(doc_data["chunks"]) - 1
+    assert doc_data["ancestor_index"]["document"][:-1] == [document_row] * document_row
+    assert doc_data["chunks"][-1]["content"] == MARKDOWN
+    index = ContextIndex.from_processed(doc_data)
+    sentence = next(r["id"] for r in doc_data["chunks"] if r["level"] == "sentence")
+    assert index.get_chunk_with_context(sentence, "document") == MARKDOWN
+
+
+def test_parents_never_seen_stay_unresolved():
+    builder = AncestorIndexBuilder()
+    builder.add("p", "paragraph", "missing")
+    builder.add("s", "sentence", "p")
+    assert builder.to_dict() == {"document": [-1, -1], "section": [-1, -1], "paragraph": [-1, 0]}
@@ -0,0 +1,101 @@
+# tests/test_corpus_index.py
+import os
+
+import numpy as np
+import pytest
+
+from corpus_index import CorpusIndex, build_corpus, corpus_paths, sync_corpus
+from vector_store import save_index
+
+DIMS = 16
+
+
+def make_documents(index_dir, docs=3, rows=10, seed=0):
+    """Per-document flat indexes of random vectors; returns {doc_id: vectors}."""
+    rng = np.random.default_rng(seed)
+    stored = {}
+    for d in range(docs):
+        vectors = rng.standard_normal((rows, DIMS)).astype(np.float32)
+        chunks = [{"id": f"c{i}", "content": f"chunk {i} of doc{d}", "level": "paragraph"} for i in range(rows)]
+        save_index({"doc_id": f"doc{d}", "doc_name": f"doc{d}.md"}, chunks, vectors, "test", str(index_dir))
+        stored[f"doc{d}"] = vectors
+    return stored
+
+
+def held_chunks(corpus, doc_id):
+    return {chunk_id for chunk_id, in corpus.conn.execute("SELECT chunk_id FROM chunks WHERE doc_id = ?", (doc_id,))}
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    stored = make_documents(tmp_path)
+    build_corpus(str(tmp_path))
+    corpus = CorpusIndex(str(tmp_path / "corpus"), writable=True)
+    yield corpus, stored
+    corpus.close()
+
+
+def test_deleted_chunks_stay_gone_after_compaction(corpus, tmp_path):
+    corpus, stored = corpus
+    assert corpus.delete_chunks("doc0", ["c0", "c1", "c2", "c3"]) == 4
+    corpus.compact()
+
+    assert corpus.tombstone_ratio == 0
+    assert corpus.manifest["rows"] == 26
+    assert held_chunks(corpus, "doc0") == {f"c{i}" for i in range(4, 10)}
+    distances, slots = corpus.search(stored["doc0"][0], 1, ["doc0"])
+    assert corpus.lookup(slots.tolist())[int(slots[0])]["chunk_id"] != "c0"
+    # The sidecars did not change, so a sync leaves the document as compacted
+    assert corpus.sync(str(tmp_path))["documents"] == 0
+    assert held_chunks(corpus, "doc0") == {f"c{i}" for i in range(4, 10)}
+
+
+def test_compaction_keeps_upserted_vectors(corpus):
+    corpus, stored = corpus
+    metadata = [{"chunk_id": f"n{i}", "content": f"new {i}", "level": "paragraph"} for i in range(5)]
+    vectors = np.random.default_rng(1).standard_normal((5, DIMS)).astype(np.float32)
+    corpus.upsert_document("doc1", metadata, vectors, 1.0)
+    corpus.compact()
+
+    assert held_chunks(corpus, "doc1") == {f"n{i}" for i in range(5)}
+    assert corpus.documents["doc1"] == 1.0
+    distances, slots = corpus.search(vectors[3], 1)
+    assert corpus.lookup(slots.tolist())[int(slots[0])]["chunk_id"] == "n3"
+    assert distances[0] == pytest.approx(0, abs=1e-4)
+
+
+def test_sync_compacts_past_the_ratio(tmp_path):
+    make_documents(tmp_path)
+    build_corpus(str(tmp_path))
+    corpus = CorpusIndex(str(tmp_path / "corpus"), writable=True)
+    corpus.delete_chunks("doc2", [f"c{i}" for i in range(8)])
+    corpus.close()
+
+    assert sync_corpus(str(tmp_path))["compacted"] == 1
+    corpus = CorpusIndex(str(tmp_path / "corpus"))
+    assert corpus.manifest["rows"] == 22
+    assert held_chunks(corpus, "doc2") == {"c8", "c9"}
+    corpus.close()
+
+
+def test_background_compaction_errors_reach_wait(corpus, tmp_path):
+    corpus, _ = corpus
+    os.remove(corpus_paths(corpus.corpus_dir)["vectors"])
+    corpus.compact(background=True)
+
+    with pytest.raises(ValueError, match="no vectors.npy"):
+        corpus.wait()
+    corpus.wait()
+
+
+def test_rebuild_replaces_the_corpus_in_one_swap(tmp_path):
+    make_documents(tmp_path)
+    build_corpus(str(tmp_path))
+    for path in tmp_path.glob("doc2_*"):
+        path.unlink()
+    build_corpus(str(tmp_path))
+
+    assert sorted(p.name for p in tmp_path.iterdir() if p.name.startswith("corpus")) == ["corpus"]
+    corpus = CorpusIndex(str(tmp_path / "corpus"))
+    assert corpus.doc_ids == ["doc0", "doc1"]
+    corpus.close()
@@ -0,0 +1,19 @@
+# tests/test_embedding_backends.py
+import asyncio
+import threading
+
+from embedding_backends import HashingEmbedder
+
+
+def test_local_backends_report_progress_per_batch_on_the_loop():
+    calls = []
+
+    async def run():
+        backend = HashingEmbedder(16, batch_size=2)
+        return await backend.embed([f"text {i}" for i in range(7)],
+                                   lambda done, total: calls.append((done, total, threading.current_thread())))
+
+    result = asyncio.run(run())
+    assert result.matrix.shape == (7, 16)
+    assert [(done, total) for done, total, _ in calls] == [(2, 7), (4, 7), (6, 7), (7, 7)]
+    assert {thread for _, _, thread in calls} == {threading.main_thread()}
@@ -0,0 +1,96 @@
+# tests/test_embedding_pipeline.py
+import asyncio
+import io
+import json
+import os
+
+import pytest
+
+import embedding_pipeline
+from ann_index import IndexSpec, index_type
+from bulk_chunking import save_chunks
+from chunking import HierarchicalChunker
+from embedding_backends import HashingEmbedder
+from embedding_cache import EmbeddingCache
+from embedding_pipeline import embed_all
+from vector_store import index_paths, load_index
+
+MARKDOWN = """# Notes
+
+## Storage
+
+Vectors live in FAISS. Metadata lives next to them.
+
+## Search
+
+Queries are embedded once. Hits are ranked by distance.
+"""
+
+
+@pytest.fixture
+def processed(tmp_path):
+    chunker = HierarchicalChunker("notes", "Notes", strategy="hierarchical")
+    save_chunks("notes", "notes.md", "hierarchical", chunker.chunk_stream(io.StringIO(MARKDOWN)), str(tmp_path))
+    return str(tmp_path / "notes.json")
+
+
+def no_build(*args, **kwargs):
+    raise AssertionError("the index should have been filled batch by batch")
+
+
+@pytest.mark.parametrize("spec, built", [(IndexSpec(index_type="auto"), "flat"),
+                                         (IndexSpec(index_type="hnsw"), "hnsw")])
+def test_auto_and_hnsw_indexes_fill_as_batches_arrive(processed, tmp_path, monkeypatch, spec, built):
+    monkeypatch.setattr(embedding_pipeline, "build_ann_index", no_build)
+    index_dir = str(tmp_path / "vector_store")
+    results = asyncio.run(embed_all([processed], HashingEmbedder(64), index_dir=index_dir, batch_size=2, spec=spec))
+
+    assert [r.error for r in results] == [None]
+    paths = index_paths("notes", index_dir)
+    index = load_index(paths["index"])
+    assert index_type(index) == built
+    assert index.ntotal == results[0].chunks
+    with open(paths["report"], encoding="utf-8") as f:
+        assert json.load(f)["index_type"] == built
+
+
+def test_ivf_indexes_are_built_at_write(processed, tmp_path):
+    index_dir = str(tmp_path / "vector_store")
+    spec = IndexSpec(index_type="ivf_flat", nlist=1)
+    results = asyncio.run(embed_all([processed], HashingEmbedder(64), index_dir=index_dir, spec=spec))
+
+    assert [r.error for r in results] == [None]
+    assert index_type(load_index(index_paths("notes", index_dir)["index"])) == "ivf_flat"
+
+
+def test_cache_serves_a_second_run(processed, tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    backend = HashingEmbedder(64)
+    first = asyncio.run(embed_all([processed], backend, cache, index_dir=str(tmp_path / "a"), batch_size=2))
+    assert cache.stats()["hits"] == 0
+    second = asyncio.run(embed_all([processed], backend, cache, index_dir=str(tmp_path / "b"), batch_size=2))
+
+    assert cache.stats()["hits"] == second[0].chunks == first[0].chunks
+    cache.close()
+
+
+def test_vectors_are_not_left_behind(processed, tmp_path):
+    index_dir = tmp_path / "vector_store"
+    asyncio.run(embed_all([processed], HashingEmbedder(64), index_dir=str(index_dir), batch_size=2))
+    written = sorted(os.path.basename(path) for path in index_paths("notes", str(index_dir)).values())
+    assert sorted(os.listdir(index_dir)) == written
+
+
+def test_failed_stage_cancels_the_others(processed, tmp_path):
+    def failing_progress(stats):
+        if stats.stages["embed"].items:
+            raise RuntimeError("display went away")
+
+    async def run():
+        with pytest.raises(RuntimeError, match="display went away"):
+            await embed_all([processed] * 3, HashingEmbedder(64), index_dir=str(tmp_path / "vector_store"),
+                            batch_size=1, queue_size=1, progress=failing_progress)
+        return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    assert asyncio.run(run()) == []
+    assert not [f for f in os.listdir(tmp_path / "vector_store") if f.endswith(".part.npy")]
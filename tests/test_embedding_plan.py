@@ -0,0 +1,31 @@
+# tests/test_embedding_plan.py
+import io
+
+from bulk_chunking import chunk_to_dict
+from chunking import HierarchicalChunker
+from embedding_plan import plan_embedding
+
+
+def test_empty_chunks_are_not_planned():
+    chunks = [
+        {"id": "d", "level": "document", "content": ""},
+        {"id": "p1", "level": "paragraph", "content": "Some text."},
+        {"id": "p2", "level": "paragraph", "content": " \n\t"},
+    ]
+    plan = plan_embedding(chunks, "text-embedding-3-small", ["document", "paragraph"])
+
+    assert plan.rows == [1]
+    assert plan.levels["paragraph"].chunks == 2
+    assert plan.levels["paragraph"].selected == 1
+    assert plan.levels["document"].selected == plan.levels["document"].tokens == 0
+
+
+def test_streamed_document_chunk_is_not_planned():
+    chunker = HierarchicalChunker("guide", "Guide", strategy="hierarchical")
+    chunks = [chunk_to_dict(c) for c in chunker.chunk_stream(io.StringIO("# Guide\n\nOne paragraph here.\n"))]
+    plan = plan_embedding(chunks, "hashing", ["document", "paragraph"])
+
+    assert chunks[-1]["level"] == "document"
+    assert len(chunks) - 1 not in plan.rows
+    assert all(chunks[row]["content"].strip() for row in plan.rows)
+    assert plan.rows
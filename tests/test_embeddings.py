@@ -0,0 +1,94 @@
+# tests/test_embeddings.py
+import asyncio
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from embeddings import (AsyncStubEmbeddingsClient, MAX_INPUTS_PER_REQUEST, RateLimiter, StubAPIError,
+                        StubEmbeddingsClient, TokenBucket, embed_texts, embed_texts_async, plan_batches,
+                        stub_vector)
+
+DIMS = 8
+TEXTS = [f"text number {i} " * (1 + i % 5) for i in range(25)]
+
+
+def expected_matrix(texts):
+    return np.stack([stub_vector(text, DIMS) for text in texts])
+
+
+def test_batches_respect_both_limits():
+    assert plan_batches([5] * 10, max_inputs=3) == [(0, 3), (3, 6), (6, 9), (9, 10)]
+    assert plan_batches([4, 4, 4, 4, 9], max_tokens=10) == [(0, 2), (2, 4), (4, 5)]
+    # An input over the token limit still gets a batch of its own
+    assert plan_batches([3, 20, 3], max_tokens=10) == [(0, 1), (1, 2), (2, 3)]
+    assert plan_batches([]) == []
+
+
+class ShuffledClient:
+    """Answers with the data items in reverse order, as the API is allowed to."""
+
+    def __init__(self):
+        self.stub = StubEmbeddingsClient(DIMS)
+        self.embeddings = self
+
+    def create(self, **kwargs):
+        response = self.stub.create(**kwargs)
+        return SimpleNamespace(data=response.data[::-1])
+
+
+def test_embed_texts_keeps_input_order():
+    client = ShuffledClient()
+    progress = []
+    matrix = embed_texts(client, TEXTS, "test", max_inputs=4, progress=lambda done, total: progress.append(done))
+
+    np.testing.assert_allclose(matrix, expected_matrix(TEXTS), rtol=1e-6)
+    assert client.stub.requests == 7
+    assert progress[-1] == len(TEXTS)
+
+
+def test_stub_rejects_requests_over_the_limits():
+    with pytest.raises(ValueError, match="Too many inputs"):
+        StubEmbeddingsClient(DIMS).create(model="test", input=["x"] * (MAX_INPUTS_PER_REQUEST + 1))
+
+
+def test_async_embedding_retries_rate_limited_batches():
+    client = AsyncStubEmbeddingsClient(DIMS, latency=0.001, requests_per_minute=600, window=0.5)
+    # The limiter allows far more than the stub, so the stub answers 429
+    limiter = RateLimiter(requests_per_minute=60_000, tokens_per_minute=10 ** 9)
+    result = asyncio.run(embed_texts_async(client, TEXTS, "test", concurrency=8, limiter=limiter, max_inputs=2))
+
+    assert client.status_counts[429] > 0
+    assert result.failed == [] and result.embedded.all()
+    assert result.requests == sum(client.status_counts.values())
+    np.testing.assert_allclose(result.matrix, expected_matrix(TEXTS), rtol=1e-6)
+
+
+def test_async_embedding_reports_batches_that_cannot_succeed():
+    class Rejecting:
+        embeddings = None
+
+        async def create(self, **kwargs):
+            raise StubAPIError(400, "Bad request")
+
+    client = Rejecting()
+    client.embeddings = client
+    result = asyncio.run(embed_texts_async(client, TEXTS[:4], "test", max_inputs=2))
+
+    assert result.failed == [(0, 2, "Bad request"), (2, 4, "Bad request")]
+    assert not result.embedded.any()
+    assert result.requests == 2
+
+
+def test_paused_bucket_holds_waiters():
+    async def run():
+        bucket = TokenBucket(60_000)
+        bucket.pause(0.2, slow_down=0.5)
+        start = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - start, bucket.rate
+
+    waited, rate = asyncio.run(run())
+    assert waited >= 0.2
+    assert rate == pytest.approx(500)
@@ -0,0 +1,32 @@
+# tests/test_retrieval.py
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ann_index import IndexSpec, search_params
+from retrieval import SearchEngine
+from vector_store import save_index
+
+DIMS = 16
+
+
+def test_concurrent_searches_keep_their_own_nprobe(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((2000, DIMS)).astype(np.float32)
+    chunks = [{"id": f"c{i}", "content": f"chunk {i}", "level": "paragraph"} for i in range(len(vectors))]
+    save_index({"doc_id": "doc", "doc_name": "doc.md"}, chunks, vectors, "test", str(tmp_path),
+               spec=IndexSpec(index_type="ivf_flat", nlist=16))
+    document = SearchEngine(str(tmp_path)).document("doc")
+    default = search_params(document.index)
+    queries = rng.standard_normal((40, DIMS)).astype(np.float32)
+    requests = [(q, nprobe) for q in range(len(queries)) for nprobe in (1, 16)]
+
+    def search(request):
+        q, nprobe = request
+        return document.search(queries[q:q + 1], 10, nprobe=nprobe)[1].tolist()
+
+    expected = [search(request) for request in requests]
+    with ThreadPoolExecutor(8) as pool:
+        for _ in range(5):
+            assert list(pool.map(search, requests)) == expected
+    assert search_params(document.index) == default
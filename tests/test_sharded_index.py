@@ -0,0 +1,62 @@
+# tests/test_sharded_index.py
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+from corpus_index import build_corpus
+from sharded_index import ShardedIndex, build_shards, serve, shard_dir
+from test_corpus_index import make_documents
+
+
+@pytest.fixture
+def store(tmp_path):
+    vectors = make_documents(tmp_path, docs=4)
+    manifest = build_shards(str(tmp_path), 2)
+    return str(tmp_path / "shards"), manifest, vectors
+
+
+def test_searches_across_shards(store):
+    shards_dir, _, vectors = store
+    index = ShardedIndex(shards_dir)
+    try:
+        assert sorted(index.doc_ids) == [f"doc{d}" for d in range(4)]
+        score, doc_id, entry = index.search(vectors["doc3"][5], 1)[0]
+        assert (doc_id, entry["chunk_id"]) == ("doc3", "c5")
+    finally:
+        index.close()
+
+
+def test_shard_that_fails_to_load_stops_every_server(store):
+    shards_dir, manifest, _ = store
+    broken = shard_dir(shards_dir, int(next(iter(manifest["built"]))))
+    with open(os.path.join(broken, "corpus.json"), "w", encoding="utf-8") as f:
+        f.write("{")
+
+    with pytest.raises(RuntimeError, match=os.path.basename(broken)):
+        ShardedIndex(shards_dir)
+    assert multiprocessing.active_children() == []
+
+
+def test_server_of_an_unsharded_corpus_is_refused(store, tmp_path):
+    shards_dir, _, _ = store
+    build_corpus(str(tmp_path))
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    threading.Thread(target=serve, args=(str(tmp_path / "corpus"), ("127.0.0.1", 0), b"secret", sender),
+                     daemon=True).start()
+
+    with pytest.raises(ValueError, match="does not serve a shard"):
+        ShardedIndex(shards_dir, [receiver.recv()], b"secret")
+
+
+def test_failed_search_leaves_no_reply_behind(store):
+    shards_dir, _, vectors = store
+    index = ShardedIndex(shards_dir)
+    try:
+        with pytest.raises(RuntimeError):
+            index.search(vectors["doc3"][5][:4], 1)
+        score, doc_id, entry = index.search(vectors["doc3"][5], 1)[0]
+        assert (doc_id, entry["chunk_id"]) == ("doc3", "c5")
+    finally:
+        index.close()
@@ -0,0 +1,38 @@
+# tests/test_vector_store.py
+import json
+
+import numpy as np
+
+from bench_chunking import make_document
+from chunk_storage import load_chunks
+from chunking import HierarchicalChunker
+from bulk_chunking import load_processed, save_chunks
+from embedding_plan import plan_embedding
+from vector_store import index_paths, load_metadata, save_index
+
+
+def test_meta_stores_context_once_and_rebuilds_it(tmp_path):
+    chunker = HierarchicalChunker("doc", "Doc", strategy="hierarchical_overlap")
+    save_chunks("doc", "doc.md", "hierarchical_overlap", chunker.chunk_document(make_document(30_000)),
+                str(tmp_path), storage="compact")
+    doc_data = load_processed(str(tmp_path / "doc.json"))
+    chunks = load_chunks(doc_data)
+    embedded = [chunks[i] for i in plan_embedding(chunks, "test").rows]
+    save_index(doc_data, embedded, np.zeros((len(embedded), 4), dtype=np.float32), "test", str(tmp_path))
+
+    meta_path = index_paths("doc", str(tmp_path))["meta"]
+    with open(meta_path, encoding="utf-8") as f:
+        assert "Paragraph context:" not in f.read()
+    entries = load_metadata(meta_path)
+    assert [(e["chunk_id"], e["content"], e["level"], e["metadata"]) for e in entries] == \
+        [(c["id"], c["content"], c["level"], c["metadata"]) for c in embedded]
+    assert {(e["doc_id"], e["doc_name"], e["strategy"], e["embedding_model"]) for e in entries} == \
+        {("doc", "doc.md", "hierarchical_overlap", "test")}
+
+
+def test_meta_written_as_entries_still_loads(tmp_path):
+    entries = [{"doc_id": "doc", "doc_name": "doc.md", "chunk_id": "c0", "strategy": "fixed_size",
+                "embedding_model": "test", "content": "text", "level": "fixed", "metadata": {}}]
+    meta_path = tmp_path / "doc_meta.json"
+    meta_path.write_text(json.dumps(entries), encoding="utf-8")
+    assert load_metadata(str(meta_path)) == entries
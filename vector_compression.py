@@ -0,0 +1,253 @@
+# vector_compression.py
+"""
+Smaller vector indexes: fewer dimensions and/or fewer bits per dimension.
+
+reduce_dimensions keeps the first `dimensions` components of each vector and
+re-normalises them (Matryoshka truncation). For text-embedding-3 models this
+is what the API's `dimensions` parameter does. For other models, check the
+recall estimate before relying on it.
+
+Storage formats, for d dimensions:
+
+    float32  4d bytes    IndexFlatL2, exact
+    float16  2d bytes    IndexScalarQuantizer (QT_fp16)
+    int8     d bytes     IndexScalarQuantizer (QT_8bit), range trained per dimension
+    binary   d/8 bytes   IndexBinaryFlat over the sign bits, Hamming distance
+
+Float formats support L2 distance or inner product (`metric`); binary indexes
+always rank by Hamming distance.
+
+estimate_recall measures what a setting gives up, offline. It uses a sample of
+the stored vectors as queries, with exact full-width float32 search as ground
+truth, and reports recall@k. Real queries are usually less similar to the
+corpus than corpus rows are to each other, so treat the numbers as an upper
+bound.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+STORAGE_FORMATS = ("float32", "float16", "int8", "binary")
+METRICS = {"l2": faiss.METRIC_L2, "ip": faiss.METRIC_INNER_PRODUCT}
+TRAIN_SAMPLE = 100_000  # rows used to train quantizers
+ADD_BLOCK = 65_536      # rows added per call, so memory-mapped input is read a block at a time
+
+
+def reduce_dimensions(vectors: np.ndarray, dimensions: Optional[int]) -> np.ndarray:
+    """First `dimensions` components of each row, L2-normalised again; unchanged if dimensions is None."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if not dimensions or dimensions == vectors.shape[1]:
+        return vectors
+    if dimensions > vectors.shape[1]:
+        raise ValueError(f"Cannot reduce {vectors.shape[1]}-dimensional vectors to {dimensions} dimensions")
+    reduced = np.ascontiguousarray(vectors[:, :dimensions])
+    norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+    np.divide(reduced, norms, out=reduced, where=norms > 0)
+    return reduced
+
+
+def bytes_per_vector(dimensions: int, storage: str) -> float:
+    return {"float32": 4, "float16": 2, "int8": 1, "binary": 1 / 8}[storage] * dimensions
+
+
+def new_index(dimensions: int, storage: str = "float32", metric: str = "l2"):
+    """Empty FAISS index for `storage`; int8 indexes must be trained (see build_index) before adding."""
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}', expected one of {', '.join(METRICS)}")
+    if storage == "float32":
+        return faiss.IndexFlat(dimensions, METRICS[metric])
+    if storage == "float16":
+        return faiss.IndexScalarQuantizer(dimensions, faiss.ScalarQuantizer.QT_fp16, METRICS[metric])
+    if storage == "int8":
+        return faiss.IndexScalarQuantizer(dimensions, faiss.ScalarQuantizer.QT_8bit, METRICS[metric])
+    if storage == "binary":
+        if dimensions % 8:
+            raise ValueError(f"Binary storage needs a multiple of 8 dimensions, not {dimensions}")
+        return faiss.IndexBinaryFlat(dimensions)
+    raise ValueError(f"Unknown storage format '{storage}', expected one of {', '.join(STORAGE_FORMATS)}")
+
+
+def needs_training(storage: str) -> bool:
+    return storage == "int8"
+
+
+def add_vectors(index, vectors: np.ndarray, ids: Optional[np.ndarray] = None):
+    """
+    Add float vectors to any index from new_index (binary indexes get their sign bits),
+    under int64 `ids` if given (the index must then be one from with_ids).
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if isinstance(index, faiss.IndexBinary):
+        vectors = binarize(vectors)
+    if ids is None:
+        index.add(vectors)
+    else:
+        index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype=np.int64))
+
+
+def with_ids(index):
+    """An empty index that accepts add_with_ids: IVF indexes as they are, others in an ID map."""
+    if isinstance(index, faiss.IndexIVF):
+        return index
+    if isinstance(index, faiss.IndexBinary):
+        return faiss.IndexBinaryIDMap(index)
+    return faiss.IndexIDMap2(index)
+
+
+def unwrap(index):
+    """The index inside an ID map (the index itself otherwise)."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2, faiss.IndexBinaryIDMap)):
+        return faiss.downcast_index(index.index) if not isinstance(index, faiss.IndexBinary) \
+            else faiss.downcast_IndexBinary(index.index)
+    return index
+
+
+def build_index(vectors: np.ndarray, storage: str = "float32", metric: str = "l2",
+                dimensions: Optional[int] = None):
+    """
+    Index holding `vectors` (optionally reduced to `dimensions`) in `storage` format, rows
+    in order. `vectors` may be memory-mapped: it is read ADD_BLOCK rows at a time, and
+    quantizers train on an evenly spaced sample of at most TRAIN_SAMPLE rows.
+    """
+    n = len(vectors)
+    index = new_index(dimensions or vectors.shape[1], storage, metric)
+    if needs_training(storage):
+        sample = vectors[::max(1, n // TRAIN_SAMPLE)][:TRAIN_SAMPLE]
+        index.train(np.ascontiguousarray(reduce_dimensions(sample, dimensions)))
+    for start in range(0, n, ADD_BLOCK):
+        add_vectors(index, reduce_dimensions(vectors[start:start + ADD_BLOCK], dimensions))
+    return index
+
+
+def index_storage(index) -> str:
+    """How an index stores its vectors: "float32", "float16", "int8", "binary" or "pq"."""
+    index = unwrap(index)
+    if isinstance(index, faiss.IndexBinary):
+        return "binary"
+    if isinstance(index, faiss.IndexHNSW):
+        return index_storage(faiss.downcast_index(index.storage))
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "pq"
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "float16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
+    return "float32"
+
+
+def index_metric(index) -> str:
+    if isinstance(index, faiss.IndexBinary):
+        return "hamming"
+    return "ip" if index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+
+
+def similarity(distances: np.ndarray, metric: str, dimensions: int) -> np.ndarray:
+    """FAISS distances as similarities (higher is better) that compare across metrics."""
+    if metric == "ip":
+        return distances
+    if metric == "hamming":
+        return 1.0 - 2.0 * distances / dimensions
+    return 1.0 - distances / 2.0  # squared L2 between unit vectors
+
+
+def binarize(vectors: np.ndarray) -> np.ndarray:
+    """Sign bits of each row, packed 8 per byte (the layout IndexBinaryFlat expects)."""
+    return np.packbits(vectors > 0, axis=1)
+
+
+def search(index, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(distances, row ids) of the `k` nearest rows, for float or binary indexes alike."""
+    queries = np.ascontiguousarray(np.atleast_2d(queries), dtype=np.float32)
+    if isinstance(index, faiss.IndexBinary):
+        return index.search(binarize(queries), k)
+    return index.search(queries, k)
+
+
+def index_nbytes(index) -> int:
+    """Size of the index as written to disk."""
+    if isinstance(index, faiss.IndexBinary):
+        return int(faiss.serialize_index_binary(index).nbytes)
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Row ids of each query's `k` nearest rows by exact L2, scanning `vectors` ADD_BLOCK rows at a time."""
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    best_d = np.full((len(queries), 0), np.inf, dtype=np.float32)
+    best_i = np.zeros((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(vectors), ADD_BLOCK):
+        block = faiss.IndexFlatL2(vectors.shape[1])
+        block.add(np.ascontiguousarray(vectors[start:start + ADD_BLOCK], dtype=np.float32))
+        d, i = block.search(queries, min(k, block.ntotal))
+        best_d = np.hstack([best_d, d])
+        best_i = np.hstack([best_i, i + start])
+        order = np.argsort(best_d, axis=1, kind="stable")[:, :k]
+        best_d = np.take_along_axis(best_d, order, axis=1)
+        best_i = np.take_along_axis(best_i, order, axis=1)
+    return best_i
+
+
+def recall_against_exact(index, vectors: np.ndarray, dimensions: Optional[int] = None, k: int = 10,
+                         queries: int = 200, seed: int = 0,
+                         ids: Optional[np.ndarray] = None) -> Tuple[float, np.ndarray]:
+    """
+    (recall@k, sampled query rows) of `index`, built over `vectors` reduced to `dimensions`
+    (under `ids`, if it was built with them), against exact full-width search. `queries`
+    sampled rows of `vectors` are the queries; each query row itself is left out of both
+    result lists.
+    """
+    n = len(vectors)
+    k = min(k, n - 1)
+    sample = np.sort(np.random.default_rng(seed).choice(n, size=min(queries, n), replace=False))
+    if k < 1:
+        return 1.0, sample
+    full = np.asarray(vectors[sample], dtype=np.float32)
+    truth = exact_neighbours(vectors, full, k + 1)
+    _, found = search(index, reduce_dimensions(full, dimensions), k + 1)
+    if ids is not None:
+        truth, query_ids = ids[truth], ids[sample]
+    else:
+        query_ids = sample
+
+    hits = 0
+    for query, true_rows, found_rows in zip(query_ids, truth, found):
+        true_rows = [r for r in true_rows if r != query][:k]
+        found_rows = [r for r in found_rows if r != query and r >= 0][:k]
+        hits += len(set(true_rows) & set(found_rows))
+    return hits / (k * len(sample)), sample
+
+
+def estimate_recall(vectors: np.ndarray, dimensions: Optional[int] = None, storage: str = "float32",
+                    k: int = 10, queries: int = 200, seed: int = 0) -> float:
+    """Recall@k of the (dimensions, storage) setting against exact full-width search (see recall_against_exact)."""
+    index = build_index(vectors, storage, dimensions=dimensions)
+    return recall_against_exact(index, vectors, dimensions, k, queries, seed)[0]
+
+
+def compression_report(vectors: np.ndarray, dimension_options: Iterable[Optional[int]],
+                       storages: Iterable[str] = STORAGE_FORMATS, k: int = 10, queries: int = 200,
+                       rows: Optional[int] = None) -> List[Dict]:
+    """
+    One row per (dimensions, storage) setting: bytes per vector, index size for `rows`
+    vectors (default: len(vectors)) and estimated recall@k. Settings that do not apply
+    (more dimensions than the vectors have, binary with a dimension count not divisible by 8) are skipped.
+    """
+    rows = len(vectors) if rows is None else rows
+    full = vectors.shape[1]
+    report = []
+    for dimensions in dimension_options:
+        dims = dimensions or full
+        if dims > full:
+            continue
+        for storage in storages:
+            if storage == "binary" and dims % 8:
+                continue
+            size = bytes_per_vector(dims, storage) * rows
+            report.append({
+                "dimensions": dims,
+                "storage": storage,
+                "bytes/vector": bytes_per_vector(dims, storage),
+                "index_MB": round(size / 1e6, 2),
+                "vs_float32_full": f"{size / (4 * full * rows):.1%}" if rows else "-",
+                f"recall@{k}": round(estimate_recall(vectors, dims, storage, k, queries), 3),
+            })
+    return report
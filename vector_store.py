@@ -0,0 +1,244 @@
+# vector_store.py
+"""
+FAISS index files for embedded documents.
+
+Each document gets these files in the index directory:
+
+    <doc_id>_index.faiss          vectors, one row per embedded chunk
+    <doc_id>_meta.json            the chunk ID of every row, with the document's chunks in
+                                  compact storage (read back with load_metadata)
+    <doc_id>_vectors.npy          the raw float32 embedding matrix, same rows (memory-mappable)
+    <doc_id>_manifest.json        embedding model, dimensions and index settings
+    <doc_id>_build_report.json    build time, size and recall of the index (ann_index)
+
+Vectors can be stored as float32 (exact), float16, int8 or sign bits (see
+vector_compression), and indexed by exact scan, HNSW, IVF-Flat or IVF-PQ
+(see ann_index; IndexSpec(index_type="auto") picks by size). Binary indexes
+are FAISS binary indexes; load_index reads either kind.
+
+The index is derived data: rebuild_index builds a new one from the vectors
+sidecar (any index type, storage format, metric or shorter width) without
+calling the embedding model again. The manifest is written last, so a document whose
+manifest exists has all its files.
+"""
+import json
+import os
+import shutil
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from chunk_storage import COMPACT_VERSION, ContextResolver, compact_chunks, load_chunks
+from embedding_backends import backend_name, split_backend_name
+from ann_index import IndexSpec, build_ann_index, index_type, search_params
+from vector_compression import index_metric, index_storage
+
+INDEX_DIR = "vector_store"
+
+
+def index_metadata(doc_data: Dict, chunks: Sequence[Dict], embedding_model: str) -> Dict:
+    """
+    The _meta.json contents for the embedded `chunks` of a processed_docs document: the
+    document's chunks in compact storage (see chunk_storage), so contextual content is
+    stored once and rebuilt on load, and the record of each row. Documents without
+    saved chunks (or not holding every embedded one) store `chunks` alone.
+    """
+    context = load_chunks(doc_data) if doc_data.get("chunks") else chunks
+    records = list(compact_chunks(dict(chunk) for chunk in context))
+    record_of = {record["id"]: row for row, record in enumerate(records)}
+    if any(chunk["id"] not in record_of for chunk in chunks):
+        records = list(compact_chunks(dict(chunk) for chunk in chunks))
+        record_of = {record["id"]: row for row, record in enumerate(records)}
+    return {
+        "doc_id": doc_data["doc_id"],
+        "doc_name": doc_data.get("doc_name", ""),
+        "strategy": doc_data.get("strategy", "unknown"),
+        "embedding_model": embedding_model,
+        "compact_version": COMPACT_VERSION,
+        "rows": [record_of[chunk["id"]] for chunk in chunks],
+        "chunks": records,
+    }
+
+
+def load_metadata(meta_path: str) -> List[Dict]:
+    """
+    The metadata entries of a _meta.json file, one per index row: doc and chunk fields,
+    contextual content (rebuilt by chunk_storage.ContextResolver) and chunk metadata.
+    """
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if isinstance(meta, list):
+        # Written before the compact layout: the entries themselves
+        return meta
+    records = meta["chunks"]
+    resolver = ContextResolver(records, meta["compact_version"])
+    entries = []
+    for row in meta["rows"]:
+        chunk = resolver.expand(records[row]["id"])
+        entries.append({
+            "doc_id": meta["doc_id"],
+            "doc_name": meta["doc_name"],
+            "chunk_id": chunk["id"],
+            "strategy": meta["strategy"],
+            "embedding_model": meta["embedding_model"],
+            "content": chunk["content"],
+            "level": chunk["level"],
+            "metadata": chunk["metadata"],
+        })
+    return entries
+
+
+def index_paths(doc_id: str, index_dir: str = INDEX_DIR) -> Dict[str, str]:
+    """Paths of a document's index, meta, vectors and manifest files."""
+    return {
+        "index": os.path.join(index_dir, f"{doc_id}_index.faiss"),
+        "meta": os.path.join(index_dir, f"{doc_id}_meta.json"),
+        "vectors": os.path.join(index_dir, f"{doc_id}_vectors.npy"),
+        "manifest": os.path.join(index_dir, f"{doc_id}_manifest.json"),
+        "report": os.path.join(index_dir, f"{doc_id}_build_report.json"),
+    }
+
+
+def save_index(doc_data: Dict, chunks: Sequence[Dict], vectors: np.ndarray, embedding_model: str,
+               index_dir: str = INDEX_DIR, storage: str = "float32",
+               spec: Optional[IndexSpec] = None) -> Tuple[str, str]:
+    """
+    Build and write the FAISS index and metadata for one document; returns (index_path, meta_path).
+    `storage` is one of vector_compression.STORAGE_FORMATS; `spec` (default: exact scan in
+    that format) chooses an ANN index type instead.
+    """
+    index, report = build_ann_index(vectors, spec or IndexSpec(storage=storage))
+    return write_index(doc_data, chunks, index, vectors, embedding_model, index_dir, report)
+
+
+def write_index(doc_data: Dict, chunks: Sequence[Dict], index, vectors: np.ndarray, embedding_model: str,
+                index_dir: str = INDEX_DIR, report: Optional[Dict] = None) -> Tuple[str, str]:
+    """
+    Write an already built FAISS index (rows in `chunks` order), its metadata, the raw
+    `vectors` it was built from, its build report if given, and the manifest.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    paths = index_paths(doc_data["doc_id"], index_dir)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    _save_npy(paths["vectors"], vectors)
+    _write_faiss(index, paths["index"])
+    with open(paths["meta"], "w", encoding="utf-8") as f:
+        json.dump(index_metadata(doc_data, chunks, embedding_model), f, separators=(",", ":"), ensure_ascii=False)
+    if report is not None:
+        _write_json(paths["report"], report)
+    _write_json(paths["manifest"], {
+        "doc_id": doc_data["doc_id"],
+        "rows": len(vectors),
+        "embedding_model": embedding_model,
+        "vectors": {"file": os.path.basename(paths["vectors"]), "dtype": "float32",
+                    "dimensions": int(vectors.shape[1])},
+        "index": _index_entry(index, paths["index"], embedding_model),
+        "meta": os.path.basename(paths["meta"]),
+    })
+    return paths["index"], paths["meta"]
+
+
+def load_index(index_path: str):
+    """Read an index written by write_index, float or binary."""
+    try:
+        return faiss.read_index(index_path)
+    except RuntimeError:
+        return faiss.read_index_binary(index_path)
+
+
+def load_manifest(manifest_path: str) -> Dict:
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_vectors(manifest_path: str, mmap: bool = True) -> np.ndarray:
+    """The document's raw embedding matrix, memory-mapped read-only by default."""
+    manifest = load_manifest(manifest_path)
+    path = os.path.join(os.path.dirname(manifest_path), manifest["vectors"]["file"])
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+
+def rebuild_index(manifest_path: str, spec: IndexSpec = IndexSpec(), metric: str = "l2",
+                  dimensions: Optional[int] = None, output_dir: Optional[str] = None) -> Tuple[Dict, Dict]:
+    """
+    Build a new index for a document from its vectors sidecar and write it, with a
+    manifest and build report, to `output_dir` (default: in place, replacing the current
+    index). A different output directory also gets a copy of the metadata; its manifest
+    points at the original vectors file. Returns (new manifest, build report).
+    """
+    source_dir = os.path.dirname(manifest_path)
+    output_dir = output_dir or source_dir
+    manifest = load_manifest(manifest_path)
+    vectors = load_vectors(manifest_path)
+    if dimensions == vectors.shape[1]:
+        dimensions = None
+    index, report = build_ann_index(vectors, spec, metric, dimensions)
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = index_paths(manifest["doc_id"], output_dir)
+    _write_faiss(index, paths["index"])
+    _write_json(paths["report"], report)
+    if os.path.abspath(output_dir) != os.path.abspath(source_dir):
+        shutil.copyfile(os.path.join(source_dir, manifest["meta"]), paths["meta"])
+    vectors_path = os.path.join(source_dir, manifest["vectors"]["file"])
+
+    # Truncated vectors need queries embedded at the same width
+    model, _ = split_backend_name(manifest["embedding_model"])
+    query_model = backend_name(model, dimensions) if dimensions else manifest["embedding_model"]
+    manifest = dict(manifest, vectors=dict(manifest["vectors"], file=os.path.relpath(vectors_path, output_dir)),
+                    index=_index_entry(index, paths["index"], query_model), meta=os.path.basename(paths["meta"]))
+    _write_json(paths["manifest"], manifest)
+    return manifest, report
+
+
+def export_vectors(doc_id: str, index_dir: str = INDEX_DIR) -> Optional[str]:
+    """
+    Write the vectors sidecar and manifest for a document indexed before sidecars existed,
+    recovered from its index. Only exact float32 indexes keep the vectors losslessly; for
+    other indexes None is returned, and the document has to be embedded again.
+    """
+    paths = index_paths(doc_id, index_dir)
+    index = load_index(paths["index"])
+    if index_storage(index) != "float32" or not isinstance(index, faiss.IndexFlat):
+        return None
+    metadata = load_metadata(paths["meta"])
+    embedding_model = metadata[0]["embedding_model"] if metadata else ""
+    vectors = index.reconstruct_n(0, index.ntotal)
+    _save_npy(paths["vectors"], vectors)
+    _write_json(paths["manifest"], {
+        "doc_id": doc_id,
+        "rows": int(index.ntotal),
+        "embedding_model": embedding_model,
+        "vectors": {"file": os.path.basename(paths["vectors"]), "dtype": "float32", "dimensions": int(index.d)},
+        "index": _index_entry(index, paths["index"], embedding_model),
+        "meta": os.path.basename(paths["meta"]),
+    })
+    return paths["manifest"]
+
+
+def _index_entry(index, index_path: str, embedding_model: str) -> Dict:
+    return {"file": os.path.basename(index_path), "type": index_type(index), "storage": index_storage(index),
+            "metric": index_metric(index), "dimensions": int(index.d), "search_params": search_params(index),
+            "embedding_model": embedding_model}
+
+
+def _write_faiss(index, path: str):
+    if isinstance(index, faiss.IndexBinary):
+        faiss.write_index_binary(index, path)
+    else:
+        faiss.write_index(index, path)
+
+
+def _save_npy(path: str, array: np.ndarray):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _write_json(path: str, manifest: Dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)